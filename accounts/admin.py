@@ -1,6 +1,65 @@
 from django.contrib import admin
 
-from .models import FriendShip, User
+from core.admin import LargeTableAdmin
 
-admin.site.register(User)
-admin.site.register(FriendShip)
+from .deletion import schedule_user_deletion
+from .models import Block, DailyActivity, DeletionTask, FriendShip, Mute, User, UserStats
+
+
+@admin.register(User)
+class UserAdmin(LargeTableAdmin):
+    list_display = ["id", "username", "email", "is_active", "date_joined"]
+    list_filter = ["is_active", "is_staff"]
+    exact_search_fields = ["pk", "username"]
+    actions = ["schedule_deletion"]
+
+    @admin.action(description="選択したユーザーをバックグラウンドで削除する")
+    def schedule_deletion(self, request, queryset):
+        for user in queryset:
+            schedule_user_deletion(user)
+
+
+@admin.register(DeletionTask)
+class DeletionTaskAdmin(admin.ModelAdmin):
+    list_display = ["id", "target", "object_id", "status", "deleted_count", "updated_at"]
+    list_filter = ["target", "status"]
+
+
+@admin.register(FriendShip)
+class FriendShipAdmin(LargeTableAdmin):
+    list_display = ["id", "follower", "following"]
+    list_select_related = ["follower", "following"]
+    raw_id_fields = ["follower", "following"]
+    exact_search_fields = ["follower__username", "following__username"]
+
+
+@admin.register(Mute)
+class MuteAdmin(LargeTableAdmin):
+    list_display = ["id", "muter", "muted"]
+    list_select_related = ["muter", "muted"]
+    raw_id_fields = ["muter", "muted"]
+    exact_search_fields = ["muter__username", "muted__username"]
+
+
+@admin.register(Block)
+class BlockAdmin(LargeTableAdmin):
+    list_display = ["id", "blocker", "blocked"]
+    list_select_related = ["blocker", "blocked"]
+    raw_id_fields = ["blocker", "blocked"]
+    exact_search_fields = ["blocker__username", "blocked__username"]
+
+
+@admin.register(UserStats)
+class UserStatsAdmin(LargeTableAdmin):
+    list_display = ["user", "tweet_count", "likes_received"]
+    list_select_related = ["user"]
+    raw_id_fields = ["user"]
+    exact_search_fields = ["user__username"]
+
+
+@admin.register(DailyActivity)
+class DailyActivityAdmin(LargeTableAdmin):
+    list_display = ["id", "user", "day", "tweet_count"]
+    list_select_related = ["user"]
+    raw_id_fields = ["user"]
+    exact_search_fields = ["user__username"]
@@ -0,0 +1,163 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.urls import reverse
+from django.utils import timezone
+
+from core import public
+from jobs.queue import enqueue
+from notifications.models import Inbox, Notification
+from tweets import counters, thread
+from tweets.models import ArchivedLike, ArchivedTweet, Like, Tweet
+
+from . import stats
+from .models import Block, DailyActivity, DeletionTask, FriendShip, Mute, User, UserStats
+
+BATCH_SIZE = 500
+
+
+def schedule_user_deletion(user):
+    with transaction.atomic():
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        # 削除するユーザーのツイートや返信がどの公開ページに載っているかは調べきれないので，全部捨てる。
+        public.invalidate_all()
+        task = DeletionTask.objects.create(target=DeletionTask.Target.USER, object_id=user.pk)
+        enqueue("accounts.process_deletion", task_id=task.pk)
+    return task
+
+
+def schedule_tweet_deletion(tweet):
+    # tweet はホット側の Tweet でもアーカイブ済みの ArchivedTweet でもよい。
+    model = type(tweet)
+    with transaction.atomic():
+        like_count, created_at, path = model.objects.values_list("like_count", "created_at", "path").get(pk=tweet.pk)
+        if model.objects.filter(pk=tweet.pk, is_deleted=False).update(is_deleted=True):
+            stats.record_tweet(tweet.user_id, created_at, -1, -like_count)
+            if path:
+                thread.bump_reply_count(thread.parent_id(path), -1)
+        tweet_ids = [tweet.pk, *thread.ancestor_ids(path)]
+        paths = [reverse("tweets:detail", kwargs={"pk": tweet_id}) for tweet_id in tweet_ids]
+        public.invalidate([*paths, reverse("accounts:user_profile", kwargs={"username": tweet.user.username})])
+        User.objects.touch([tweet.user_id])
+        task = DeletionTask.objects.create(target=DeletionTask.Target.TWEET, object_id=tweet.pk)
+        enqueue("accounts.process_deletion", task_id=task.pk)
+    return task
+
+
+def _deletion_steps(task):
+    if task.target == DeletionTask.Target.USER:
+        return [
+            Like.objects.filter(user_id=task.object_id),
+            Like.objects.filter(tweet__user_id=task.object_id),
+            FriendShip.objects.filter(follower_id=task.object_id),
+            FriendShip.objects.filter(following_id=task.object_id),
+            Mute.objects.filter(muter_id=task.object_id),
+            Mute.objects.filter(muted_id=task.object_id),
+            Block.objects.filter(blocker_id=task.object_id),
+            Block.objects.filter(blocked_id=task.object_id),
+            Tweet.objects.filter(user_id=task.object_id),
+            ArchivedLike.objects.filter(user_id=task.object_id),
+            ArchivedLike.objects.filter(tweet__user_id=task.object_id),
+            ArchivedTweet.objects.filter(user_id=task.object_id),
+            DailyActivity.objects.filter(user_id=task.object_id),
+            UserStats.objects.filter(user_id=task.object_id),
+            Notification.objects.filter(recipient_id=task.object_id),
+            Inbox.objects.filter(user_id=task.object_id),
+            User.objects.filter(pk=task.object_id),
+        ]
+    # アーカイブ側の id はホット側と重ならないので，どちらにあっても同じタスクで消せる。
+    return [
+        Like.objects.filter(tweet_id=task.object_id),
+        Tweet.objects.filter(pk=task.object_id),
+        ArchivedLike.objects.filter(tweet_id=task.object_id),
+        ArchivedTweet.objects.filter(pk=task.object_id),
+    ]
+
+
+def _delete_in_batches(task, queryset, batch_size):
+    # 関連行を先に空にしておくことで，Collector が一度に読み込む行数をバッチサイズに抑える。
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.values_list("pk", flat=True)[:batch_size])
+            if not ids:
+                return
+            count = _delete_batch(queryset.model, ids)
+            # updated_at はリースを延ばす役も兼ねる。
+            DeletionTask.objects.filter(pk=task.pk).update(
+                deleted_count=F("deleted_count") + count, updated_at=timezone.now()
+            )
+
+
+def _delete_batch(model, ids):
+    # いいね数・フォロー数が変わる相手側のユーザーも，条件付き GET のために activity_at を更新する。
+    if model in (Like, ArchivedLike):
+        tweet_ids = Counter(model.objects.filter(pk__in=ids).values_list("tweet_id", flat=True))
+    elif model is FriendShip:
+        user_ids = set()
+        for pair in FriendShip.objects.filter(pk__in=ids).values_list("follower_id", "following_id"):
+            user_ids.update(pair)
+    elif model in (Tweet, ArchivedTweet):
+        # 削除予約で数え済みのものを除き，返信先の返信数を減らす。
+        replies = model._base_manager.filter(pk__in=ids, path__isnull=False, is_deleted=False)
+        parent_ids = Counter(thread.parent_id(path) for path in replies.values_list("path", flat=True))
+
+    count, _ = model._base_manager.filter(pk__in=ids).delete()
+
+    if model in (Like, ArchivedLike):
+        # 集計し直すとサーバーのバッファ中の増減と二重に数えるので，消した件数を差分で引く。
+        tweet_model = model._meta.get_field("tweet").related_model
+        counters.apply_deltas(tweet_model, {tweet_id: -likes for tweet_id, likes in tweet_ids.items()})
+        tweets = tweet_model.objects.filter(pk__in=tweet_ids)
+        User.objects.touch(tweets.values("user_id"))
+        # 削除中のユーザー自身の集計は作り直さない。
+        stats.repair(tweets.filter(user__is_active=True).values_list("user_id", flat=True).distinct())
+    elif model is FriendShip:
+        User.objects.touch(user_ids)
+    elif model in (Tweet, ArchivedTweet):
+        for tweet_id, replies in parent_ids.items():
+            thread.bump_reply_count(tweet_id, -replies)
+    return count
+
+
+def run_task(task, batch_size=BATCH_SIZE):
+    for queryset in _deletion_steps(task):
+        _delete_in_batches(task, queryset, batch_size)
+    DeletionTask.objects.filter(pk=task.pk).update(status=DeletionTask.Status.DONE, updated_at=timezone.now())
+
+
+def _stale_running():
+    # 実行中のまま DELETION_TASK_LEASE 秒バッチが進んでいないタスクは，落ちたワーカーのものとみなして取り直す。
+    limit = timezone.now() - timedelta(seconds=settings.DELETION_TASK_LEASE)
+    return Q(status=DeletionTask.Status.RUNNING, updated_at__lt=limit)
+
+
+def process_task(task, batch_size=BATCH_SIZE):
+    # 削除は冪等なので，失敗したタスクや途中で止まったタスクはそのまま再実行できる。
+    claimable = Q(status__in=[DeletionTask.Status.PENDING, DeletionTask.Status.FAILED]) | _stale_running()
+    claimed = DeletionTask.objects.filter(claimable, pk=task.pk).update(
+        status=DeletionTask.Status.RUNNING, updated_at=timezone.now()
+    )
+    if not claimed:
+        return False
+    try:
+        run_task(task, batch_size)
+    except Exception:
+        DeletionTask.objects.filter(pk=task.pk).update(status=DeletionTask.Status.FAILED, updated_at=timezone.now())
+        raise
+    return True
+
+
+def release_task(task_id):
+    # ジョブが落ちたワーカーから戻されたとき，そのワーカーが実行中にしたタスクも待機中に戻す。
+    # 実行中のままだと，やり直したジョブの process_task() が何もせずに終わってしまう。
+    DeletionTask.objects.filter(pk=task_id, status=DeletionTask.Status.RUNNING).update(
+        status=DeletionTask.Status.PENDING, updated_at=timezone.now()
+    )
+
+
+def process_pending(batch_size=BATCH_SIZE):
+    tasks = DeletionTask.objects.filter(Q(status=DeletionTask.Status.PENDING) | _stale_running()).order_by("id")
+    return [task for task in tasks if process_task(task, batch_size)]
@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+
+from core import public
+
+from .models import Block, FriendShip, Mute, User
+
+
+class Exclusions:
+    # muted は自分がミュートした人，blocked は自分がブロックした人とブロックされた人。
+    __slots__ = ("muted", "blocked", "hidden")
+
+    def __init__(self, muted=frozenset(), blocked=frozenset()):
+        self.muted = muted
+        self.blocked = blocked
+        self.hidden = muted | blocked
+
+
+def _load(user_id):
+    muted = Mute.objects.filter(muter_id=user_id).values_list("muted_id", flat=True)
+    blocked = Block.objects.filter(blocker_id=user_id).values_list("blocked_id", flat=True)
+    blocked_by = Block.objects.filter(blocked_id=user_id).values_list("blocker_id", flat=True)
+    return frozenset(muted), frozenset(blocked.union(blocked_by, all=True))
+
+
+def get(user):
+    if not user.is_authenticated:
+        return Exclusions()
+    # 版は DB の User.exclusions_version なので，どのワーカーもリクエストごとに読み込む request.user から最新の版が分かる。
+    # キャッシュがプロセスごとでも，変更を処理しなかったワーカーが古い集合を返すことはない。古い版の集合は期限で消える。
+    key = f"exclusions:{user.pk}:{user.exclusions_version}"
+    sets = cache.get(key)
+    if sets is None:
+        sets = _load(user.pk)
+        cache.set(key, sets, settings.EXCLUSION_CACHE_TIMEOUT)
+    return Exclusions(*sets)
+
+
+def _changed(user_ids):
+    User.objects.filter(pk__in=user_ids).update(
+        activity_at=timezone.now(), exclusions_version=F("exclusions_version") + 1
+    )
+
+
+def mute(user, target):
+    with transaction.atomic():
+        if Mute.objects.get_or_create(muter=user, muted=target)[1]:
+            _changed([user.pk])
+
+
+def unmute(user, target):
+    with transaction.atomic():
+        if Mute.objects.filter(muter=user, muted=target).delete()[0]:
+            _changed([user.pk])
+
+
+def block(user, target):
+    with transaction.atomic():
+        if Block.objects.get_or_create(blocker=user, blocked=target)[1]:
+            unfollowed = FriendShip.objects.filter(follower=user, following=target).delete()[0]
+            unfollowed += FriendShip.objects.filter(follower=target, following=user).delete()[0]
+            _changed([user.pk, target.pk])
+            if unfollowed:
+                # 公開プロフィールのフォロー数が変わる。
+                public.invalidate(
+                    [reverse("accounts:user_profile", kwargs={"username": who.username}) for who in (user, target)]
+                )
+
+
+def unblock(user, target):
+    with transaction.atomic():
+        if Block.objects.filter(blocker=user, blocked=target).delete()[0]:
+            _changed([user.pk, target.pk])
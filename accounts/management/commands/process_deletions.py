@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.deletion import BATCH_SIZE, process_pending
+
+
+class Command(BaseCommand):
+    help = "削除予約されたユーザー・ツイートを少量ずつ削除します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--loop", action="store_true", help="終了せずに待機し続ける")
+        parser.add_argument("--interval", type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        while True:
+            for task in process_pending(options["batch_size"]):
+                task.refresh_from_db()
+                self.stdout.write(f"{task}: {task.deleted_count} 行削除しました")
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.stats import BATCH_SIZE, repair_all
+
+
+class Command(BaseCommand):
+    help = "ユーザーごとのツイート数・いいねされた数・日別の投稿数を集計し直します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size は 1 以上を指定してください。")
+        repaired = 0
+        for user_ids in repair_all(options["batch_size"]):
+            repaired += len(user_ids)
+            if options["verbosity"] >= 2:
+                self.stdout.write(f"{repaired} 人分を集計しました")
+        self.stdout.write(self.style.SUCCESS(f"{repaired} 人分の統計を作り直しました"))
@@ -0,0 +1,32 @@
+# Generated by Django 4.1.13 on 2026-10-19 05:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0002_friendship_friendship_unique_friendship"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeletionTask",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("target", models.CharField(choices=[("user", "ユーザー"), ("tweet", "ツイート")], max_length=5)),
+                ("object_id", models.BigIntegerField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("pending", "待機中"), ("running", "実行中"), ("done", "完了"), ("failed", "失敗")],
+                        default="pending",
+                        max_length=7,
+                    ),
+                ),
+                ("deleted_count", models.PositiveBigIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
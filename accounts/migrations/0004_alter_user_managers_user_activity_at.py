@@ -0,0 +1,26 @@
+# Generated by Django 4.1.13 on 2026-10-19 05:33
+
+import accounts.models
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0003_deletiontask"),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name="user",
+            managers=[
+                ("objects", accounts.models.UserManager()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="activity_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 4.1.13 on 2026-10-19 05:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_stats(apps, schema_editor):
+    UserStats = apps.get_model("accounts", "UserStats")
+    DailyActivity = apps.get_model("accounts", "DailyActivity")
+    Tweet = apps.get_model("tweets", "Tweet")
+    ArchivedTweet = apps.get_model("tweets", "ArchivedTweet")
+    totals, days = {}, {}
+    for queryset in (Tweet.objects.filter(is_deleted=False), ArchivedTweet.objects.all()):
+        queryset = queryset.order_by()
+        rows = queryset.values("user_id").annotate(count=Count("*"), likes=Sum("like_count"))
+        for user_id, count, likes in rows.values_list("user_id", "count", "likes"):
+            tweet_count, likes_received = totals.get(user_id, (0, 0))
+            totals[user_id] = (tweet_count + count, likes_received + likes)
+        rows = queryset.annotate(day=TruncDate("created_at")).values("user_id", "day").annotate(count=Count("*"))
+        for user_id, day, count in rows.values_list("user_id", "day", "count"):
+            days[user_id, day] = days.get((user_id, day), 0) + count
+    UserStats.objects.bulk_create(
+        UserStats(user_id=user_id, tweet_count=tweet_count, likes_received=likes_received)
+        for user_id, (tweet_count, likes_received) in totals.items()
+    )
+    DailyActivity.objects.bulk_create(
+        DailyActivity(user_id=user_id, day=day, tweet_count=count) for (user_id, day), count in days.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0004_alter_user_managers_user_activity_at"),
+        ("tweets", "0010_like_tweet_id_user"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserStats",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("tweet_count", models.PositiveIntegerField(default=0)),
+                ("likes_received", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="DailyActivity",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("day", models.DateField()),
+                ("tweet_count", models.PositiveIntegerField(default=0)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_activity",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="dailyactivity",
+            constraint=models.UniqueConstraint(fields=("user", "day"), name="daily_activity_unique"),
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
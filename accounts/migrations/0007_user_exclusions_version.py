@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-19 06:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0006_mute_block"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="exclusions_version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,10 +1,29 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import UserManager as BaseUserManager
 from django.db import models
+from django.utils import timezone
+
+
+class UserManager(BaseUserManager):
+    def touch(self, user_ids):
+        return self.filter(pk__in=user_ids).update(activity_at=timezone.now())
 
 
 class User(AbstractUser):
     email = models.EmailField()
+    # ツイート・いいね・フォローの変更で更新する。条件付き GET の Last-Modified / ETag に使う。
+    activity_at = models.DateTimeField(default=timezone.now)
+    # ミュート・ブロックの変更で 1 つ進める。accounts.exclusions のキャッシュの版。
+    exclusions_version = models.PositiveIntegerField(default=0)
+
+    objects = UserManager()
+
+
+class FriendShipQuerySet(models.QuerySet):
+    def following_ids(self, follower, user_ids):
+        # 一覧に並ぶユーザーのうち follower がフォローしている人を 1 クエリでまとめて調べる。
+        return set(self.filter(follower=follower, following_id__in=user_ids).values_list("following_id", flat=True))
 
 
 class FriendShip(models.Model):
@@ -15,7 +34,74 @@ class FriendShip(models.Model):
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="friendships_by_follower"
     )
 
+    objects = FriendShipQuerySet.as_manager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=["following", "follower"], name="follow_unique"),
         ]
+
+
+class Mute(models.Model):
+    # ミュートした相手のツイートは，ホームのタイムラインといいねしたユーザーの一覧から外す。
+    muter = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="mutes")
+    muted = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="muted_by")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["muter", "muted"], name="mute_unique"),
+        ]
+
+
+class Block(models.Model):
+    # ブロックは双方向に効く。互いのツイートを表示せず，フォローといいねもできなくする。
+    blocker = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="blocks")
+    blocked = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="blocked_by")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["blocker", "blocked"], name="block_unique"),
+        ]
+
+
+class UserStats(models.Model):
+    # accounts.stats がツイートの変更と同じトランザクションで，受けたいいね数は tweets.counters のバッファの反映時に更新する。
+    # ずれたら repair_user_stats で直す。
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    tweet_count = models.PositiveIntegerField(default=0)
+    likes_received = models.PositiveIntegerField(default=0)
+
+
+class DailyActivity(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="daily_activity")
+    day = models.DateField()
+    tweet_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "day"], name="daily_activity_unique"),
+        ]
+
+
+class DeletionTask(models.Model):
+    class Target(models.TextChoices):
+        USER = "user", "ユーザー"
+        TWEET = "tweet", "ツイート"
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "待機中"
+        RUNNING = "running", "実行中"
+        DONE = "done", "完了"
+        FAILED = "failed", "失敗"
+
+    target = models.CharField(max_length=5, choices=Target.choices)
+    object_id = models.BigIntegerField()
+    status = models.CharField(max_length=7, choices=Status.choices, default=Status.PENDING)
+    deleted_count = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.get_target_display()} {self.object_id} ({self.get_status_display()})"
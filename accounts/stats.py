@@ -0,0 +1,83 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+
+from tweets.models import ArchivedTweet, Tweet
+
+from .models import DailyActivity, User, UserStats
+
+BATCH_SIZE = 500
+
+HISTOGRAM_DAYS = 30
+
+
+def _bump(model, lookup, **deltas):
+    # 行がなければ作ってから加算する。減算は 0 で止める。
+    values = {field: Greatest(F(field) + delta, 0) for field, delta in deltas.items()}
+    if not model.objects.filter(**lookup).update(**values):
+        model.objects.get_or_create(**lookup)
+        model.objects.filter(**lookup).update(**values)
+
+
+def record_tweet(user_id, created_at, count=1, likes=0):
+    # 投稿は count=1，削除は count=-1 と，そのツイートが受けていたいいね数を likes=-n で渡す。
+    _bump(UserStats, {"user_id": user_id}, tweet_count=count, likes_received=likes)
+    _bump(DailyActivity, {"user_id": user_id, "day": timezone.localdate(created_at)}, tweet_count=count)
+
+
+def record_like(author_id, count=1):
+    _bump(UserStats, {"user_id": author_id}, likes_received=count)
+
+
+def get_stats(user):
+    return UserStats.objects.filter(user=user).first() or UserStats(user=user)
+
+
+def daily_histogram(user, days=HISTOGRAM_DAYS):
+    today = timezone.localdate()
+    start = today - timedelta(days=days - 1)
+    counts = dict(DailyActivity.objects.filter(user=user, day__gte=start).values_list("day", "tweet_count"))
+    return [(day, counts.get(day, 0)) for day in (start + timedelta(days=i) for i in range(days))]
+
+
+def repair(user_ids):
+    # 指定ユーザーの集計をまとめて作り直す。クエリはユーザー数によらず GROUP BY の数本で済む。
+    user_ids = list(user_ids)
+    tweets, likes, days = Counter(), Counter(), Counter()
+    for queryset in (Tweet.objects.filter(is_deleted=False), ArchivedTweet.objects.filter(is_deleted=False)):
+        queryset = queryset.filter(user_id__in=user_ids).order_by()
+        totals = queryset.values("user_id").annotate(count=Count("*"), likes=Sum("like_count"))
+        for user_id, count, like_count in totals.values_list("user_id", "count", "likes"):
+            tweets[user_id] += count
+            likes[user_id] += like_count
+        buckets = queryset.annotate(day=TruncDate("created_at")).values("user_id", "day").annotate(count=Count("*"))
+        for user_id, day, count in buckets.values_list("user_id", "day", "count"):
+            days[user_id, day] += count
+
+    with transaction.atomic():
+        UserStats.objects.bulk_create(
+            [UserStats(user_id=pk, tweet_count=tweets[pk], likes_received=likes[pk]) for pk in user_ids],
+            update_conflicts=True,
+            unique_fields=["user"],
+            update_fields=["tweet_count", "likes_received"],
+        )
+        DailyActivity.objects.filter(user_id__in=user_ids).delete()
+        DailyActivity.objects.bulk_create(
+            DailyActivity(user_id=user_id, day=day, tweet_count=count) for (user_id, day), count in days.items()
+        )
+    return len(user_ids)
+
+
+def repair_all(batch_size=BATCH_SIZE):
+    last_id = 0
+    while True:
+        user_ids = list(User.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:batch_size])
+        if not user_ids:
+            return
+        repair(user_ids)
+        yield user_ids
+        last_id = user_ids[-1]
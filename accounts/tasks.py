@@ -0,0 +1,11 @@
+from jobs.queue import register
+
+from .deletion import process_task, release_task
+from .models import DeletionTask
+
+
+@register("accounts.process_deletion", on_release=release_task)
+def process_deletion(task_id):
+    task = DeletionTask.objects.filter(pk=task_id).first()
+    if task is not None:
+        process_task(task)
@@ -1,11 +1,21 @@
+import io
+from datetime import timedelta
+from unittest import mock
+
 from django.conf import settings
 from django.contrib.auth import SESSION_KEY, get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.test import Client, TestCase
 from django.urls import reverse
+from django.utils import timezone
 
-from tweets.models import Tweet
+from tweets.models import Like, Tweet
 
-from .models import FriendShip
+from . import exclusions
+from .deletion import process_pending, schedule_user_deletion
+from .models import Block, DailyActivity, DeletionTask, FriendShip, Mute, UserStats
 
 User = get_user_model()
 
@@ -288,12 +298,47 @@ class TestUserProfileView(TestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "accounts/profile.html")
-        self.assertQuerysetEqual(context["tweet_list"], Tweet.objects.filter(user=self.target_user), ordered=False)
+        self.assertQuerysetEqual(
+            context["tweet_list"],
+            Tweet.objects.filter(user=self.target_user).values_list("pk", flat=True),
+            transform=lambda tweet: tweet.id,
+            ordered=False,
+        )
         ct_follower = FriendShip.objects.filter(following__exact=self.target_user).count()
         self.assertEqual(context["followers_num"], ct_follower)
         ct_following = FriendShip.objects.filter(follower__exact=self.target_user).count()
         self.assertEqual(context["following_num"], ct_following)
 
+    def test_success_get_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.post(reverse("accounts:follow", kwargs={"username": self.target_user.username}))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["is_following"])
+
+    def test_success_get_after_relogin_is_not_served_from_cache(self):
+        # ログインで CSRF の秘密が変わるので，前のページのフォームは使えない。304 ではなく新しいページを返す。
+        client = Client(enforce_csrf_checks=True)
+        login_url = reverse("accounts:login")
+
+        def login():
+            token = client.get(login_url).context["csrf_token"]
+            client.post(login_url, {"username": "testuser", "password": "testpassword", "csrfmiddlewaretoken": token})
+
+        login()
+        etag = client.get(self.url)["ETag"]
+        client.post(reverse("accounts:logout"), {"csrfmiddlewaretoken": client.get(self.url).context["csrf_token"]})
+        login()
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        follow_url = reverse("accounts:follow", kwargs={"username": self.target_user.username})
+        response = client.post(follow_url, {"csrfmiddlewaretoken": response.context["csrf_token"]})
+        self.assertNotEqual(response.status_code, 403)
+        self.assertTrue(FriendShip.objects.filter(follower=self.login_user, following=self.target_user).exists())
+
 
 # class TestUserProfileEditView(TestCase):
 #     def test_success_get(self):
@@ -379,6 +424,7 @@ class TestFollowingListView(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "accounts/following_list.html")
         self.assertEqual(response.context["following_friendships"].count(), 1)
+        self.assertEqual(response.context["following_ids"], set())
 
 
 class TestFollowerListView(TestCase):
@@ -394,3 +440,201 @@ class TestFollowerListView(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "accounts/follower_list.html")
         self.assertEqual(response.context["follower_friendships"].count(), 1)
+
+
+class TestUserDeletion(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="testuser1", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        self.client.force_login(self.user1)
+        tweets = [Tweet.objects.create(user=self.user2, content=f"tweet{i}") for i in range(3)]
+        own_tweet = Tweet.objects.create(user=self.user1, content="own tweet")
+        Like.objects.create(tweet=tweets[0], user=self.user1)
+        Like.objects.create(tweet=own_tweet, user=self.user2)
+        FriendShip.objects.create(follower=self.user1, following=self.user2)
+        FriendShip.objects.create(follower=self.user2, following=self.user1)
+
+    def test_success_schedule_hides_user(self):
+        schedule_user_deletion(self.user2)
+        response = self.client.get(reverse("accounts:user_profile", kwargs={"username": "testuser2"}))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Tweet.objects.visible().count(), 1)
+        self.assertEqual(User.objects.filter(username="testuser2").count(), 1)
+
+    def test_success_process_deletes_in_batches(self):
+        task = schedule_user_deletion(self.user2)
+        call_command("process_deletions", batch_size=2, stdout=io.StringIO())
+        task.refresh_from_db()
+
+        self.assertEqual(task.status, DeletionTask.Status.DONE)
+        self.assertEqual(task.deleted_count, 8)
+        self.assertFalse(User.objects.filter(username="testuser2").exists())
+        self.assertFalse(FriendShip.objects.exists())
+        self.assertFalse(Like.objects.exists())
+        self.assertQuerysetEqual(Tweet.objects.values_list("content", flat=True), ["own tweet"])
+
+    def test_success_resume_task_left_running_by_crashed_worker(self):
+        task = schedule_user_deletion(self.user2)
+        # 実行中のまま落ちたワーカーのタスク。リースが残っている間は他のワーカーに取られない。
+        DeletionTask.objects.filter(pk=task.pk).update(status=DeletionTask.Status.RUNNING, updated_at=timezone.now())
+        self.assertEqual(process_pending(), [])
+
+        stale = timezone.now() - timedelta(seconds=settings.DELETION_TASK_LEASE + 1)
+        DeletionTask.objects.filter(pk=task.pk).update(updated_at=stale)
+        self.assertEqual([resumed.pk for resumed in process_pending()], [task.pk])
+        task.refresh_from_db()
+        self.assertEqual(task.status, DeletionTask.Status.DONE)
+        self.assertFalse(User.objects.filter(username="testuser2").exists())
+
+
+class TestUserStats(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="testuser1", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        self.client.force_login(self.user1)
+        self.client.post(reverse("tweets:create"), {"content": "tweet1"})
+        self.client.post(reverse("tweets:create"), {"content": "tweet2"})
+        self.tweet = Tweet.objects.get(content="tweet1")
+
+    def stats(self):
+        return UserStats.objects.values_list("tweet_count", "likes_received").get(user=self.user1)
+
+    def test_success_update_on_tweet_and_like(self):
+        self.assertEqual(self.stats(), (2, 0))
+        self.assertEqual(DailyActivity.objects.get(user=self.user1).tweet_count, 2)
+
+        self.client.force_login(self.user2)
+        self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+        self.assertEqual(self.stats(), (2, 1))
+        self.client.post(reverse("tweets:unlike", kwargs={"pk": self.tweet.pk}))
+        self.assertEqual(self.stats(), (2, 0))
+
+    def test_success_update_on_tweet_deletion(self):
+        Like.objects.create(tweet=self.tweet, user=self.user2)
+        Tweet.objects.filter(pk=self.tweet.pk).refresh_like_counts()
+        call_command("repair_user_stats", stdout=io.StringIO())
+        self.assertEqual(self.stats(), (2, 1))
+
+        self.client.post(reverse("tweets:delete", kwargs={"pk": self.tweet.pk}))
+        self.assertEqual(self.stats(), (1, 0))
+        self.assertEqual(DailyActivity.objects.get(user=self.user1).tweet_count, 1)
+
+    def test_success_repair_command(self):
+        UserStats.objects.update(tweet_count=100)
+        DailyActivity.objects.all().delete()
+        out = io.StringIO()
+        call_command("repair_user_stats", batch_size=1, stdout=out)
+        self.assertIn("2 人分", out.getvalue())
+        self.assertEqual(self.stats(), (2, 0))
+        self.assertEqual(DailyActivity.objects.get(user=self.user1).tweet_count, 2)
+        self.assertEqual(UserStats.objects.get(user=self.user2).tweet_count, 0)
+
+    def test_success_profile_shows_stats(self):
+        response = self.client.get(reverse("accounts:user_profile", kwargs={"username": "testuser1"}))
+        self.assertEqual(response.context["stats"].tweet_count, 2)
+        activity = response.context["activity"]
+        self.assertEqual(len(activity), 30)
+        self.assertEqual(activity[-1][1], 2)
+
+
+class TestExclusions(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user1 = User.objects.create_user(username="testuser1", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        self.user3 = User.objects.create_user(username="testuser3", password="testpassword")
+        self.client.force_login(self.user1)
+        self.tweet2 = Tweet.objects.create(user=self.user2, content="tweet2")
+        self.tweet3 = Tweet.objects.create(user=self.user3, content="tweet3")
+
+    def post(self, name, user):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse(f"accounts:{name}", kwargs={"username": user.username}))
+
+    def viewer(self, user):
+        # ワーカーがリクエストごとに読み込む request.user と同じく，DB から読み直したユーザー。
+        return User.objects.get(pk=user.pk)
+
+    def home_contents(self, **params):
+        response = self.client.get(reverse("tweets:home"), params)
+        return [tweet.content for tweet in response.context["tweet_list"]]
+
+    def test_success_mute_hides_home_timeline_but_not_profile(self):
+        response = self.post("mute", self.user2)
+        self.assertRedirects(response, reverse("accounts:user_profile", kwargs={"username": "testuser2"}))
+        self.assertTrue(Mute.objects.filter(muter=self.user1, muted=self.user2).exists())
+        self.assertEqual(self.home_contents(), ["tweet3"])
+
+        response = self.client.get(reverse("accounts:user_profile", kwargs={"username": "testuser2"}))
+        self.assertTrue(response.context["is_muted"])
+        self.assertEqual([tweet.content for tweet in response.context["tweet_list"]], ["tweet2"])
+
+        self.post("unmute", self.user2)
+        self.assertEqual(self.home_contents(), ["tweet3", "tweet2"])
+
+    def test_success_block_hides_both_ways(self):
+        FriendShip.objects.create(follower=self.user2, following=self.user1)
+        self.post("block", self.user2)
+        self.assertFalse(FriendShip.objects.exists())
+        self.assertEqual(self.home_contents(), ["tweet3"])
+
+        self.client.force_login(self.user2)
+        response = self.client.get(reverse("accounts:user_profile", kwargs={"username": "testuser1"}))
+        self.assertTrue(response.context["is_blocked"])
+        self.assertFalse(response.context["is_blocking"])
+        self.assertEqual(response.context["tweet_list"], [])
+        response = self.client.get(reverse("tweets:api_user_timeline", kwargs={"username": "testuser1"}))
+        self.assertEqual(response.json()["tweets"], [])
+
+        response = self.post("follow", self.user1)
+        self.assertFalse(FriendShip.objects.exists())
+        tweet1 = Tweet.objects.create(user=self.user1, content="tweet1")
+        response = self.client.post(reverse("tweets:like", kwargs={"pk": tweet1.pk}))
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(self.user1)
+        self.post("unblock", self.user2)
+        self.assertFalse(Block.objects.exists())
+        self.assertEqual(self.home_contents(), ["tweet1", "tweet3", "tweet2"])
+
+    def test_success_liked_by_hides_muted_users(self):
+        Like.objects.create(tweet=self.tweet3, user=self.user2)
+        Like.objects.create(tweet=self.tweet3, user=self.user3)
+        self.post("mute", self.user2)
+        response = self.client.get(reverse("tweets:liked_by", kwargs={"pk": self.tweet3.pk}))
+        self.assertEqual([liker.username for liker in response.context["likers"]], ["testuser3"])
+
+    def test_success_large_exclusion_set_filtered_in_python(self):
+        for i in range(4):
+            Tweet.objects.create(user=self.user2, content=f"muted{i}")
+        Tweet.objects.create(user=self.user3, content="tweet4")
+        self.post("mute", self.user2)
+        with self.settings(EXCLUSION_SQL_LIMIT=0):
+            self.assertEqual(self.home_contents(limit=1), ["tweet4"])
+            response = self.client.get(reverse("tweets:home"), {"limit": 1})
+            self.assertEqual(self.home_contents(limit=1, before=response.context["next_cursor"]), ["tweet3"])
+            self.assertEqual(self.home_contents(before=self.tweet3.pk), [])
+
+    def test_success_exclusion_set_cached_until_changed(self):
+        self.post("mute", self.user2)
+        viewer = self.viewer(self.user1)
+        exclusions.get(viewer)
+        with self.assertNumQueries(0):
+            self.assertEqual(exclusions.get(viewer).hidden, {self.user2.pk})
+        self.post("block", self.user3)
+        self.assertEqual(exclusions.get(self.viewer(self.user1)).blocked, {self.user3.pk})
+        self.assertEqual(exclusions.get(self.viewer(self.user3)).blocked, {self.user1.pk})
+
+    def test_success_change_in_other_process_invalidates_cached_set(self):
+        self.assertEqual(exclusions.get(self.viewer(self.user1)).blocked, frozenset())
+        # 別のワーカーがブロックを処理した場合。このプロセスのキャッシュには何も届かない。
+        with mock.patch.object(exclusions, "cache", LocMemCache("other-process", {})):
+            exclusions.block(self.user3, self.user1)
+        self.assertEqual(exclusions.get(self.viewer(self.user1)).blocked, {self.user3.pk})
+        response = self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet3.pk}))
+        self.assertEqual(response.status_code, 403)
+
+    def test_failure_post_with_self(self):
+        response = self.post("block", self.user1)
+        self.assertEqual(response.status_code, 400)
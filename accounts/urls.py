@@ -12,6 +12,10 @@ urlpatterns = [
     path("<str:username>/", views.UserProfileView.as_view(), name="user_profile"),
     path("<str:username>/follow/", views.FollowView.as_view(), name="follow"),
     path("<str:username>/unfollow/", views.UnFollowView.as_view(), name="unfollow"),
+    path("<str:username>/mute/", views.MuteView.as_view(), name="mute"),
+    path("<str:username>/unmute/", views.UnmuteView.as_view(), name="unmute"),
+    path("<str:username>/block/", views.BlockView.as_view(), name="block"),
+    path("<str:username>/unblock/", views.UnblockView.as_view(), name="unblock"),
     path("<str:username>/following_list/", views.FollowingListView.as_view(), name="following_list"),
     path("<str:username>/follower_list/", views.FollowerListView.as_view(), name="follower_list"),
 ]
@@ -2,18 +2,26 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db import transaction
 from django.http import HttpResponseBadRequest
 from django.shortcuts import get_object_or_404, redirect
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.views.generic import CreateView, DetailView, ListView, View
 
-from tweets.models import Like, Tweet
+from core import public
+from core.mixins import ConditionalGetMixin, make_etag
+from core.public import PublicPageMixin
+from core.ratelimit import RateLimitMixin
+from notifications import events
+from tweets import timeline
 
+from . import exclusions, stats
 from .forms import SignupForm
-from .models import FriendShip, User
+from .models import Block, FriendShip, User
 
 
-class SignupView(CreateView):
+class SignupView(RateLimitMixin, CreateView):
+    ratelimit_scope = "signup"
     form_class = SignupForm
     template_name = "accounts/signup.html"
     success_url = reverse_lazy(settings.LOGIN_REDIRECT_URL)
@@ -27,31 +35,73 @@ class SignupView(CreateView):
         return response
 
 
-class UserProfileView(LoginRequiredMixin, DetailView):
+def profile_paths(*users):
+    return [reverse("accounts:user_profile", kwargs={"username": user.username}) for user in users]
+
+
+class UserProfileView(
+    PublicPageMixin, LoginRequiredMixin, ConditionalGetMixin, timeline.StreamingTimelineMixin, DetailView
+):
     model = User
+    queryset = model.objects.filter(is_active=True)
     context_object_name = "user"
     template_name = "accounts/profile.html"
+    public_template_name = "accounts/public_profile.html"
+    list_template_name = "accounts/tweet_list.html"
     slug_field = "username"
     slug_url_kwarg = "username"
 
+    def get_version(self):
+        stamp = self.get_queryset().filter(username=self.kwargs["username"]).values_list("pk", "activity_at").first()
+        if stamp is None:
+            return None
+        user_id, activity_at = stamp
+        viewer = self.request.user
+        etag = make_etag("profile", user_id, activity_at, viewer.pk, viewer.activity_at)
+        return etag, max(activity_at, viewer.activity_at)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         user = self.object
         context["tweet_user"] = user
-        context["tweet_list"] = (
-            Tweet.objects.select_related("user").prefetch_related("likes").filter(user=user).order_by("-created_at")
+        excluded = exclusions.get(self.request.user)
+        tweets, archive = timeline.user_queryset(user), timeline.user_archive_queryset(user)
+        if user.pk in excluded.blocked:
+            # 1 人分のツイートを NOT IN で全部落とすより，クエリを発行しない none() にする。
+            tweets, archive = tweets.none(), archive.none()
+        context.update(self.get_timeline_context(tweets, archive))
+        context["is_muted"] = user.pk in excluded.muted
+        context["is_blocking"] = (
+            user.pk in excluded.blocked and Block.objects.filter(blocker=self.request.user, blocked=user).exists()
         )
+        context["is_blocked"] = user.pk in excluded.blocked
         context["is_following"] = FriendShip.objects.filter(following=user, follower=self.request.user).exists()
         context["following_num"] = FriendShip.objects.filter(follower=user).count()
         context["followers_num"] = FriendShip.objects.filter(following=user).count()
-        liked_list = Like.objects.filter(user=self.request.user).values_list("tweet_id", flat=True)
-        context["liked_list"] = liked_list
+        context["stats"] = stats.get_stats(user)
+        context["activity"] = stats.daily_histogram(user)
         return context
 
+    def get_public_context_data(self):
+        user = get_object_or_404(self.get_queryset(), username=self.kwargs["username"])
+        before, limit = timeline.parse_page_args(self.request)
+        tweets, archive = timeline.user_queryset(user), timeline.user_archive_queryset(user)
+        rows, next_cursor = timeline.fetch_rows(tweets, before, limit, archive)
+        return {
+            "profile_user": user,
+            "tweet_list": timeline.build_cards(rows, set()),
+            "next_cursor": next_cursor,
+            "following_num": FriendShip.objects.filter(follower=user).count(),
+            "followers_num": FriendShip.objects.filter(following=user).count(),
+            "stats": stats.get_stats(user),
+        }
+
+
+class FollowView(RateLimitMixin, LoginRequiredMixin, View):
+    ratelimit_scope = "follow"
 
-class FollowView(LoginRequiredMixin, View):
     def post(self, request, *args, **kwargs):
-        following = get_object_or_404(User, username=self.kwargs["username"])
+        following = get_object_or_404(User, username=self.kwargs["username"], is_active=True)
         follower = request.user
 
         if following == follower:
@@ -61,12 +111,22 @@ class FollowView(LoginRequiredMixin, View):
             messages.warning(request, "フォロー済です。")
             return redirect("tweets:home")
 
-        FriendShip.objects.create(following=following, follower=follower)
+        if following.pk in exclusions.get(follower).blocked:
+            messages.warning(request, "ブロックしているか，ブロックされているためフォローできません。")
+            return redirect("tweets:home")
+
+        with transaction.atomic():
+            FriendShip.objects.create(following=following, follower=follower)
+            User.objects.touch([following.pk, follower.pk])
+            events.notify_follow(following, follower)
+            public.invalidate(profile_paths(following, follower))
         messages.success(request, "フォローしました")
         return redirect("tweets:home")
 
 
-class UnFollowView(LoginRequiredMixin, View):
+class UnFollowView(RateLimitMixin, LoginRequiredMixin, View):
+    ratelimit_scope = "follow"
+
     def post(self, request, *args, **kwargs):
         following = get_object_or_404(User, username=self.kwargs["username"])
         follower = request.user
@@ -74,11 +134,47 @@ class UnFollowView(LoginRequiredMixin, View):
         if following == follower:
             return HttpResponseBadRequest("自分自身を対象には出来ません。")
 
-        FriendShip.objects.filter(following=following, follower=follower).delete()
+        if FriendShip.objects.filter(following=following, follower=follower).delete()[0]:
+            User.objects.touch([following.pk, follower.pk])
+            public.invalidate(profile_paths(following, follower))
         messages.success(request, "フォローを外しました")
         return redirect("tweets:home")
 
 
+class ExclusionView(RateLimitMixin, LoginRequiredMixin, View):
+    ratelimit_scope = "follow"
+    action = None
+    message = None
+
+    def post(self, request, *args, **kwargs):
+        target = get_object_or_404(User, username=self.kwargs["username"])
+        if target == request.user:
+            return HttpResponseBadRequest("自分自身を対象には出来ません。")
+        getattr(exclusions, self.action)(request.user, target)
+        messages.success(request, self.message)
+        return redirect("accounts:user_profile", username=target.username)
+
+
+class MuteView(ExclusionView):
+    action = "mute"
+    message = "ミュートしました"
+
+
+class UnmuteView(ExclusionView):
+    action = "unmute"
+    message = "ミュートを解除しました"
+
+
+class BlockView(ExclusionView):
+    action = "block"
+    message = "ブロックしました"
+
+
+class UnblockView(ExclusionView):
+    action = "unblock"
+    message = "ブロックを解除しました"
+
+
 class FollowerListView(LoginRequiredMixin, ListView):
     model = User
     template_name = "accounts/follower_list.html"
@@ -86,7 +182,17 @@ class FollowerListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         user = get_object_or_404(User, username=self.kwargs["username"])
-        return FriendShip.objects.select_related("follower").filter(following=user)
+        return (
+            FriendShip.objects.select_related("follower")
+            .filter(following=user, follower__is_active=True)
+            .order_by("-id")
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        user_ids = self.object_list.values("follower_id")
+        context["following_ids"] = FriendShip.objects.following_ids(self.request.user, user_ids)
+        return context
 
 
 class FollowingListView(LoginRequiredMixin, ListView):
@@ -96,4 +202,14 @@ class FollowingListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         user = get_object_or_404(User, username=self.kwargs["username"])
-        return FriendShip.objects.select_related("following").filter(follower=user)
+        return (
+            FriendShip.objects.select_related("following")
+            .filter(follower=user, following__is_active=True)
+            .order_by("-id")
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        user_ids = self.object_list.values("following_id")
+        context["following_ids"] = FriendShip.objects.following_ids(self.request.user, user_ids)
+        return context
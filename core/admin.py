@@ -0,0 +1,55 @@
+from functools import reduce
+from operator import or_
+
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    # 絞り込みのない一覧は最大の主キーを件数の見積もりに使い，COUNT(*) で表全体を読まない。
+    # 絞り込みがあるときも max_exact_count 件で数えるのをやめる。
+    max_exact_count = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            return queryset.aggregate(estimate=Max("pk"))["estimate"] or 0
+        return queryset.order_by()[: self.max_exact_count].count()
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    # 行数の多いテーブル用。検索は exact_search_fields の完全一致だけにして，インデックスで引けるようにする。
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    exact_search_fields = []
+
+    def get_search_fields(self, request):
+        return self.exact_search_fields
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        lookups = [
+            self.lookup(queryset.model, field, search_term)
+            for field in self.exact_search_fields
+            if self.accepts(field, search_term)
+        ]
+        if not lookups:
+            return queryset.none(), False
+        return queryset.filter(reduce(or_, lookups)), False
+
+    def lookup(self, model, field, search_term):
+        # 関連先の条件は JOIN ではなく IN サブクエリにする。OR の各項が同じテーブルの条件になり，それぞれインデックスを使える。
+        if "__" not in field:
+            return Q(**{field: search_term})
+        relation, rest = field.split("__", 1)
+        related_model = model._meta.get_field(relation).related_model
+        return Q(**{f"{relation}__in": related_model._default_manager.filter(**{rest: search_term}).values("pk")})
+
+    def accepts(self, field, search_term):
+        # 主キー・外部キーの id は数字のときだけ検索する。
+        return search_term.isdigit() or not (field == "pk" or field.endswith(("_id", "__pk")))
@@ -0,0 +1,115 @@
+from datetime import date
+
+from django.conf import settings
+from django.utils import timezone
+
+from accounts.models import FriendShip
+from tweets.models import ArchivedLike, ArchivedTweet, Like, Tweet
+
+try:
+    import numpy as np
+except ImportError:  # numpy は集計コマンドでしか使わないので任意。
+    np = None
+
+PERCENTILES = (50, 90, 99)
+
+UNIX_EPOCH = date(1970, 1, 1).toordinal()
+
+
+def read_columns(queryset, fields, chunk_size, convert=None):
+    # id のキーセットで chunk_size 行ずつ読み，id と fields を列ごとの int64 配列にする。
+    # 1 本のクエリが長く走り続けたり，全行を一度にメモリへ載せたりしないようにする。
+    fields = ("id",) + tuple(fields)
+    chunks = {field: [] for field in fields}
+    last_id = None
+    while True:
+        page = queryset.order_by("id")
+        if last_id is not None:
+            page = page.filter(id__gt=last_id)
+        rows = list(page.values_list(*fields)[:chunk_size])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        for index, field in enumerate(fields):
+            values = (row[index] for row in rows)
+            if convert and field in convert:
+                values = map(convert[field], values)
+            chunks[field].append(np.fromiter(values, dtype=np.int64, count=len(rows)))
+    return {
+        field: np.concatenate(arrays) if arrays else np.empty(0, dtype=np.int64) for field, arrays in chunks.items()
+    }
+
+
+def concat(*tables):
+    return {field: np.concatenate([table[field] for table in tables]) for field in tables[0]}
+
+
+def local_day(value):
+    # TIME_ZONE での日付を 1970-01-01 からの日数にする。
+    return timezone.localdate(value).toordinal() - UNIX_EPOCH
+
+
+def load(chunk_size=None):
+    chunk_size = chunk_size or settings.ANALYTICS_CHUNK_SIZE
+    fields, convert = ("user_id", "created_at"), {"created_at": local_day}
+    tweets = concat(
+        read_columns(Tweet.objects.filter(is_deleted=False), fields, chunk_size, convert),
+        read_columns(ArchivedTweet.objects.filter(is_deleted=False), fields, chunk_size, convert),
+    )
+    likes = concat(
+        read_columns(Like.objects.all(), ("tweet_id", "user_id"), chunk_size),
+        read_columns(ArchivedLike.objects.all(), ("tweet_id", "user_id"), chunk_size),
+    )
+    follows = read_columns(FriendShip.objects.all(), ("follower_id", "following_id"), chunk_size)
+    return tweets, likes, follows
+
+
+def counts_by(keys, among=None):
+    # keys ごとの件数。among を渡すと，その全要素について 0 件も含めて返す。
+    unique, counts = np.unique(keys, return_counts=True)
+    if among is None:
+        return unique, counts
+    among = np.unique(among)
+    result = np.zeros(len(among), dtype=np.int64)
+    positions = np.searchsorted(among, unique)
+    found = (positions < len(among)) & (among[np.minimum(positions, len(among) - 1)] == unique)
+    result[positions[found]] = counts[found]
+    return among, result
+
+
+def compute(tweets, likes, follows):
+    # 日次アクティブはタイムスタンプを持つ投稿で数える (いいね・フォローには作成日時の列がない)。
+    pairs = np.unique(np.stack([tweets["created_at"], tweets["user_id"]]), axis=1)
+    days, active = np.unique(pairs[0], return_counts=True)
+    tweet_users, tweets_per_user = counts_by(tweets["user_id"])
+    tweet_ids, likes_per_tweet = counts_by(likes["tweet_id"], among=tweets["id"])
+    likers, likes_per_user = counts_by(likes["user_id"])
+    followed, followers = counts_by(follows["following_id"])
+    return {
+        "dau_day": days.astype("datetime64[D]"),
+        "dau_users": active,
+        "tweets_user_id": tweet_users,
+        "tweets_count": tweets_per_user,
+        "likes_tweet_id": tweet_ids,
+        "likes_received": likes_per_tweet,
+        "likes_user_id": likers,
+        "likes_given": likes_per_user,
+        "followers_user_id": followed,
+        "followers_count": followers,
+    }
+
+
+def summarize(values):
+    if not len(values):
+        return {"mean": 0.0, **{f"p{p}": 0 for p in PERCENTILES}, "max": 0}
+    percentiles = np.percentile(values, PERCENTILES)
+    return {
+        "mean": float(values.mean()),
+        **{f"p{p}": float(value) for p, value in zip(PERCENTILES, percentiles)},
+        "max": int(values.max()),
+    }
+
+
+def save(path, metrics):
+    # 列ごとの配列を圧縮した .npz にまとめる。np.load(path) で列名から読める。
+    np.savez_compressed(path, **metrics)
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# プロセスごとに別々の値を持つキャッシュ。
+PER_PROCESS_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    # レート制限・除外集合・公開ページの無効化はキャッシュをワーカー間で共有していないと効かない。
+    if settings.CACHES["default"]["BACKEND"] not in PER_PROCESS_BACKENDS:
+        return []
+    return [
+        Warning(
+            "既定のキャッシュがプロセスごとのバックエンドです。",
+            hint="複数のワーカーで動かすときは REDIS_URL を設定して Redis を使ってください。",
+            id="core.W001",
+        )
+    ]
@@ -0,0 +1,73 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+
+# 新しいプロセス (= fork 直後のワーカー) で WSGI アプリケーションを組み立て，最初の 2 リクエストを計測する。
+WORKER_SCRIPT = """
+import io, json, sys, time
+
+started = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+
+application = get_wsgi_application()
+if sys.argv[1] == "warm":
+    from core.warmup import warm_up
+
+    warm_up(force=True)
+booted = time.perf_counter()
+
+
+def request(path, host):
+    environ = {
+        "REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": "", "SERVER_NAME": host,
+        "SERVER_PORT": "80", "HTTP_HOST": host, "SERVER_PROTOCOL": "HTTP/1.1", "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr, "wsgi.url_scheme": "http", "wsgi.multithread": False,
+        "wsgi.multiprocess": True, "wsgi.run_once": False, "wsgi.version": (1, 0),
+    }
+    statuses = []
+    started = time.perf_counter()
+    b"".join(application(environ, lambda status, headers: statuses.append(status)))
+    return time.perf_counter() - started, statuses[0]
+
+
+first, status = request(sys.argv[2], sys.argv[3])
+second, _ = request(sys.argv[2], sys.argv[3])
+print(json.dumps({"boot": booted - started, "first": first, "second": second, "status": status}))
+"""
+
+
+class Command(BaseCommand):
+    help = "ワーカーの起動から最初のレスポンスまでの時間を，ウォームアップの有無で比較します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=5, help="モードごとに起動するプロセス数")
+        parser.add_argument("--path", help="計測する URL (既定: ログインページ)")
+        parser.add_argument("--host", default="localhost")
+
+    def handle(self, *args, **options):
+        path = options["path"] or reverse("accounts:login")
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "mysite.settings")}
+        for mode in ("cold", "warm"):
+            runs = []
+            for _ in range(options["workers"]):
+                output = subprocess.run(
+                    [sys.executable, "-c", WORKER_SCRIPT, mode, path, options["host"]],
+                    cwd=settings.BASE_DIR,
+                    env=env,
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                ).stdout
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+            boot, first, second = (statistics.median(run[key] for run in runs) for key in ("boot", "first", "second"))
+            self.stdout.write(
+                f"{mode:<5} boot {boot * 1000:8.1f} ms  first response {first * 1000:8.1f} ms  "
+                f"second {second * 1000:8.1f} ms  boot + first {(boot + first) * 1000:8.1f} ms "
+                f"({runs[0]['status']}, median of {len(runs)})"
+            )
@@ -0,0 +1,46 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import analytics
+
+
+class Command(BaseCommand):
+    help = "ツイート・いいね・フォローの id 列を分割して読み，日次アクティブや分布を NumPy で集計して .npz に書き出します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", help="出力先の .npz (省略時は ANALYTICS_OUTPUT_DIR/engagement-<日付>.npz)")
+        parser.add_argument("--chunk-size", type=int, default=settings.ANALYTICS_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if analytics.np is None:
+            raise CommandError("numpy がインストールされていません: pip install numpy")
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size は 1 以上を指定してください。")
+
+        output = options["output"] or os.path.join(
+            settings.ANALYTICS_OUTPUT_DIR, f"engagement-{timezone.localdate():%Y%m%d}.npz"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+        tweets, likes, follows = analytics.load(options["chunk_size"])
+        metrics = analytics.compute(tweets, likes, follows)
+        analytics.save(output, metrics)
+
+        self.stdout.write(
+            f"ツイート {len(tweets['id'])} 件・いいね {len(likes['id'])} 件・フォロー {len(follows['id'])} 件を集計しました"
+        )
+        if len(metrics["dau_day"]):
+            self.stdout.write(f"日次アクティブ (最新 {metrics['dau_day'][-1]}): {metrics['dau_users'][-1]} 人")
+        for label, key in [
+            ("ユーザーごとのツイート数", "tweets_count"),
+            ("ツイートごとのいいね数", "likes_received"),
+            ("ユーザーごとのいいね数", "likes_given"),
+            ("フォロワー数", "followers_count"),
+        ]:
+            summary = analytics.summarize(metrics[key])
+            values = "  ".join(f"{name} {value:g}" for name, value in summary.items())
+            self.stdout.write(f"{label}: {values}")
+        self.stdout.write(self.style.SUCCESS(f"{output} に書き出しました"))
@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import FriendShip, User
+from tweets import thread
+from tweets.models import Like, Tweet
+
+EXPLAINED = ("SELECT", "UPDATE", "DELETE")
+
+
+class Command(BaseCommand):
+    help = "tweets / accounts のビューが発行するクエリを EXPLAIN QUERY PLAN し，全件走査や一時 B-tree を検出します。"
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("SQLite でのみ実行できます。")
+
+        with override_settings(ALLOWED_HOSTS=["testserver"], RATELIMIT_ENABLED=False), transaction.atomic():
+            captured = self.capture()
+            problems = []
+            for label, sql in captured:
+                plan = [row[-1] for row in connection.cursor().execute("EXPLAIN QUERY PLAN " + sql).fetchall()]
+                bad = [step for step in plan if self.is_problem(step, sql)]
+                if bad:
+                    problems.append((label, sql, bad))
+                if options["verbosity"] >= 2:
+                    self.stdout.write(f"[{label}] {sql}\n    " + "\n    ".join(plan))
+            transaction.set_rollback(True)
+
+        for label, sql, bad in problems:
+            self.stderr.write(f"[{label}] {sql}\n    " + "\n    ".join(bad))
+        if problems:
+            raise CommandError(f"{len(problems)} 件のクエリが全件走査または一時 B-tree を使っています。")
+        self.stdout.write(self.style.SUCCESS(f"{len(captured)} 件のクエリを確認しました。"))
+
+    def is_problem(self, step, sql):
+        if "USE TEMP B-TREE" in step:
+            return True
+        if not step.startswith("SCAN ") or step.startswith("SCAN CONSTANT ROW"):
+            return False
+        # インデックスを順にたどって LIMIT で打ち切る走査は許容し，それ以外の SCAN を全件走査とみなす。
+        return " USING " not in step or " LIMIT " not in sql
+
+    def capture(self):
+        author = User.objects.create_user(username="explain_author")
+        viewer = User.objects.create_user(username="explain_viewer")
+        tweet = Tweet.objects.create(user=author, content="explain")
+        Like.objects.create(tweet=tweet, user=viewer)
+        reply = Tweet.objects.create(user=viewer, content="explain reply")
+        thread.attach_reply(tweet, reply)
+        FriendShip.objects.create(following=author, follower=viewer)
+        client = Client()
+        client.force_login(viewer)
+
+        requests = [
+            ("home", "get", reverse("tweets:home"), {}),
+            ("home_next", "get", reverse("tweets:home"), {"before": tweet.pk + 1}),
+            ("profile", "get", reverse("accounts:user_profile", args=[author.username]), {}),
+            (
+                "profile_next",
+                "get",
+                reverse("accounts:user_profile", args=[author.username]),
+                {"before": tweet.pk + 1},
+            ),
+            ("detail", "get", reverse("tweets:detail", args=[tweet.pk]), {}),
+            ("reply_detail", "get", reverse("tweets:detail", args=[reply.pk]), {}),
+            ("api_thread", "get", reverse("tweets:api_thread", args=[tweet.pk]), {"after": reply.path}),
+            ("liked_by", "get", reverse("tweets:liked_by", args=[tweet.pk]), {"before": tweet.pk + 1}),
+            ("following_list", "get", reverse("accounts:following_list", args=[viewer.username]), {}),
+            ("follower_list", "get", reverse("accounts:follower_list", args=[author.username]), {}),
+            ("api_home", "get", reverse("tweets:api_home"), {}),
+            ("api_home_updates", "get", reverse("tweets:api_home_updates"), {"since": 0, "format": "cards"}),
+            ("api_user_timeline", "get", reverse("tweets:api_user_timeline", args=[author.username]), {}),
+            ("unlike", "post", reverse("tweets:unlike", args=[tweet.pk]), {}),
+            ("like", "post", reverse("tweets:like", args=[tweet.pk]), {}),
+            ("unfollow", "post", reverse("accounts:unfollow", args=[author.username]), {}),
+            ("follow", "post", reverse("accounts:follow", args=[author.username]), {}),
+            ("notifications", "get", reverse("notifications:inbox"), {"before": 2**62}),
+            ("unread_count", "get", reverse("notifications:unread_count"), {}),
+        ]
+        captured = []
+        for label, method, url, data in requests:
+            with CaptureQueriesContext(connection) as context:
+                response = getattr(client, method)(url, data)
+            if response.status_code >= 400:
+                raise CommandError(f"{label}: {url} が {response.status_code} を返しました。")
+            for query in context.captured_queries:
+                if query["sql"].lstrip().upper().startswith(EXPLAINED):
+                    captured.append((label, query["sql"]))
+        return captured
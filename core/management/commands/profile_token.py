@@ -0,0 +1,11 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = "リクエストを cProfile で計測させるための署名付きヘッダーを出力します (PROFILE_TOKEN_MAX_AGE 秒有効)。"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{settings.PROFILE_HEADER}: {make_token()}")
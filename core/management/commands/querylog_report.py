@@ -0,0 +1,59 @@
+import json
+import os
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "QUERY_LOG_PATH (とローテートされたファイル) のクエリログをフィンガープリントごとに集計します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default=str(settings.QUERY_LOG_PATH))
+        parser.add_argument("--sort", choices=["total", "count", "max", "slow"], default="total")
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--slow-only", action="store_true", help="遅いクエリとして記録されたものだけを集計する")
+
+    def handle(self, *args, **options):
+        paths = [path for path in self.log_files(options["path"]) if os.path.exists(path)]
+        if not paths:
+            raise CommandError(f"ログファイルがありません: {options['path']}")
+
+        groups = defaultdict(lambda: {"count": 0, "slow": 0, "total": 0.0, "max": 0.0, "callers": Counter()})
+        for entry in self.read(paths):
+            if options["slow_only"] and not entry["slow"]:
+                continue
+            group = groups[entry["fingerprint"]]
+            group["count"] += 1
+            group["slow"] += entry["slow"]
+            group["total"] += entry["ms"]
+            group["max"] = max(group["max"], entry["ms"])
+            group["callers"][(entry["view"], entry["caller"])] += 1
+
+        rows = sorted(groups.items(), key=lambda item: item[1][options["sort"]], reverse=True)
+        for sql, group in rows[: options["limit"]]:
+            (view, caller), _ = group["callers"].most_common(1)[0]
+            self.stdout.write(
+                f"{group['count']:6d} 件 (遅い {group['slow']:d})  合計 {group['total']:10.1f} ms  "
+                f"平均 {group['total'] / group['count']:8.1f} ms  最大 {group['max']:8.1f} ms\n"
+                f"    {view or '-'}  {caller or '-'}\n    {sql}"
+            )
+
+    def log_files(self, path):
+        # RotatingFileHandler のバックアップ (.1, .2, ...) を古い順に並べる。
+        backups = []
+        index = 1
+        while os.path.exists(f"{path}.{index}"):
+            backups.append(f"{path}.{index}")
+            index += 1
+        return backups[::-1] + [path]
+
+    def read(self, paths):
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
@@ -0,0 +1,24 @@
+from django.core.cache import cache
+
+NAMES_KEY = "metrics:names"
+
+
+def incr(name, delta=1):
+    key = f"metrics:{name}"
+    if cache.add(key, delta, timeout=None):
+        # 一覧への追加は get/set なので競合し得るが，名前が一度登録されれば十分なので許容する。
+        names = cache.get(NAMES_KEY, set())
+        if name not in names:
+            cache.set(NAMES_KEY, names | {name}, timeout=None)
+        return delta
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.set(key, delta, timeout=None)
+        return delta
+
+
+def snapshot():
+    names = sorted(cache.get(NAMES_KEY, set()))
+    values = cache.get_many([f"metrics:{name}" for name in names])
+    return {name: values.get(f"metrics:{name}", 0) for name in names}
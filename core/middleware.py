@@ -0,0 +1,67 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import OperationalError, connection
+from django.http import HttpResponse
+
+from . import metrics
+
+# 進捗ハンドラーを呼ぶ間隔 (SQLite の VM 命令数)。
+PROGRESS_STEPS = 1000
+
+
+class DeadlineMiddleware:
+    # REQUEST_DEADLINES に登録したビューでは，締め切りを過ぎた SQLite のクエリを中断して 503 を返す。
+    # ASGI のロングポーリングがスレッドを塞がないよう，同期・非同期のどちらのチェーンにも入れる。
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        try:
+            return self.get_response(request)
+        finally:
+            self.clear(request)
+
+    async def __acall__(self, request):
+        try:
+            return await self.get_response(request)
+        finally:
+            if getattr(request, "deadline", None) is not None:
+                await sync_to_async(self.clear)(request)
+
+    def clear(self, request):
+        if getattr(request, "deadline", None) is not None and connection.connection is not None:
+            connection.connection.set_progress_handler(None, 0)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timeout = settings.REQUEST_DEADLINES.get(request.resolver_match.view_name)
+        if timeout is None or connection.vendor != "sqlite":
+            return None
+        request.deadline = deadline = time.monotonic() + timeout
+        connection.ensure_connection()
+        # 0 以外を返すと実行中のクエリが "interrupted" の OperationalError で中断される。
+        connection.connection.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_STEPS)
+        return None
+
+    def process_exception(self, request, exception):
+        if getattr(request, "deadline", None) is None or not isinstance(exception, OperationalError):
+            return None
+        if "interrupted" not in str(exception):
+            return None
+        metrics.incr("deadline_exceeded")
+        metrics.incr(f"deadline_exceeded:{request.resolver_match.view_name}")
+        response = HttpResponse(
+            "混み合っているため表示できませんでした。しばらくしてから再度お試しください。",
+            status=503,
+            content_type="text/plain; charset=utf-8",
+        )
+        response["X-Degraded"] = "deadline"
+        response["Retry-After"] = "1"
+        return response
@@ -0,0 +1,37 @@
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import salted_hmac
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    return "-".join(str(part.timestamp()) if hasattr(part, "timestamp") else str(part) for part in parts)
+
+
+class ConditionalGetMixin:
+    # get_version() は (etag, last_modified) を返す。一致すればテンプレートを描画せずに 304 を返す。
+    def get_version(self):
+        return None
+
+    def get(self, request, *args, **kwargs):
+        version = self.get_version()
+        if version is None:
+            return super().get(request, *args, **kwargs)
+
+        etag, last_modified = version
+        # ページのフォームには CSRF トークンが入っている。ログインで CSRF の秘密が変わると古いページの POST は 403 になるので，
+        # 秘密 (そのままは出さずに HMAC) も ETag に含めて作り直させる。
+        get_token(request)
+        csrf = salted_hmac("core.mixins.etag", request.META["CSRF_COOKIE"]).hexdigest()[:16]
+        etag = quote_etag(make_etag(etag, csrf))
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+
+        response.headers.setdefault("ETag", etag)
+        if timestamp and not response.has_header("Last-Modified"):
+            response.headers["Last-Modified"] = http_date(timestamp)
+        # ユーザーごとに内容が異なるため，共有キャッシュには載せずに毎回再検証させる。
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
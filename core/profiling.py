@@ -0,0 +1,138 @@
+import cProfile
+import os
+import re
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.db import connection
+
+SALT = "core.profiling"
+
+
+def make_token():
+    return signing.TimestampSigner(salt=SALT).sign("profile")
+
+
+def has_valid_token(request):
+    token = request.headers.get(settings.PROFILE_HEADER)
+    if not token:
+        return False
+    try:
+        signing.TimestampSigner(salt=SALT).unsign(token, max_age=settings.PROFILE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+class Timings:
+    def __init__(self):
+        self.sql = self.template = 0.0
+        self.queries = 0
+        self.render_started = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql += time.perf_counter() - started
+            self.queries += 1
+
+    def rendered(self, response):
+        self.template += time.perf_counter() - self.render_started
+        return response
+
+
+class ProfileMiddleware:
+    # 署名付きヘッダー (manage.py profile_token) かスタッフの ?_profile=1 があるリクエストだけを cProfile で計測する。
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        request.profile_timings = timings = Timings()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with self.start(profiler, timings):
+            response = self.get_response(request)
+        return self.finish(request, response, profiler, timings, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        # request.user は DB を読むので，フラグがあるときだけスレッドで確かめる。
+        profile = has_valid_token(request)
+        if not profile and settings.PROFILE_QUERY_FLAG in request.GET:
+            profile = await sync_to_async(self.should_profile)(request)
+        if not profile:
+            return await self.get_response(request)
+
+        # DB の接続も cProfile もスレッドごとなので，ビューの同期処理が走るリクエスト専用のスレッドで付け外しする。
+        # 計測するのはそのスレッドの処理で，イベントループで待っている時間は total にだけ入る。
+        request.profile_timings = timings = Timings()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        stack = await sync_to_async(self.start)(profiler, timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        total = time.perf_counter() - started
+        return await sync_to_async(self.finish)(request, response, profiler, timings, total)
+
+    def start(self, profiler, timings):
+        stack = ExitStack()
+        stack.enter_context(connection.execute_wrapper(timings))
+        profiler.enable()
+        stack.callback(profiler.disable)
+        return stack
+
+    def finish(self, request, response, profiler, timings, total):
+        response["X-Profile-File"] = self.dump(profiler, request)
+        view = total - timings.sql - timings.template
+        response["Server-Timing"] = ", ".join(
+            [
+                f'sql;dur={timings.sql * 1000:.1f};desc="{timings.queries} queries"',
+                f"template;dur={timings.template * 1000:.1f}",
+                f"view;dur={view * 1000:.1f}",
+                f"total;dur={total * 1000:.1f}",
+            ]
+        )
+        return response
+
+    def process_template_response(self, request, response):
+        timings = getattr(request, "profile_timings", None)
+        if timings is not None:
+            # render() はこの後に呼ばれるので，開始時刻を記録して描画後のコールバックで差を取る。
+            timings.render_started = time.perf_counter()
+            response.add_post_render_callback(timings.rendered)
+        return response
+
+    def should_profile(self, request):
+        if has_valid_token(request):
+            return True
+        return settings.PROFILE_QUERY_FLAG in request.GET and request.user.is_staff
+
+    def dump(self, profiler, request):
+        directory = str(settings.PROFILE_DIR)
+        os.makedirs(directory, exist_ok=True)
+        match = request.resolver_match
+        view = re.sub(r"[^\w.-]", "_", match.view_name if match else "unknown")
+        now = time.time_ns()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now // 10**9))
+        filename = f"{stamp}.{now % 10**9:09d}-{os.getpid()}-{view}.prof"
+        profiler.dump_stats(os.path.join(directory, filename))
+        # ファイル名は時刻順に並ぶので，古いものから消して PROFILE_MAX_FILES 件を超えないようにする。
+        files = sorted(name for name in os.listdir(directory) if name.endswith(".prof"))
+        for name in files[: max(len(files) - settings.PROFILE_MAX_FILES, 0)]:
+            os.remove(os.path.join(directory, name))
+        return filename
@@ -0,0 +1,69 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.template import loader
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+GENERATION_KEY = "public:generation"
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def cache_key(path, generation=None):
+    return f"public:{generation or _generation()}:{path}"
+
+
+def invalidate(paths):
+    # 公開ページの内容が変わる操作から呼ぶ。コミット前に消すと古い内容で作り直されるので，コミット後に消す。
+    # 消せるのはこのプロセスから見えるキャッシュだけなので，複数のワーカーでは REDIS_URL で共有キャッシュにする (core.W001)。
+    # プロセスごとのキャッシュのままだと，他のワーカーには PUBLIC_PAGE_CACHE_TIMEOUT 秒まで古いページが残る。
+    transaction.on_commit(lambda: cache.delete_many([cache_key(path) for path in paths]))
+
+
+def invalidate_all():
+    # ユーザーの削除のように，どのページに載っているかを調べきれない変更では世代ごと捨てる。
+    def bump():
+        try:
+            cache.incr(GENERATION_KEY)
+        except ValueError:
+            pass
+
+    transaction.on_commit(bump)
+
+
+class PublicPageMixin:
+    # ログインしていない閲覧者には public_template_name の読み取り専用ページを返す。
+    # 共有キャッシュに載せられるよう public にし，クエリ文字列のない 1 ページ目はサーバー側でもキャッシュする。
+    public_template_name = None
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in ("GET", "HEAD") and not request.user.is_authenticated:
+            response = self.get_public_response()
+            patch_cache_control(response, public=True, max_age=settings.PUBLIC_PAGE_MAX_AGE)
+        else:
+            response = super().dispatch(request, *args, **kwargs)
+            patch_cache_control(response, private=True)
+        # 同じ URL でもログインの有無で内容が変わる。
+        patch_vary_headers(response, ["Cookie"])
+        return response
+
+    def get_public_context_data(self):
+        return {}
+
+    def get_public_response(self):
+        key = cache_key(self.request.path) if not self.request.GET else None
+        content = cache.get(key) if key else None
+        if content is None:
+            content = loader.render_to_string(self.public_template_name, self.get_public_context_data(), self.request)
+            if key:
+                cache.set(key, content, settings.PUBLIC_PAGE_CACHE_TIMEOUT)
+        return HttpResponse(content)
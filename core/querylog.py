@@ -0,0 +1,113 @@
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from contextlib import ExitStack
+from logging.handlers import RotatingFileHandler
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_lists = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_loggers = {}
+_lock = threading.Lock()
+
+
+def fingerprint(sql):
+    # リテラルとプレースホルダーを ? にそろえ，IN (...) の要素数の違いもまとめる。
+    sql = _literals.sub("?", sql.replace("%s", "?"))
+    return " ".join(_lists.sub("(...)", sql).split())
+
+
+def call_site():
+    # クエリを発行したアプリケーション側 (BASE_DIR 以下で，このモジュール以外) の一番内側のフレーム。
+    base = str(settings.BASE_DIR) + os.sep
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(base) and filename != __file__ and "site-packages" not in filename:
+            return f"{os.path.relpath(filename, base)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+def get_logger(path):
+    with _lock:
+        if path not in _loggers:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            handler = RotatingFileHandler(
+                path, maxBytes=settings.QUERY_LOG_MAX_BYTES, backupCount=settings.QUERY_LOG_BACKUP_COUNT
+            )
+            logger = logging.Logger(f"core.querylog:{path}")
+            logger.addHandler(handler)
+            _loggers[path] = logger
+        return _loggers[path]
+
+
+class QueryLogger:
+    # connection.execute_wrapper() に渡す。遅いクエリは必ず，それ以外は QUERY_LOG_SAMPLE_RATE の割合で記録する。
+    def __init__(self, request):
+        self.request = request
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - started) * 1000
+            slow = duration >= settings.QUERY_LOG_SLOW_MS
+            if slow or random.random() < settings.QUERY_LOG_SAMPLE_RATE:
+                self.write(sql, params, duration, slow)
+
+    def write(self, sql, params, duration, slow):
+        match = self.request.resolver_match
+        entry = {
+            "at": timezone.now().isoformat(),
+            "fingerprint": fingerprint(sql),
+            "params": len(params or ()),
+            "ms": round(duration, 3),
+            "slow": slow,
+            "view": match.view_name if match else None,
+            "caller": call_site(),
+        }
+        get_logger(str(settings.QUERY_LOG_PATH)).warning(json.dumps(entry, ensure_ascii=False))
+
+
+class QueryLogMiddleware:
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.QUERY_LOG_ENABLED:
+            return self.get_response(request)
+        with connection.execute_wrapper(QueryLogger(request)):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if not settings.QUERY_LOG_ENABLED:
+            return await self.get_response(request)
+        # DB の接続はスレッドごとで，ASGI ではビューのクエリはリクエスト専用のスレッド (sync_to_async) で走る。
+        # イベントループのスレッドの接続に付けても効かないので，そのスレッドで付け外しする。
+        stack = await sync_to_async(self.install)(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+
+    def install(self, request):
+        stack = ExitStack()
+        stack.enter_context(connection.execute_wrapper(QueryLogger(request)))
+        return stack
@@ -0,0 +1,83 @@
+import math
+import time
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from . import metrics
+
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    count, unit = rate.split("/")
+    return int(count), UNITS[unit]
+
+
+def hit(bucket, rate):
+    # トークンバケットを「次にトークンが満タンになる時刻 (ms)」の 1 つの整数で表し，add / incr / decr だけで更新する。
+    # 全ワーカーで 1 つのバケットを共有するには CACHES が Redis などの共有キャッシュである必要がある。
+    # プロセスごとの LocMemCache ではワーカー数の倍まで通ってしまう。
+    count, period = parse_rate(rate)
+    interval = period * 1000 // count
+    capacity = interval * count
+    now = int(time.time() * 1000)
+    key = f"ratelimit:{bucket}"
+    timeout = period + 1
+
+    cache.add(key, now, timeout)
+    try:
+        full_at = cache.incr(key, interval)
+    except ValueError:
+        full_at = None
+    if full_at is None or full_at < now + interval:
+        # しばらく使われていなかったバケットは満タンの状態から数え直す。
+        full_at = now + interval
+        cache.set(key, full_at, timeout)
+
+    if full_at - now > capacity:
+        cache.decr(key, interval)
+        return False, (full_at - now - capacity) / 1000
+    cache.touch(key, timeout)
+    return True, 0
+
+
+def get_buckets(request, scope):
+    rules = settings.RATELIMITS.get(scope, {})
+    buckets = []
+    if "ip" in rules:
+        buckets.append((f"{scope}:ip:{request.META.get('REMOTE_ADDR', '')}", rules["ip"]))
+    # request.user を評価すると User を読み込むので，セッションに入っている ID だけを使う。
+    user_id = request.session.get(SESSION_KEY) if hasattr(request, "session") else None
+    if "user" in rules and user_id is not None:
+        buckets.append((f"{scope}:user:{user_id}", rules["user"]))
+    return buckets
+
+
+def check(request, scope):
+    if not settings.RATELIMIT_ENABLED:
+        return None
+    for bucket, rate in get_buckets(request, scope):
+        allowed, retry_after = hit(bucket, rate)
+        if not allowed:
+            metrics.incr(f"ratelimit.{scope}.limited")
+            response = HttpResponse("リクエストが多すぎます。しばらく待ってから再度お試しください。", status=429)
+            response["Retry-After"] = str(max(1, math.ceil(retry_after)))
+            return response
+    metrics.incr(f"ratelimit.{scope}.allowed")
+    return None
+
+
+class RateLimitMixin:
+    # LoginRequiredMixin より前に置くと，認証やビューの DB アクセスより先に判定できる。
+    ratelimit_scope = None
+    ratelimit_methods = ("POST",)
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in self.ratelimit_methods:
+            response = check(request, self.ratelimit_scope)
+            if response is not None:
+                return response
+        return super().dispatch(request, *args, **kwargs)
@@ -0,0 +1,37 @@
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # brotli は任意。なければ .gz だけを作る。
+    brotli = None
+
+COMPRESSED_EXTENSIONS = (".css", ".js", ".json", ".map", ".svg", ".txt", ".html")
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # collectstatic で指紋付きのファイル名に書き出した後，隣に事前圧縮した .gz / .br を置く。
+    # 指紋付きのファイルは内容が変わらないので，core.views.StaticAssetView が長い max-age で配信する。
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            if name.endswith(COMPRESSED_EXTENSIONS):
+                self.compress(self.path(name))
+
+    def compress(self, path):
+        with open(path, "rb") as f:
+            content = f.read()
+        variants = [(".gz", gzip.compress(content, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append((".br", brotli.compress(content)))
+        for suffix, compressed in variants:
+            # 小さくならないものは置かない。
+            if len(compressed) < len(content):
+                with open(path + suffix, "wb") as f:
+                    f.write(compressed)
+            elif os.path.exists(path + suffix):
+                os.remove(path + suffix)
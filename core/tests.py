@@ -0,0 +1,458 @@
+import gc
+import gzip
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipIf
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+
+from accounts import exclusions
+from accounts.deletion import schedule_user_deletion
+from accounts.models import FriendShip, User
+from tweets.archive import archive_tweets
+from tweets.models import Like, Tweet
+
+from . import analytics, metrics
+from .admin import EstimatedCountPaginator
+from .checks import check_shared_cache
+from .profiling import make_token
+from .querylog import fingerprint
+from .ratelimit import hit
+from .warmup import warm_up
+
+
+class TestRateLimit(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.user)
+        self.tweet = Tweet.objects.create(user=self.user, content="tweet")
+
+    def test_success_hit_within_capacity(self):
+        self.assertEqual([hit("test", "3/m")[0] for _ in range(4)], [True, True, True, False])
+        self.assertGreater(hit("test", "3/m")[1], 0)
+        self.assertTrue(hit("other", "3/m")[0])
+
+    def test_failure_deploy_check_warns_on_per_process_cache(self):
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ["core.W001"])
+        backend = "django.core.cache.backends.redis.RedisCache"
+        with override_settings(CACHES={"default": {"BACKEND": backend, "LOCATION": "redis://localhost:6379"}}):
+            self.assertEqual(check_shared_cache(None), [])
+
+    @override_settings(RATELIMITS={"like": {"user": "2/m"}})
+    def test_failure_post_over_limit(self):
+        url = reverse("tweets:like", kwargs={"pk": self.tweet.pk})
+        self.assertEqual(self.client.post(url).status_code, 200)
+        self.assertEqual(self.client.post(url).status_code, 200)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response["Retry-After"]), 1)
+
+    @override_settings(RATELIMITS={"signup": {"ip": "1/h"}})
+    def test_failure_signup_over_limit_per_ip(self):
+        self.client.logout()
+        url = reverse("accounts:signup")
+        self.client.post(url, {})
+        self.assertEqual(self.client.post(url, {}).status_code, 429)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(RATELIMIT_ENABLED=False, RATELIMITS={"like": {"user": "1/m"}})
+    def test_success_post_with_ratelimit_disabled(self):
+        url = reverse("tweets:like", kwargs={"pk": self.tweet.pk})
+        self.client.post(url)
+        self.assertEqual(self.client.post(url).status_code, 200)
+
+
+class TestMetricsView(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("core:metrics")
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+
+    @override_settings(RATELIMITS={"like": {"user": "1/m"}})
+    def test_success_get_with_staff(self):
+        tweet = Tweet.objects.create(user=self.user, content="tweet")
+        self.client.force_login(self.user)
+        self.client.post(reverse("tweets:like", kwargs={"pk": tweet.pk}))
+        self.client.post(reverse("tweets:like", kwargs={"pk": tweet.pk}))
+
+        self.user.is_staff = True
+        self.user.save()
+        data = self.client.get(self.url).json()
+        self.assertEqual(data["ratelimit.like.allowed"], 1)
+        self.assertEqual(data["ratelimit.like.limited"], 1)
+
+    def test_failure_get_with_not_staff(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class TestExplainHotQueriesCommand(TestCase):
+    def test_success_no_full_scan(self):
+        out = StringIO()
+        call_command("explain_hot_queries", stdout=out, stderr=StringIO())
+        self.assertIn("件のクエリを確認しました", out.getvalue())
+        self.assertFalse(User.objects.filter(username__startswith="explain_").exists())
+
+
+class TestWarmUp(TestCase):
+    def test_success_warm_up(self):
+        self.addCleanup(gc.unfreeze)
+        template_dir = settings.TEMPLATES[0]["DIRS"][0]
+        expected = sum(len(files) for _, _, files in os.walk(template_dir))
+        self.assertEqual(warm_up(force=True), expected)
+        self.assertGreater(gc.get_freeze_count(), 0)
+        self.assertIn("home", get_resolver().namespace_dict["tweets"][1].reverse_dict)
+
+    @override_settings(WARMUP_ON_BOOT=False)
+    def test_success_skip_when_disabled(self):
+        self.assertEqual(warm_up(), 0)
+
+
+class TestLargeTableAdmin(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username="admin", password="testpassword")
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.admin)
+        self.tweets = [Tweet.objects.create(user=self.user, content=f"tweet{i}") for i in range(3)]
+
+    def test_success_estimated_count(self):
+        Tweet.objects.filter(pk=self.tweets[0].pk).delete()
+        self.assertEqual(EstimatedCountPaginator(Tweet.objects.order_by("pk"), 10).count, self.tweets[2].pk)
+        paginator = EstimatedCountPaginator(Tweet.objects.filter(user=self.user).order_by("pk"), 10)
+        paginator.max_exact_count = 1
+        self.assertEqual(paginator.count, 1)
+
+    def test_success_changelist_without_full_count(self):
+        url = reverse("admin:tweets_tweet_changelist")
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        Tweet.objects.bulk_create(Tweet(user=self.user, content="more") for _ in range(10))
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertEqual(len(few), len(many))
+        self.assertFalse([query for query in many if "COUNT(*)" in query["sql"]])
+        self.assertEqual(len(response.context["cl"].result_list), 13)
+
+    def test_success_changelist_exact_search(self):
+        url = reverse("admin:tweets_tweet_changelist")
+        response = self.client.get(url, {"q": "testuser"})
+        self.assertEqual(len(response.context["cl"].result_list), 3)
+        response = self.client.get(url, {"q": str(self.tweets[0].pk)})
+        self.assertEqual([tweet.pk for tweet in response.context["cl"].result_list], [self.tweets[0].pk])
+        response = self.client.get(url, {"q": "test"})
+        self.assertEqual(len(response.context["cl"].result_list), 0)
+
+
+class TestDeadlineMiddleware(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.user)
+
+    @override_settings(REQUEST_DEADLINES={"tweets:home": 0})
+    def test_failure_get_after_deadline(self):
+        with mock.patch("core.middleware.PROGRESS_STEPS", 1):
+            response = self.client.get(reverse("tweets:home"))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["X-Degraded"], "deadline")
+        self.assertEqual(metrics.snapshot()["deadline_exceeded:tweets:home"], 1)
+        # ハンドラーは外されているので，以降のクエリは中断されない。
+        self.assertEqual(User.objects.count(), 1)
+
+    @override_settings(REQUEST_DEADLINES={"tweets:home": 60})
+    def test_success_get_within_deadline(self):
+        with mock.patch("core.middleware.PROGRESS_STEPS", 1):
+            response = self.client.get(reverse("tweets:home"))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Degraded", response)
+
+
+class TestQueryLog(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.user)
+        Tweet.objects.create(user=self.user, content="tweet")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "queries.log")
+
+    def test_success_fingerprint(self):
+        sql = 'SELECT "id" FROM "t" U0 WHERE ("id" IN (%s, %s, %s) AND "name" = \'it\'\'s\') LIMIT 21'
+        self.assertEqual(fingerprint(sql), 'SELECT "id" FROM "t" U0 WHERE ("id" IN (...) AND "name" = ?) LIMIT ?')
+
+    def test_success_log_and_report(self):
+        with self.settings(QUERY_LOG_ENABLED=True, QUERY_LOG_SLOW_MS=0, QUERY_LOG_PATH=self.path):
+            self.client.get(reverse("tweets:home"))
+        with open(self.path, encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f]
+        timeline = [entry for entry in entries if '"tweets_tweet"' in entry["fingerprint"]]
+        self.assertEqual(timeline[0]["view"], "tweets:home")
+        self.assertTrue(timeline[0]["caller"].startswith("tweets/timeline.py:"))
+        self.assertTrue(timeline[0]["slow"])
+
+        out = StringIO()
+        call_command("querylog_report", path=self.path, limit=100, stdout=out)
+        self.assertIn("tweets:home", out.getvalue())
+        self.assertIn('"tweets_tweet"', out.getvalue())
+
+    @override_settings(QUERY_LOG_ENABLED=True, QUERY_LOG_SLOW_MS=0)
+    async def test_success_log_asgi_request(self):
+        # ASGI ではビューのクエリはイベントループとは別のスレッドの接続で走る。
+        await sync_to_async(self.async_client.force_login)(self.user)
+        with self.settings(QUERY_LOG_PATH=self.path):
+            response = await self.async_client.get(reverse("tweets:api_home_updates_wait"), {"since": 0, "wait": 0})
+        self.assertEqual(response.status_code, 200)
+        with open(self.path, encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f]
+        views = {entry["view"] for entry in entries if '"tweets_tweet"' in entry["fingerprint"]}
+        self.assertEqual(views, {"tweets:api_home_updates_wait"})
+
+    @override_settings(QUERY_LOG_ENABLED=True, QUERY_LOG_SLOW_MS=10**6, QUERY_LOG_SAMPLE_RATE=0)
+    def test_success_skip_fast_queries(self):
+        with self.settings(QUERY_LOG_PATH=self.path):
+            self.client.get(reverse("tweets:home"))
+        self.assertFalse(os.path.exists(self.path))
+
+
+class TestProfileMiddleware(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.staff = User.objects.create_user(username="staff", password="testpassword", is_staff=True)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.url = reverse("tweets:home")
+
+    def get(self, data=None, **extra):
+        with self.settings(PROFILE_DIR=self.directory, PROFILE_MAX_FILES=2):
+            return self.client.get(self.url, data, **extra)
+
+    def test_success_profile_with_staff_flag(self):
+        self.client.force_login(self.staff)
+        response = self.get({"_profile": "1"})
+        self.assertEqual(response.status_code, 200)
+        timings = dict(part.split(";")[0:2] for part in response["Server-Timing"].split(", "))
+        self.assertEqual(set(timings), {"sql", "template", "view", "total"})
+        self.assertGreater(float(timings["template"][len("dur=") :]), 0)
+        self.assertEqual(os.listdir(self.directory), [response["X-Profile-File"]])
+        self.assertIn("tweets_home", response["X-Profile-File"])
+
+    def test_success_profile_with_signed_header(self):
+        self.client.force_login(self.user)
+        for _ in range(3):
+            response = self.get(HTTP_X_PROFILE=make_token())
+            self.assertIn("Server-Timing", response)
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        self.assertIn(response["X-Profile-File"], os.listdir(self.directory))
+
+    async def test_success_profile_asgi_request(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        # AsyncClient はキーワード引数をそのままヘッダー名にする。
+        with self.settings(PROFILE_DIR=self.directory):
+            response = await self.async_client.get(
+                reverse("tweets:api_home_updates_wait"), {"since": 0, "wait": 0}, **{"X-Profile": make_token()}
+            )
+        timings = dict(part.split(";", 1) for part in response["Server-Timing"].split(", "))
+        self.assertGreater(float(timings["sql"].split(";")[0][len("dur=") :]), 0)
+        self.assertNotIn('desc="0 queries"', timings["sql"])
+        self.assertEqual(os.listdir(self.directory), [response["X-Profile-File"]])
+
+    def test_failure_profile_without_permission(self):
+        self.client.force_login(self.user)
+        self.assertNotIn("Server-Timing", self.get({"_profile": "1"}))
+        self.assertNotIn("Server-Timing", self.get(HTTP_X_PROFILE=make_token() + "x"))
+        self.assertFalse(os.listdir(self.directory))
+
+
+class TestPublicPages(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.tweet = Tweet.objects.create(user=self.user, content="public tweet")
+        self.profile_url = reverse("accounts:user_profile", kwargs={"username": "testuser"})
+        self.detail_url = reverse("tweets:detail", kwargs={"pk": self.tweet.pk})
+
+    def test_success_anonymous_gets_cached_public_profile(self):
+        response = self.client.get(self.profile_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "accounts/public_profile.html")
+        self.assertContains(response, "public tweet")
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("max-age=60", response["Cache-Control"])
+        self.assertIn("Cookie", response["Vary"])
+        self.assertFalse(response.cookies)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.profile_url)
+        self.assertContains(response, "public tweet")
+
+    def test_success_logged_in_gets_private_page(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.profile_url)
+        self.assertTemplateUsed(response, "accounts/profile.html")
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("Cookie", response["Vary"])
+
+    def test_success_public_detail_and_invalidation_on_delete(self):
+        response = self.client.get(self.detail_url)
+        self.assertTemplateUsed(response, "tweets/public_detail.html")
+        self.client.get(self.profile_url)
+
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("tweets:delete", kwargs={"pk": self.tweet.pk}))
+        self.client.logout()
+        self.assertEqual(self.client.get(self.detail_url).status_code, 404)
+        self.assertNotContains(self.client.get(self.profile_url), "public tweet")
+
+    def test_success_invalidation_on_profile_change(self):
+        self.client.get(self.profile_url)
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("tweets:create"), {"content": "new tweet"})
+        self.client.logout()
+        self.assertContains(self.client.get(self.profile_url), "new tweet")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            schedule_user_deletion(self.user)
+        self.assertEqual(self.client.get(self.profile_url).status_code, 404)
+
+    def test_success_invalidation_on_block(self):
+        other = User.objects.create_user(username="testuser2", password="testpassword")
+        FriendShip.objects.create(follower=other, following=self.user)
+        self.assertContains(self.client.get(self.profile_url), "フォロワー数:1")
+        with self.captureOnCommitCallbacks(execute=True):
+            exclusions.block(self.user, other)
+        self.assertContains(self.client.get(self.profile_url), "フォロワー数:0")
+
+    def test_success_welcome_page_is_cached_for_anonymous(self):
+        self.client.get("/")
+        with self.assertNumQueries(0):
+            response = self.client.get("/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("public", response["Cache-Control"])
+
+
+class TestStaticAssets(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(
+            STATIC_ROOT=directory.name, STATICFILES_STORAGE="core.storage.CompressedManifestStaticFilesStorage"
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        call_command("collectstatic", interactive=False, verbosity=0)
+        self.name = staticfiles_storage.stored_name("tweets/js/like.js")
+        self.url = staticfiles_storage.url("tweets/js/like.js")
+
+    def test_success_collectstatic_writes_fingerprinted_and_compressed_files(self):
+        self.assertNotEqual(self.name, "tweets/js/like.js")
+        path = staticfiles_storage.path(self.name)
+        with open(path, "rb") as f, gzip.open(path + ".gz") as compressed:
+            self.assertEqual(compressed.read(), f.read())
+
+    def test_success_serves_precompressed_file_with_long_max_age(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("javascript", response["Content-Type"])
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn(f"max-age={settings.STATIC_MAX_AGE}", response["Cache-Control"])
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertIn(b"like-button", b"".join(response.streaming_content))
+
+    def test_success_refused_encoding_is_not_served(self):
+        for accept in ("gzip;q=0", "gzip; q=0.0, deflate", "*;q=0", "identity"):
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING=accept)
+            self.assertFalse(response.has_header("Content-Encoding"), accept)
+        for accept in ("GZIP;q=0.5", "*", "br;q=0, *;q=0.1"):
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING=accept)
+            self.assertEqual(response["Content-Encoding"], "gzip", accept)
+
+    def test_success_unfingerprinted_file_is_revalidated(self):
+        url = f"/{settings.STATIC_URL.strip('/')}/tweets/js/like.js"
+        response = self.client.get(url)
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertTrue(response.has_header("Last-Modified"))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertIn("Accept-Encoding", response["Vary"])
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+        # 符号化が違えば別の表現なので，ETag も一致しない。
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+    def test_failure_get_with_missing_or_outside_file(self):
+        prefix = f"/{settings.STATIC_URL.strip('/')}/"
+        self.assertEqual(self.client.get(f"{prefix}../manage.py").status_code, 404)
+        self.assertEqual(self.client.get(f"{prefix}missing.js").status_code, 404)
+
+    def test_success_pages_reference_fingerprinted_script_once(self):
+        user = User.objects.create_user(username="static", email="static@example.com", password="testpassword")
+        Tweet.objects.bulk_create([Tweet(user=user, content=f"tweet {i}") for i in range(3)])
+        self.client.force_login(user)
+        response = self.client.get(reverse("tweets:home"))
+        self.assertContains(response, self.url, count=1)
+        self.assertNotContains(response, "onclick")
+
+
+class TestEngagementStats(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f"stats{i}", email=f"stats{i}@example.com", password="testpassword")
+            for i in range(3)
+        ]
+        first, second, third = self.users
+        self.tweets = Tweet.objects.bulk_create(
+            [Tweet(user=first, content="a"), Tweet(user=first, content="b"), Tweet(user=second, content="c")]
+        )
+        Tweet.objects.filter(pk=self.tweets[0].pk).update(created_at=timezone.now() - timedelta(days=10))
+        archive_tweets(timedelta(days=5))
+        Like.objects.bulk_create([Like(tweet=self.tweets[1], user=second), Like(tweet=self.tweets[1], user=third)])
+        FriendShip.objects.bulk_create(
+            [FriendShip(follower=second, following=first), FriendShip(follower=third, following=first)]
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.output = os.path.join(directory.name, "engagement.npz")
+
+    @skipIf(analytics.np is None, "numpy がインストールされていません")
+    def test_success_writes_columnar_metrics_in_chunks(self):
+        first, second, _ = self.users
+        call_command("engagement_stats", output=self.output, chunk_size=1, stdout=StringIO())
+        data = analytics.np.load(self.output)
+
+        self.assertEqual(list(data["dau_users"]), [1, 2])
+        self.assertEqual(str(data["dau_day"][-1]), timezone.localdate().isoformat())
+        self.assertEqual(dict(zip(data["tweets_user_id"], data["tweets_count"])), {first.pk: 2, second.pk: 1})
+        likes = dict(zip(data["likes_tweet_id"], data["likes_received"]))
+        self.assertEqual(likes, {self.tweets[0].pk: 0, self.tweets[1].pk: 2, self.tweets[2].pk: 0})
+        self.assertEqual(dict(zip(data["followers_user_id"], data["followers_count"])), {first.pk: 2})
+
+    def test_failure_numpy_missing(self):
+        with mock.patch.object(analytics, "np", None):
+            with self.assertRaises(CommandError):
+                call_command("engagement_stats", output=self.output, stdout=StringIO())
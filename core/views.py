@@ -0,0 +1,95 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.auth.mixins import UserPassesTestMixin
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, JsonResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from django.views.generic import View
+
+from . import metrics
+from .mixins import make_etag
+
+# ManifestStaticFilesStorage が付ける MD5 の先頭 12 桁。
+_fingerprint = re.compile(r"\.[0-9a-f]{12}\.\w+$")
+
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def parse_accept_encoding(header):
+    # 符号化ごとの q 値。q=0 は「受け付けない」なので，名前が含まれるかだけでは判断できない。
+    qvalues = {}
+    for part in header.split(","):
+        name, *params = part.split(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        qvalue = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.0
+        qvalues[name] = qvalue
+    return qvalues
+
+
+def choose_encoding(header, available):
+    # available のうち q 値が最も高いもの。同じなら ENCODINGS の順 (br を優先)。* は明示していない符号化に効く。
+    qvalues = parse_accept_encoding(header)
+    best, best_qvalue = None, 0.0
+    for name in available:
+        qvalue = qvalues.get(name, qvalues.get("*", 0.0))
+        if qvalue > best_qvalue:
+            best, best_qvalue = name, qvalue
+    return best
+
+
+class MetricsView(UserPassesTestMixin, View):
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(metrics.snapshot())
+
+
+class StaticAssetView(View):
+    # STATIC_ROOT のファイルを配信する。事前圧縮した .br / .gz があれば Accept-Encoding に合わせて返し，
+    # 指紋付きのファイル名なら内容が変わらないので STATIC_MAX_AGE の間キャッシュさせる。
+    # それ以外は毎回再検証させ，ETag・Last-Modified が一致すれば 304 を返す。
+    def get(self, request, *args, **kwargs):
+        path = kwargs["path"]
+        try:
+            fullpath = safe_join(settings.STATIC_ROOT, path)
+        except SuspiciousFileOperation:
+            raise Http404
+        if not os.path.isfile(fullpath):
+            raise Http404
+
+        suffixes = {name: suffix for name, suffix in ENCODINGS if os.path.isfile(fullpath + suffix)}
+        encoding = choose_encoding(request.headers.get("Accept-Encoding", ""), suffixes)
+        served = fullpath + suffixes[encoding] if encoding else fullpath
+
+        # 符号化ごとに中身が違うので，ETag は配信するファイルから作る。
+        stat = os.stat(served)
+        etag = quote_etag(make_etag(stat.st_mtime_ns, stat.st_size, encoding or "identity"))
+        response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+        if response is None:
+            content_type, _ = mimetypes.guess_type(fullpath)
+            response = FileResponse(open(served, "rb"), content_type=content_type or "application/octet-stream")
+            if encoding:
+                response["Content-Encoding"] = encoding
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(stat.st_mtime)
+        patch_vary_headers(response, ["Accept-Encoding"])
+        if _fingerprint.search(path):
+            patch_cache_control(response, public=True, max_age=settings.STATIC_MAX_AGE, immutable=True)
+        else:
+            patch_cache_control(response, public=True, no_cache=True)
+        return response
@@ -0,0 +1,56 @@
+import gc
+import os
+from importlib import import_module
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.template import engines
+from django.urls import URLResolver, get_resolver
+from django.utils.module_loading import module_has_submodule
+
+WARMUP_MODULES = ("urls", "views", "forms")
+
+
+def import_app_modules():
+    for app_config in apps.get_app_configs():
+        for name in WARMUP_MODULES:
+            if module_has_submodule(app_config.module, name):
+                import_module(f"{app_config.name}.{name}")
+
+
+def populate_resolver(resolver=None):
+    # 逆引き表と各パターンの正規表現は初回アクセス時に作られるので，ここで全部作っておく。
+    resolver = resolver or get_resolver()
+    resolver.reverse_dict
+    for pattern in resolver.url_patterns:
+        pattern.pattern.regex
+        if isinstance(pattern, URLResolver):
+            populate_resolver(pattern)
+
+
+def compile_templates():
+    # DIRS (templates/) 以下のテンプレートを読み込み，キャッシュローダーにコンパイル済みのものを載せる。
+    count = 0
+    for engine in engines.all():
+        for directory in engine.dirs:
+            for root, _, files in os.walk(directory):
+                for filename in files:
+                    engine.get_template(os.path.relpath(os.path.join(root, filename), directory).replace(os.sep, "/"))
+                    count += 1
+    return count
+
+
+def warm_up(force=False):
+    # mysite/wsgi.py・asgi.py から，ワーカーを fork する前 (gunicorn --preload など) に呼ぶ。
+    if not (force or settings.WARMUP_ON_BOOT):
+        return 0
+    import_app_modules()
+    populate_resolver()
+    count = compile_templates()
+    # 接続は fork 先に持ち越さない。
+    connections.close_all()
+    # 起動時に作ったオブジェクトを GC の走査対象から外し，fork 後に GC がページを書き換えてコピーが起きるのを防ぐ。
+    gc.collect()
+    gc.freeze()
+    return count
@@ -0,0 +1,9 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ["id", "name", "status", "attempts", "run_at", "updated_at"]
+    list_filter = ["status", "name"]
@@ -0,0 +1,37 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from jobs.queue import claim, release_stale, run
+
+
+class Command(BaseCommand):
+    help = "データベースのジョブキューを処理するワーカーを起動します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=settings.JOBS_WORKERS)
+        parser.add_argument("--interval", type=float, default=settings.JOBS_POLL_INTERVAL)
+        parser.add_argument("--once", action="store_true", help="実行可能なジョブが無くなったら終了する")
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        released = release_stale()
+        if released:
+            self.stdout.write(f"{released} 件の停止したジョブを再投入しました")
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job") as executor:
+            try:
+                while True:
+                    jobs = claim(workers)
+                    if jobs:
+                        wait([executor.submit(run, job) for job in jobs])
+                        if options["verbosity"] >= 2:
+                            self.stdout.write(f"{len(jobs)} 件のジョブを処理しました")
+                        continue
+                    if options["once"]:
+                        return
+                    time.sleep(options["interval"])
+            except KeyboardInterrupt:
+                self.stdout.write("実行中のジョブの完了を待って終了します")
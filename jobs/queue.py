@@ -0,0 +1,93 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+_release_hooks = {}
+
+
+def register(name, on_release=None):
+    # on_release はワーカーが落ちて release_stale() がジョブを戻すときに，同じ payload で呼ばれる。
+    # ジョブが自分で「実行中」にした行 (DeletionTask など) があれば，ここで一緒に戻す。
+    def decorator(func):
+        _registry[name] = func
+        if on_release is not None:
+            _release_hooks[name] = on_release
+        return func
+
+    return decorator
+
+
+def enqueue(name, **payload):
+    # 呼び出し元のトランザクションがロールバックされた場合はジョブを積まない。
+    if name not in _registry:
+        raise ValueError(f"未登録のジョブです: {name}")
+    transaction.on_commit(lambda: Job.objects.create(name=name, payload=payload))
+
+
+def backoff(attempts):
+    return min(settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1), settings.JOBS_RETRY_MAX_DELAY)
+
+
+def claim(limit):
+    now = timezone.now()
+    claimed = []
+    for job in Job.objects.filter(status=Job.Status.PENDING, run_at__lte=now).order_by("run_at", "id")[:limit]:
+        updated = Job.objects.filter(pk=job.pk, status=Job.Status.PENDING).update(
+            status=Job.Status.RUNNING, attempts=F("attempts") + 1, locked_at=now, updated_at=now
+        )
+        if updated:
+            job.attempts += 1
+            claimed.append(job)
+    return claimed
+
+
+def release_stale():
+    limit = timezone.now() - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+    released = 0
+    for job in Job.objects.filter(status=Job.Status.RUNNING, locked_at__lt=limit):
+        with transaction.atomic():
+            stale = Job.objects.filter(pk=job.pk, status=Job.Status.RUNNING, locked_at__lt=limit)
+            if not stale.update(status=Job.Status.PENDING, locked_at=None):
+                continue
+            on_release = _release_hooks.get(job.name)
+            if on_release is not None:
+                on_release(**job.payload)
+        released += 1
+    return released
+
+
+def run(job):
+    try:
+        func = _registry.get(job.name)
+        if func is None:
+            raise LookupError(f"未登録のジョブです: {job.name}")
+        func(**job.payload)
+    except Exception:
+        logger.exception("ジョブ %s (%s) が失敗しました", job.pk, job.name)
+        _fail(job, traceback.format_exc())
+    else:
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.Status.DONE, locked_at=None, last_error="", updated_at=timezone.now()
+        )
+    finally:
+        close_old_connections()
+
+
+def _fail(job, error):
+    now = timezone.now()
+    if job.attempts >= settings.JOBS_MAX_ATTEMPTS:
+        changes = {"status": Job.Status.FAILED}
+    else:
+        changes = {"status": Job.Status.PENDING, "run_at": now + timedelta(seconds=backoff(job.attempts))}
+    Job.objects.filter(pk=job.pk).update(locked_at=None, last_error=error, updated_at=now, **changes)
@@ -0,0 +1,98 @@
+import io
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from accounts.deletion import schedule_tweet_deletion
+from accounts.models import DeletionTask, User
+from tweets.models import Tweet
+
+from .models import Job
+from .queue import claim, enqueue, register, run
+
+calls = []
+
+
+@register("jobs.tests.record")
+def record(value):
+    calls.append(value)
+
+
+@register("jobs.tests.broken")
+def broken():
+    raise RuntimeError("broken")
+
+
+class TestEnqueue(TestCase):
+    def test_success_enqueue_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue("jobs.tests.record", value=1)
+        job = Job.objects.get()
+        self.assertEqual(job.name, "jobs.tests.record")
+        self.assertEqual(job.payload, {"value": 1})
+        self.assertEqual(job.status, Job.Status.PENDING)
+
+    def test_failure_enqueue_with_unknown_name(self):
+        with self.assertRaises(ValueError):
+            enqueue("jobs.tests.not_exist")
+        self.assertFalse(Job.objects.exists())
+
+
+class TestRun(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_success_run(self):
+        Job.objects.create(name="jobs.tests.record", payload={"value": 1})
+        for job in claim(10):
+            run(job)
+        self.assertEqual(calls, [1])
+        self.assertEqual(Job.objects.get().status, Job.Status.DONE)
+
+    def test_failure_run_retries_with_backoff(self):
+        Job.objects.create(name="jobs.tests.broken")
+        run(claim(1)[0])
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.Status.PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn("RuntimeError", job.last_error)
+        self.assertEqual(claim(1), [])
+
+    @override_settings(JOBS_MAX_ATTEMPTS=1)
+    def test_failure_run_gives_up_after_max_attempts(self):
+        Job.objects.create(name="jobs.tests.broken")
+        run(claim(1)[0])
+        self.assertEqual(Job.objects.get().status, Job.Status.FAILED)
+
+
+class TestRunJobsCommand(TransactionTestCase):
+    def test_success_process_deletion_job(self):
+        user = User.objects.create_user(username="testuser", password="testpassword")
+        tweet = Tweet.objects.create(user=user, content="tweet")
+        schedule_tweet_deletion(tweet)
+        call_command("run_jobs", once=True, workers=1, stdout=io.StringIO())
+        self.assertFalse(Tweet.objects.exists())
+        self.assertEqual(Job.objects.get().status, Job.Status.DONE)
+
+    def test_success_requeue_deletion_job_of_crashed_worker(self):
+        user = User.objects.create_user(username="testuser", password="testpassword")
+        tweet = Tweet.objects.create(user=user, content="tweet")
+        task = schedule_tweet_deletion(tweet)
+        # ジョブとタスクを実行中にしたまま落ちたワーカー。
+        claim(1)
+        DeletionTask.objects.filter(pk=task.pk).update(status=DeletionTask.Status.RUNNING)
+        stale = timezone.now() - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT + 1)
+        Job.objects.update(locked_at=stale)
+
+        out = io.StringIO()
+        call_command("run_jobs", once=True, workers=1, stdout=out)
+        self.assertIn("1 件の停止したジョブを再投入しました", out.getvalue())
+        self.assertFalse(Tweet.objects.exists())
+        task.refresh_from_db()
+        self.assertEqual(task.status, DeletionTask.Status.DONE)
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.Status.DONE, 2))
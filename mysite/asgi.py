@@ -11,6 +11,13 @@ import os
 
 from django.core.asgi import get_asgi_application
 
+from core.warmup import warm_up
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
 
 application = get_asgi_application()
+
+from tweets.counters import buffer  # noqa: E402
+
+buffer.enable()
+warm_up()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -40,16 +41,22 @@ INSTALLED_APPS = [
     "accounts.apps.AccountsConfig",
     "tweets.apps.TweetsConfig",
     "welcome.apps.WelcomeConfig",
+    "jobs.apps.JobsConfig",
+    "core.apps.CoreConfig",
+    "notifications.apps.NotificationsConfig",
 ]
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "core.querylog.QueryLogMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "core.profiling.ProfileMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "core.middleware.DeadlineMiddleware",
 ]
 
 ROOT_URLCONF = "mysite.urls"
@@ -86,6 +93,22 @@ DATABASES = {
 }
 
 
+# Cache
+# レート制限のトークンバケット・除外集合・公開ページ・最新のツイート id は全ワーカーで共有する前提。
+# 本番では REDIS_URL を設定して Redis を使う。未設定のときはプロセスごとの LocMemCache になるので，
+# 1 プロセスで動かす開発用にしか使えない (manage.py check --deploy が警告する)。
+
+REDIS_URL = os.environ.get("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -122,6 +145,15 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+# collectstatic の出力先。DEBUG でないときは指紋付きのファイル名で書き出し，.gz / .br も置く (core.storage)。
+STATIC_ROOT = BASE_DIR / "staticfiles"
+
+if not DEBUG:
+    STATICFILES_STORAGE = "core.storage.CompressedManifestStaticFilesStorage"
+
+# 指紋付きの静的ファイルの max-age (1 年)。
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
@@ -135,6 +167,145 @@ LOGIN_REDIRECT_URL = "tweets:home"
 
 LOGOUT_REDIRECT_URL = "accounts:login"
 
+# Timeline
+
+TIMELINE_PAGE_SIZE = 50
+
+# True にするとホーム・プロフィールのタイムラインを StreamingHttpResponse で少しずつ返す。
+TIMELINE_STREAMING = False
+
+TIMELINE_STREAM_CHUNK_SIZE = 20
+
+# /tweets/api/home/updates/ のポーリング。最新のツイート id はキャッシュに TWEET_WATERMARK_TIMEOUT 秒置く。
+TWEET_WATERMARK_TIMEOUT = 5
+
+TWEET_POLL_INTERVAL = 1.0
+
+TWEET_LONG_POLL_MAX_WAIT = 25
+
+TWEET_LONG_POLL_MAX_WAITERS = 500
+
+# ツイートの詳細に表示する返信の件数と，詳細のツイートから数えた深さの上限。
+THREAD_PAGE_SIZE = 50
+
+THREAD_MAX_DEPTH = 3
+
+# これより古いツイートは python manage.py archive_tweets でアーカイブテーブルに移す。
+TWEET_ARCHIVE_DAYS = 365
+
+# Warm-up
+# mysite/wsgi.py・asgi.py の読み込み時に，URL の解決・テンプレートのコンパイルを済ませてから gc.freeze() する。
+
+WARMUP_ON_BOOT = True
+
+# Like counter
+# True にすると，サーバープロセスではいいね数の増減をためて LIKE_COUNT_FLUSH_INTERVAL 秒ごとにまとめて書き込む。
+
+LIKE_COUNT_WRITE_BEHIND = True
+
+LIKE_COUNT_FLUSH_INTERVAL = 1.0
+
+# Request deadlines
+# URL 名ごとの締め切り (秒)。過ぎると実行中の SQLite のクエリを中断し，503 (X-Degraded: deadline) を返す。
+
+REQUEST_DEADLINES = {
+    "tweets:home": 2.0,
+    "accounts:user_profile": 2.0,
+    "accounts:following_list": 2.0,
+    "accounts:follower_list": 2.0,
+}
+
+# Query log (python manage.py querylog_report で集計する)
+# QUERY_LOG_SLOW_MS 以上かかったクエリと，それ以外の QUERY_LOG_SAMPLE_RATE の割合のクエリを記録する。
+
+QUERY_LOG_ENABLED = not DEBUG
+
+QUERY_LOG_SLOW_MS = 100
+
+QUERY_LOG_SAMPLE_RATE = 0.01
+
+QUERY_LOG_PATH = BASE_DIR / "logs" / "queries.log"
+
+QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+
+QUERY_LOG_BACKUP_COUNT = 5
+
+# Profiling
+# スタッフの ?_profile=1 か，manage.py profile_token が出力する署名付きヘッダーがあるリクエストを cProfile で計測する。
+
+PROFILE_QUERY_FLAG = "_profile"
+
+PROFILE_HEADER = "X-Profile"
+
+PROFILE_TOKEN_MAX_AGE = 3600
+
+PROFILE_DIR = BASE_DIR / "logs" / "profiles"
+
+PROFILE_MAX_FILES = 50
+
+# Public pages
+# ログインしていない閲覧者向けのプロフィール・ツイート詳細・トップページ。
+# PUBLIC_PAGE_MAX_AGE は共有キャッシュ向けの max-age，サーバー側のキャッシュは削除やプロフィールの変更で明示的に消す。
+# 明示的な削除が全ワーカーに効くのは REDIS_URL で共有キャッシュを使うときだけ。
+
+PUBLIC_PAGE_MAX_AGE = 60
+
+PUBLIC_PAGE_CACHE_TIMEOUT = 300
+
+# Mute and block
+# 閲覧者ごとの除外集合は User.exclusions_version を版にしてキャッシュする。EXCLUSION_SQL_LIMIT 人を超えたら NOT IN を使わずに Python で落とす。
+
+EXCLUSION_CACHE_TIMEOUT = 24 * 60 * 60
+
+EXCLUSION_SQL_LIMIT = 100
+
+# Notifications
+# いいね・フォローの通知は宛先・種類・対象ごとに NOTIFICATION_WINDOW 秒単位で 1 件にまとめる。
+
+NOTIFICATION_WINDOW = 3600
+
+NOTIFICATION_RECENT_ACTORS = 3
+
+NOTIFICATIONS_PAGE_SIZE = 20
+
+# Analytics
+# manage.py engagement_stats が id のキーセットで一度に読む行数。大きくするとクエリ数は減るが 1 本あたりの読み込みが重くなる。
+
+ANALYTICS_CHUNK_SIZE = 5000
+
+ANALYTICS_OUTPUT_DIR = BASE_DIR / "analytics"
+
+# Rate limiting
+# スコープごとに IP / ログインユーザー単位のトークンバケットを設定する ("回数/s|m|h|d")。
+
+RATELIMIT_ENABLED = True
+
+RATELIMITS = {
+    "signup": {"ip": "20/h"},
+    "tweet_create": {"user": "30/m", "ip": "120/m"},
+    "like": {"user": "120/m", "ip": "600/m"},
+    "follow": {"user": "60/m", "ip": "300/m"},
+}
+
+# Background jobs (python manage.py run_jobs)
+
+JOBS_WORKERS = 4
+
+JOBS_POLL_INTERVAL = 1.0
+
+JOBS_MAX_ATTEMPTS = 5
+
+JOBS_RETRY_DELAY = 5
+
+JOBS_RETRY_MAX_DELAY = 600
+
+JOBS_LOCK_TIMEOUT = 600
+
+# Deletion tasks
+# 実行中のまま DELETION_TASK_LEASE 秒バッチが進んでいない削除タスクは，落ちたワーカーのものとして取り直す。
+
+DELETION_TASK_LEASE = 600
+
 SQL_DEBUG = False
 
 if SQL_DEBUG:
@@ -17,10 +17,16 @@ from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
 
+from core.views import StaticAssetView
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("accounts/", include("accounts.urls")),
     path("tweets/", include("tweets.urls")),
+    path("notifications/", include("notifications.urls")),
+    path("-/", include("core.urls")),
+    # DEBUG では runserver が先に静的ファイルを返すので，ここに来るのは collectstatic 済みの STATIC_ROOT を配信するときだけ。
+    path(f"{settings.STATIC_URL.strip('/')}/<path:path>", StaticAssetView.as_view(), name="static_asset"),
     path("", include("welcome.urls")),
 ]
 
@@ -0,0 +1,22 @@
+from django.contrib import admin
+
+from core.admin import LargeTableAdmin
+
+from .models import Inbox, Notification
+
+
+@admin.register(Notification)
+class NotificationAdmin(LargeTableAdmin):
+    list_display = ["id", "recipient", "kind", "target_id", "window_start", "updated_at"]
+    list_filter = ["kind"]
+    list_select_related = ["recipient"]
+    raw_id_fields = ["recipient"]
+    exact_search_fields = ["recipient__username", "target_id"]
+
+
+@admin.register(Inbox)
+class InboxAdmin(LargeTableAdmin):
+    list_display = ["user", "unread_count", "read_until"]
+    list_select_related = ["user"]
+    raw_id_fields = ["user"]
+    exact_search_fields = ["user__username"]
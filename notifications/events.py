@@ -0,0 +1,84 @@
+from datetime import datetime
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from accounts.models import FriendShip
+from tweets.models import ArchivedLike, Like
+
+from .models import Inbox, Notification
+
+
+def window_start(now):
+    seconds = settings.NOTIFICATION_WINDOW
+    return datetime.fromtimestamp(now.timestamp() // seconds * seconds, tz=dt_timezone.utc)
+
+
+def source_id(recipient_id, kind, actor, target_id):
+    # 通知のもとになったいいね・フォローの行の id。反映までに取り消されていれば None。
+    if kind == Notification.Kind.FOLLOW:
+        rows = [FriendShip.objects.filter(following_id=recipient_id, follower_id=actor.pk)]
+    else:
+        # 反映までの間にアーカイブされたツイートのいいねは，id を引き継いでアーカイブ側にある。
+        rows = [Like.objects.filter(tweet_id=target_id, user_id=actor.pk)]
+        rows.append(ArchivedLike.objects.filter(tweet_id=target_id, user_id=actor.pk))
+    for queryset in rows:
+        row_id = queryset.values_list("id", flat=True).first()
+        if row_id is not None:
+            return row_id
+    return None
+
+
+def notify(recipient_id, kind, actor, target_id=0):
+    # 1 件ごとに行を増やさず，同じ窓の通知の行の id の範囲と直近の名前を更新する。
+    if recipient_id == actor.pk:
+        return None
+    row_id = source_id(recipient_id, kind, actor, target_id)
+    if row_id is None:
+        return None
+    now = timezone.now()
+    lookup = {"recipient_id": recipient_id, "kind": kind, "target_id": target_id, "window_start": window_start(now)}
+    with transaction.atomic():
+        # 通知の行をロックして読むので，同時に来た通知が直近の名前を古い値で上書きし合わない。
+        notification, created = Notification.objects.select_for_update().get_or_create(
+            **lookup, defaults={"first_source_id": row_id, "last_source_id": row_id, "updated_at": now}
+        )
+        if not created and notification.first_source_id <= row_id <= notification.last_source_id:
+            # 範囲内の行はもう数えられる (バッファが同じいいねを 2 度反映したなど)。
+            return notification
+        names = [name for name in notification.recent_actors if name != actor.username]
+        recent_actors = [actor.username, *names][: settings.NOTIFICATION_RECENT_ACTORS]
+        Notification.objects.filter(pk=notification.pk).update(
+            first_source_id=min(notification.first_source_id, row_id),
+            last_source_id=max(notification.last_source_id, row_id),
+            recent_actors=recent_actors,
+            updated_at=now,
+        )
+        inbox, _ = Inbox.objects.get_or_create(user_id=recipient_id)
+        # 既読だった (または新しい) 通知が更新されたときだけ未読数を増やす。
+        if created or (inbox.read_until is not None and notification.updated_at <= inbox.read_until):
+            Inbox.objects.filter(pk=recipient_id).update(unread_count=F("unread_count") + 1)
+    return notification
+
+
+def notify_like(tweet, actor):
+    return notify(tweet.user_id, Notification.Kind.LIKE, actor, tweet.pk)
+
+
+def notify_follow(following, actor):
+    return notify(following.pk, Notification.Kind.FOLLOW, actor)
+
+
+def unread_count(user):
+    return Inbox.objects.filter(user=user).values_list("unread_count", flat=True).first() or 0
+
+
+def mark_read(user):
+    # 未読の通知を 1 行ずつ更新せず，既読の境目の時刻だけを進める。
+    now = timezone.now()
+    read_until = Inbox.objects.filter(user=user).values_list("read_until", flat=True).first()
+    Inbox.objects.update_or_create(user=user, defaults={"unread_count": 0, "read_until": now})
+    return read_until
@@ -0,0 +1,27 @@
+# Generated by Django 4.1.13 on 2026-10-19 07:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="notification",
+            name="actor_count",
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="first_source_id",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="last_source_id",
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.db import models
+
+
+class Notification(models.Model):
+    # 同じ宛先・種類・対象への通知を NOTIFICATION_WINDOW 秒ごとに 1 行へまとめる。
+    class Kind(models.TextChoices):
+        LIKE = "like", "いいね"
+        FOLLOW = "follow", "フォロー"
+
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="notifications")
+    kind = models.CharField(max_length=6, choices=Kind.choices)
+    # いいねは対象のツイート id (アーカイブ後も残るよう外部キーにはしない)，フォローは 0。
+    target_id = models.BigIntegerField(default=0)
+    window_start = models.DateTimeField()
+    # 窓の間に通知したいいね (Like)・フォロー (FriendShip) の行の id の範囲。人数は表示するときにこの範囲の行から数える。
+    # いいねの付け直しは (ツイート, 人) ごとに 1 行なので二重に数えず，人ごとの行を別に持たなくて済む。
+    first_source_id = models.BigIntegerField(default=0)
+    last_source_id = models.BigIntegerField(default=0)
+    # 表示用に直近の数人だけを新しい順に持つ。
+    recent_actors = models.JSONField(default=list)
+    updated_at = models.DateTimeField()
+
+    def actors_display(self):
+        # actor_count は views.count_actors() で付ける。
+        names = self.recent_actors[:2]
+        others = self.actor_count - len(names)
+        return "、".join(names) + (f" と他 {others} 人" if others > 0 else "")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["recipient", "kind", "target_id", "window_start"], name="notification_window_unique"
+            ),
+        ]
+
+
+class Inbox(models.Model):
+    # read_until より後に更新された通知が未読。既読にするときは read_until を進めるだけで済む。
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True)
+    unread_count = models.PositiveIntegerField(default=0)
+    read_until = models.DateTimeField(null=True, blank=True)
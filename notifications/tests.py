@@ -0,0 +1,147 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.deletion import process_pending, schedule_user_deletion
+from accounts.models import User
+from tweets.archive import archive_tweets
+from tweets.models import Like, Tweet
+
+from . import events
+from .models import Inbox, Notification
+from .views import count_actors
+
+
+class TestNotifications(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="testuser1", password="testpassword")
+        self.tweet = Tweet.objects.create(user=self.user1, content="tweet")
+        self.actors = [User.objects.create_user(username=f"actor{i}", password="testpassword") for i in range(4)]
+
+    def like(self, actor):
+        self.client.force_login(actor)
+        return self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+
+    def notification(self):
+        notification = Notification.objects.get()
+        count_actors([notification])
+        return notification
+
+    def test_success_likes_in_same_window_are_aggregated(self):
+        for actor in self.actors:
+            self.like(actor)
+        notification = self.notification()
+        self.assertEqual(notification.kind, Notification.Kind.LIKE)
+        self.assertEqual(notification.target_id, self.tweet.pk)
+        self.assertEqual(notification.actor_count, 4)
+        self.assertEqual(notification.recent_actors, ["actor3", "actor2", "actor1"])
+        self.assertEqual(notification.actors_display(), "actor3、actor2 と他 2 人")
+        self.assertEqual(events.unread_count(self.user1), 1)
+
+    def test_success_relike_not_double_counted(self):
+        self.like(self.actors[0])
+        self.client.post(reverse("tweets:unlike", kwargs={"pk": self.tweet.pk}))
+        self.like(self.actors[0])
+        self.assertEqual(self.notification().actor_count, 1)
+
+    def test_success_relike_after_dropping_out_of_recent_actors(self):
+        for actor in self.actors:
+            self.like(actor)
+        self.like(self.actors[0])
+        self.client.post(reverse("tweets:unlike", kwargs={"pk": self.tweet.pk}))
+        self.like(self.actors[0])
+        notification = self.notification()
+        self.assertEqual(notification.actor_count, 4)
+        # 付け直した人は名前が先頭に移るだけで，人数は増えない。
+        self.assertEqual(notification.recent_actors, ["actor0", "actor3", "actor2"])
+
+    def test_success_count_drops_when_like_is_retracted(self):
+        for actor in self.actors[:2]:
+            self.like(actor)
+        self.client.post(reverse("tweets:unlike", kwargs={"pk": self.tweet.pk}))
+        self.assertEqual(self.notification().actor_count, 1)
+
+    def test_success_retracted_like_not_notified(self):
+        self.assertIsNone(events.notify_like(self.tweet, self.actors[0]))
+        self.assertFalse(Notification.objects.exists())
+
+    def test_success_self_like_not_notified(self):
+        self.like(self.user1)
+        self.assertFalse(Notification.objects.exists())
+
+    def test_success_new_window_creates_new_notification(self):
+        self.like(self.actors[0])
+        later = timezone.now() + timedelta(seconds=3600)
+        with mock.patch("notifications.events.timezone.now", return_value=later):
+            self.like(self.actors[1])
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(events.unread_count(self.user1), 2)
+
+    def test_success_follow_notified(self):
+        for actor in self.actors[:2]:
+            self.client.force_login(actor)
+            self.client.post(reverse("accounts:follow", kwargs={"username": "testuser1"}))
+        notification = self.notification()
+        self.assertEqual(notification.kind, Notification.Kind.FOLLOW)
+        self.assertEqual(notification.actor_count, 2)
+
+    def test_success_inbox_marks_read(self):
+        self.like(self.actors[0])
+        self.client.force_login(self.user1)
+        response = self.client.get(reverse("notifications:unread_count"))
+        self.assertEqual(response.json(), {"unread_count": 1})
+
+        response = self.client.get(reverse("notifications:inbox"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "notifications/inbox.html")
+        [notification] = response.context["notifications"]
+        self.assertTrue(notification.unread)
+        self.assertEqual(notification.tweet_content, "tweet")
+        self.assertContains(response, "actor0 があなたのツイートにいいねしました")
+        self.assertEqual(events.unread_count(self.user1), 0)
+
+        response = self.client.get(reverse("notifications:inbox"))
+        self.assertFalse(response.context["notifications"][0].unread)
+
+        # 既読になった通知に新しい人が加わると，また未読として数える。
+        self.like(self.actors[1])
+        self.like(self.actors[2])
+        self.assertEqual(events.unread_count(self.user1), 1)
+
+    def test_success_inbox_with_cursor(self):
+        others = [Tweet.objects.create(user=self.user1, content=f"tweet{i}") for i in range(3)]
+        for tweet in others:
+            Like.objects.create(tweet=tweet, user=self.actors[0])
+            events.notify_like(tweet, self.actors[0])
+        self.client.force_login(self.user1)
+        response = self.client.get(reverse("notifications:inbox"), {"limit": 2})
+        self.assertEqual([n.tweet_content for n in response.context["notifications"]], ["tweet2", "tweet1"])
+        response = self.client.get(
+            reverse("notifications:inbox"), {"limit": 2, "before": response.context["next_cursor"]}
+        )
+        self.assertEqual([n.tweet_content for n in response.context["notifications"]], ["tweet0"])
+        self.assertIsNone(response.context["next_cursor"])
+
+    def test_success_inbox_shows_archived_tweet(self):
+        self.like(self.actors[0])
+        Tweet.objects.filter(pk=self.tweet.pk).update(created_at=timezone.now() - timedelta(days=400))
+        archive_tweets(timedelta(days=365))
+        self.client.force_login(self.user1)
+        response = self.client.get(reverse("notifications:inbox"))
+        self.assertEqual(response.context["notifications"][0].tweet_content, "tweet")
+
+    def test_success_user_deletion_removes_notifications(self):
+        self.like(self.actors[0])
+        self.client.force_login(self.user1)
+        self.client.get(reverse("notifications:inbox"))
+        schedule_user_deletion(self.user1)
+        process_pending()
+        self.assertFalse(Notification.objects.exists())
+        self.assertFalse(Inbox.objects.exists())
+
+    def test_failure_get_without_login(self):
+        response = self.client.get(reverse("notifications:inbox"))
+        self.assertEqual(response.status_code, 302)
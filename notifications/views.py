@@ -0,0 +1,79 @@
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db.models import Count, Q
+from django.http import JsonResponse
+from django.views.generic import TemplateView, View
+
+from accounts.models import FriendShip
+from tweets import timeline
+from tweets.models import ArchivedLike, ArchivedTweet, Like, Tweet
+
+from . import events
+from .models import Notification
+
+
+def tweet_contents(tweet_ids):
+    contents = dict(Tweet.objects.filter(pk__in=tweet_ids).values_list("id", "content"))
+    missing = set(tweet_ids) - contents.keys()
+    if missing:
+        contents.update(ArchivedTweet.objects.filter(pk__in=missing).values_list("id", "content"))
+    return contents
+
+
+def count_actors(notifications):
+    # 通知ごとに，id の範囲内で今も残っているいいね・フォローの行を数える。種類ごとに 1 本の集計クエリで済ませる。
+    sources = {
+        Notification.Kind.LIKE: ((Like, ArchivedLike), "tweet_id", "target_id"),
+        Notification.Kind.FOLLOW: ((FriendShip,), "following_id", "recipient_id"),
+    }
+    for kind, (models, field, attr) in sources.items():
+        ranges = {
+            n.pk: Q(**{field: getattr(n, attr)}, id__range=(n.first_source_id, n.last_source_id))
+            for n in notifications
+            if n.kind == kind
+        }
+        if not ranges:
+            continue
+        totals = dict.fromkeys(ranges, 0)
+        for model in models:
+            counts = model.objects.filter(reduce(or_, ranges.values())).aggregate(
+                **{f"n{pk}": Count("id", filter=q) for pk, q in ranges.items()}
+            )
+            for pk in ranges:
+                totals[pk] += counts[f"n{pk}"]
+        for notification in notifications:
+            if notification.kind == kind:
+                notification.actor_count = totals[notification.pk]
+
+
+class InboxView(LoginRequiredMixin, TemplateView):
+    template_name = "notifications/inbox.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        before, limit = timeline.parse_page_args(self.request)
+        limit = limit or settings.NOTIFICATIONS_PAGE_SIZE
+        queryset = Notification.objects.filter(recipient=self.request.user)
+        if before is not None:
+            queryset = queryset.filter(id__lt=before)
+        notifications = list(queryset.order_by("-id")[: limit + 1])
+        next_cursor = notifications[limit - 1].pk if len(notifications) > limit else None
+        notifications = notifications[:limit]
+
+        # 表示した時点で全件を既読にし，未読の印はそれまでの read_until と比べて付ける。
+        read_until = events.mark_read(self.request.user)
+        contents = tweet_contents([n.target_id for n in notifications if n.kind == Notification.Kind.LIKE])
+        count_actors(notifications)
+        for notification in notifications:
+            notification.unread = read_until is None or notification.updated_at > read_until
+            notification.tweet_content = contents.get(notification.target_id)
+        context.update(notifications=notifications, next_cursor=next_cursor)
+        return context
+
+
+class UnreadCountView(LoginRequiredMixin, View):
+    def get(self, request, *args, **kwargs):
+        return JsonResponse({"unread_count": events.unread_count(request.user)})
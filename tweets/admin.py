@@ -1,6 +1,33 @@
 from django.contrib import admin
 
-from .models import Like, Tweet
+from core.admin import LargeTableAdmin
 
-admin.site.register(Tweet)
-admin.site.register(Like)
+from .models import ArchivedLike, ArchivedTweet, Like, Tweet
+
+
+@admin.register(Tweet)
+class TweetAdmin(LargeTableAdmin):
+    list_display = ["id", "user", "content", "like_count", "is_deleted", "created_at"]
+    list_filter = ["is_deleted"]
+    list_select_related = ["user"]
+    raw_id_fields = ["user"]
+    exact_search_fields = ["pk", "user__username"]
+
+
+@admin.register(Like)
+class LikeAdmin(LargeTableAdmin):
+    list_display = ["id", "tweet_id", "user"]
+    list_select_related = ["user"]
+    raw_id_fields = ["tweet", "user"]
+    exact_search_fields = ["tweet_id", "user__username"]
+
+
+@admin.register(ArchivedTweet)
+class ArchivedTweetAdmin(TweetAdmin):
+    list_display = ["id", "user", "content", "like_count", "created_at"]
+    list_filter = []
+
+
+@admin.register(ArchivedLike)
+class ArchivedLikeAdmin(LikeAdmin):
+    pass
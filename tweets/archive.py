@@ -0,0 +1,41 @@
+from itertools import takewhile
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedLike, ArchivedTweet, Like, Tweet
+
+BATCH_SIZE = 500
+
+
+def archive_tweets(older_than, batch_size=BATCH_SIZE):
+    # id の小さい順にたどり，older_than より新しいツイートに当たったところで止める。
+    # こうするとアーカイブ側の id は常にホット側より小さくなり，カーソルがホット側を越えたときだけアーカイブを読めば済む。
+    cutoff = timezone.now() - older_than
+    last_id = archived = 0
+    while True:
+        with transaction.atomic():
+            rows = Tweet.objects.filter(id__gt=last_id).order_by("id").values_list("id", "created_at", "is_deleted")
+            rows = list(rows[:batch_size])
+            expired = list(takewhile(lambda row: row[1] < cutoff, rows))
+            # 削除予約済みのツイートは accounts.deletion に任せる。
+            archived += _archive_batch([tweet_id for tweet_id, _, is_deleted in expired if not is_deleted])
+        if len(expired) < batch_size:
+            return archived
+        last_id = expired[-1][0]
+
+
+def _archive_batch(ids):
+    if not ids:
+        return 0
+    columns = ("id", "user_id", "content", "created_at", "like_count", "path", "reply_count")
+    tweets = Tweet.objects.filter(pk__in=ids).values_list(*columns)
+    ArchivedTweet.objects.bulk_create(ArchivedTweet(**dict(zip(columns, row))) for row in tweets)
+    likes = Like.objects.filter(tweet_id__in=ids)
+    ArchivedLike.objects.bulk_create(
+        ArchivedLike(id=like_id, tweet_id=tweet_id, user_id=user_id)
+        for like_id, tweet_id, user_id in likes.values_list("id", "tweet_id", "user_id")
+    )
+    likes.delete()
+    count, _ = Tweet._base_manager.filter(pk__in=ids).delete()
+    return count
@@ -0,0 +1,152 @@
+import atexit
+import logging
+import os
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from accounts import stats
+from accounts.models import User
+from notifications import events
+from notifications.models import Notification
+
+from .models import ArchivedTweet, Tweet
+
+logger = logging.getLogger(__name__)
+
+
+def apply_delta(tweet_id, delta):
+    values = {"like_count": Greatest(F("like_count") + delta, 0)}
+    updated = Tweet.objects.filter(pk=tweet_id).update(**values)
+    if not updated:
+        # 反映までの間にアーカイブされたツイートはアーカイブ側に足す。
+        updated = ArchivedTweet.objects.filter(pk=tweet_id).update(**values)
+    return updated
+
+
+def apply_deltas(model, deltas):
+    # 管理コマンドや削除ジョブが増減させたいいねを反映する。集計し直すとバッファ中の増減と二重に数えてしまうので，
+    # 差分で足す。増減の値が同じツイートは 1 本の UPDATE にまとめる。
+    tweet_ids = defaultdict(list)
+    for tweet_id, delta in deltas.items():
+        if delta:
+            tweet_ids[delta].append(tweet_id)
+    for delta, ids in tweet_ids.items():
+        model.objects.filter(pk__in=ids).update(like_count=Greatest(F("like_count") + delta, 0))
+
+
+def apply_like(tweet_id, author_id, actor, delta):
+    # いいね 1 件ぶんの，ツイートと投稿者の行への書き込み。
+    apply_delta(tweet_id, delta)
+    stats.record_like(author_id, delta)
+    User.objects.touch([author_id])
+    if delta > 0:
+        events.notify(author_id, Notification.Kind.LIKE, actor, tweet_id)
+
+
+class LikeCounterBuffer:
+    # いいね数・投稿者の集計と activity_at・いいねの通知は，人気のツイートやその投稿者の行に書き込みが集中する。
+    # これらをプロセス内にためて，バックグラウンドスレッドがまとめて書く。リクエストで書くのは Like 行といいねした人の行だけ。
+    # mysite/wsgi.py・asgi.py が enable() したプロセスだけが対象で，管理コマンドやテストではその場で書く。
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.reset()
+        self.pid = None
+        self.stopping = threading.Event()
+
+    def reset(self):
+        # ツイートごとのいいね数，投稿者ごとの受けたいいね数の増減と，通知する (ツイート, 投稿者, いいねした人)。
+        self.pending = Counter()
+        self.received = Counter()
+        self.likes = []
+
+    def enable(self):
+        self.enabled = settings.LIKE_COUNT_WRITE_BEHIND
+
+    def record(self, tweet, actor, delta):
+        if not self.enabled:
+            apply_like(tweet.pk, tweet.user_id, actor, delta)
+            return
+        # Like 行がコミットされたときだけ数える。
+        transaction.on_commit(lambda: self.add(tweet.pk, delta, tweet.user_id, actor))
+
+    def add(self, tweet_id, delta, author_id=None, actor=None):
+        self.ensure_thread()
+        with self.lock:
+            self.pending[tweet_id] += delta
+            if author_id is not None:
+                self.received[author_id] += delta
+                if actor is not None and delta > 0:
+                    self.likes.append((tweet_id, author_id, actor))
+
+    def current(self, tweet_id, stored):
+        return max(stored + self.pending.get(tweet_id, 0), 0)
+
+    def flush(self):
+        with self.lock:
+            pending, received, likes = self.pending, self.received, self.likes
+            self.reset()
+        flushed = 0
+        for tweet_id, delta in pending.items():
+            if not delta:
+                continue
+            try:
+                apply_delta(tweet_id, delta)
+                flushed += 1
+            except Exception:
+                logger.exception("いいね数の反映に失敗しました (tweet %s, %+d)", tweet_id, delta)
+                with self.lock:
+                    self.pending[tweet_id] += delta
+        for author_id, delta in received.items():
+            try:
+                if delta:
+                    stats.record_like(author_id, delta)
+            except Exception:
+                logger.exception("受けたいいね数の反映に失敗しました (user %s, %+d)", author_id, delta)
+                with self.lock:
+                    self.received[author_id] += delta
+        try:
+            # 条件付き GET のため，いいね数が変わったツイートの投稿者を 1 本の UPDATE でまとめて更新する。
+            if received:
+                User.objects.touch(list(received))
+        except Exception:
+            logger.exception("投稿者の activity_at の更新に失敗しました")
+        for tweet_id, author_id, actor in likes:
+            try:
+                events.notify(author_id, Notification.Kind.LIKE, actor, tweet_id)
+            except Exception:
+                # notify() は 1 つのトランザクションなので，失敗したものはそのままやり直せる。
+                logger.exception("いいねの通知に失敗しました (tweet %s)", tweet_id)
+                with self.lock:
+                    self.likes.append((tweet_id, author_id, actor))
+        return flushed
+
+    def ensure_thread(self):
+        # fork 前に作ったスレッドは子プロセスに引き継がれないので，プロセスごとに最初の記録で起動する。
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.reset()
+            self.stopping = threading.Event()
+            threading.Thread(target=self.run, name="like-counter-flush", daemon=True).start()
+            atexit.register(self.stop)
+
+    def run(self):
+        while not self.stopping.wait(settings.LIKE_COUNT_FLUSH_INTERVAL):
+            self.flush()
+            close_old_connections()
+
+    def stop(self):
+        self.stopping.set()
+        self.flush()
+
+
+buffer = LikeCounterBuffer()
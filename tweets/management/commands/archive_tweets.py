@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tweets.archive import BATCH_SIZE, archive_tweets
+
+
+class Command(BaseCommand):
+    help = "古いツイートとそのいいねをアーカイブテーブルに移します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.TWEET_ARCHIVE_DAYS)
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options["days"] < 0 or options["batch_size"] < 1:
+            raise CommandError("--days は 0 以上，--batch-size は 1 以上を指定してください。")
+        count = archive_tweets(timedelta(days=options["days"]), options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"{count} 件のツイートをアーカイブしました"))
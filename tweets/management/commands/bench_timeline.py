@@ -0,0 +1,92 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from accounts.models import User
+from tweets import timeline
+from tweets.models import Like, Tweet
+
+
+class Command(BaseCommand):
+    help = "タイムラインの HTML / JSON / 読み込み層のツイート 1 件あたりのコストを計測します (データはロールバックされます)。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tweets", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        repeat = options["repeat"]
+        # HTML は全件を 1 ページに載せて，1k 件のカードを描画するコストを測る。
+        with override_settings(ALLOWED_HOSTS=["testserver"], TIMELINE_PAGE_SIZE=options["tweets"] * 2):
+            with transaction.atomic():
+                client, viewer = self.setup(options["tweets"])
+                count = Tweet.objects.visible().count()
+                pages = [
+                    ("HTML (tweets:home)", self.measure(lambda: self.get_html(client), repeat)),
+                    ("JSON (tweets:api_home)", self.measure(lambda: self.get_json(client), repeat)),
+                ]
+                reads = [
+                    ("Tweet instances", self.measure(lambda: self.load_instances(viewer), repeat)),
+                    ("TimelineCard", self.measure(lambda: self.load_cards(viewer), repeat)),
+                ]
+                transaction.set_rollback(True)
+
+        self.stdout.write(f"{count} tweets")
+        for label, (seconds, peak) in pages + reads:
+            self.stdout.write(
+                f"{label:<24} {seconds * 1000:9.1f} ms {seconds / count * 1e6:9.1f} us/tweet "
+                f"{peak / 1024:9.1f} KiB peak {peak / count:7.0f} B/tweet"
+            )
+        self.stdout.write(f"JSON / HTML = {pages[1][1][0] / pages[0][1][0]:.2f}")
+
+    def setup(self, count):
+        author = User.objects.create_user(username="bench_author", password="bench-password")
+        viewer = User.objects.create_user(username="bench_viewer", password="bench-password")
+        tweets = Tweet.objects.bulk_create(Tweet(user=author, content=f"bench tweet {i}") for i in range(count))
+        Like.objects.bulk_create(Like(tweet=tweet, user=viewer) for tweet in tweets[::2])
+        Tweet.objects.filter(user=author).refresh_like_counts()
+        client = Client()
+        client.force_login(viewer)
+        return client, viewer
+
+    def measure(self, func, repeat):
+        func()
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - started)
+        # 時間計測とは別に 1 回だけ tracemalloc 下で実行し，ピークのメモリ使用量を取る。
+        tracemalloc.start()
+        result = func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del result
+        return best, peak
+
+    def load_instances(self, viewer):
+        # 以前のビューと同じく，User を JOIN し Like を prefetch したモデルインスタンスを作る。
+        tweets = list(Tweet.objects.visible().select_related("user").prefetch_related("likes").order_by("-id"))
+        liked = set(Like.objects.filter(user=viewer).values_list("tweet_id", flat=True))
+        return tweets, liked
+
+    def load_cards(self, viewer):
+        rows, _ = timeline.fetch_rows(timeline.home_queryset(), limit=Tweet.objects.count())
+        return timeline.build_cards(rows, timeline.liked_ids(viewer, [row[0] for row in rows]))
+
+    def get_html(self, client):
+        client.get(reverse("tweets:home"))
+
+    def get_json(self, client):
+        # HTML と同じ件数を読むまでカーソルをたどる。
+        url = reverse("tweets:api_home")
+        cursor = None
+        while True:
+            data = client.get(url, {"before": cursor, "limit": 200} if cursor else {"limit": 200}).json()
+            cursor = data["next"]
+            if cursor is None:
+                return
@@ -0,0 +1,228 @@
+import csv
+import json
+import os
+import sys
+import time
+from collections import Counter
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.utils.dateparse import parse_datetime
+
+from accounts import stats
+from accounts.models import FriendShip, User
+from tweets import counters, watermark
+from tweets.forms import TweetCreateForm
+from tweets.models import Like, Tweet
+
+
+class UsernameCache:
+    def __init__(self):
+        self.ids = {}
+
+    def resolve(self, usernames):
+        missing = {name for name in usernames if name and name not in self.ids}
+        if missing:
+            found = dict(User.objects.filter(username__in=missing).values_list("username", "id"))
+            for name in missing:
+                self.ids[name] = found.get(name)
+        return self.ids
+
+
+class Command(BaseCommand):
+    help = "NDJSON/CSV からツイート・いいね・フォローを一括で取り込みます。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="入力ファイル (標準入力は -)")
+        parser.add_argument("--kind", choices=["tweets", "likes", "follows"], required=True)
+        parser.add_argument("--format", choices=["ndjson", "csv"])
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--checkpoint", help="再開用チェックポイントファイル (既定: <path>.checkpoint)")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("csv" if path.endswith(".csv") else "ndjson")
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size は 1 以上を指定してください。")
+        checkpoint = options["checkpoint"] or (None if path == "-" else path + ".checkpoint")
+
+        self.usernames = UsernameCache()
+        self.content_field = TweetCreateForm.base_fields["content"]
+        write_chunk = getattr(self, "write_" + options["kind"])
+
+        done = self.read_checkpoint(checkpoint)
+        if done:
+            self.stdout.write(f"チェックポイントから再開します: {done} 行目以降")
+
+        stream = sys.stdin if path == "-" else open(path, encoding="utf-8", newline="")
+        try:
+            rows = islice(self.read_rows(stream, fmt), done, None)
+            imported = skipped = 0
+            started = time.perf_counter()
+            while True:
+                chunk = list(islice(rows, batch_size))
+                if not chunk:
+                    break
+                errors = [(line, "JSON の形式が不正です。") for line, row in chunk if row is None]
+                with transaction.atomic():
+                    written, invalid = write_chunk([(line, row) for line, row in chunk if row is not None])
+                errors += invalid
+                done += len(chunk)
+                self.write_checkpoint(checkpoint, done)
+                imported += written
+                skipped += len(errors)
+                for line, error in errors:
+                    self.stderr.write(f"{line} 行目をスキップしました: {error}")
+                if options["verbosity"] >= 2:
+                    self.stdout.write(f"{done} 行処理 ({self.rate(imported, started):.0f} rows/s)")
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        watermark.invalidate()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{imported} 件取り込みました (スキップ {skipped} 件, {self.rate(imported, started):.0f} rows/s)"
+            )
+        )
+
+    def read_rows(self, stream, fmt):
+        if fmt == "csv":
+            for line, row in enumerate(csv.DictReader(stream), start=2):
+                yield line, row
+            return
+        for line, text in enumerate(stream, start=1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError:
+                row = None
+            yield line, row if isinstance(row, dict) else None
+
+    def read_checkpoint(self, checkpoint):
+        if not checkpoint or not os.path.exists(checkpoint):
+            return 0
+        with open(checkpoint, encoding="utf-8") as f:
+            try:
+                return int(f.read().strip() or 0)
+            except ValueError:
+                raise CommandError(f"チェックポイントファイルが壊れています: {checkpoint}")
+
+    def write_checkpoint(self, checkpoint, done):
+        if not checkpoint:
+            return
+        tmp = checkpoint + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(done))
+        os.replace(tmp, checkpoint)
+
+    def rate(self, count, started):
+        return count / max(time.perf_counter() - started, 1e-9)
+
+    def write_tweets(self, chunk):
+        user_ids = self.usernames.resolve(row.get("username") for _, row in chunk)
+        tweets, created_ats, errors = [], [], []
+        for line, row in chunk:
+            user_id = user_ids.get(row.get("username"))
+            if user_id is None:
+                errors.append((line, "ユーザーが存在しません。"))
+                continue
+            try:
+                content = self.content_field.clean(row.get("content"))
+            except ValidationError as e:
+                errors.append((line, " ".join(e.messages)))
+                continue
+            try:
+                created_at = parse_datetime(row["created_at"]) if row.get("created_at") else None
+            except ValueError:
+                created_at = None
+            if row.get("created_at") and created_at is None:
+                errors.append((line, "created_at の形式が不正です。"))
+                continue
+            tweets.append(Tweet(user_id=user_id, content=content))
+            created_ats.append(created_at)
+
+        Tweet.objects.bulk_create(tweets)
+        # auto_now_add は bulk_create でも上書きされるため，元データの投稿日時は後から書き戻す。
+        restored = []
+        for tweet, created_at in zip(tweets, created_ats):
+            if created_at is not None:
+                tweet.created_at = created_at
+                restored.append(tweet)
+        if restored:
+            Tweet.objects.bulk_update(restored, ["created_at"])
+        User.objects.touch({tweet.user_id for tweet in tweets})
+        stats.repair({tweet.user_id for tweet in tweets})
+        return len(tweets), errors
+
+    def write_likes(self, chunk):
+        user_ids = self.usernames.resolve(row.get("username") for _, row in chunk)
+        tweet_ids = set()
+        for _, row in chunk:
+            tweet_ids.add(self.parse_id(row.get("tweet_id")))
+        existing = set(Tweet.objects.filter(id__in=tweet_ids - {None}).values_list("id", flat=True))
+
+        likes, errors = [], []
+        for line, row in chunk:
+            user_id = user_ids.get(row.get("username"))
+            tweet_id = self.parse_id(row.get("tweet_id"))
+            if user_id is None:
+                errors.append((line, "ユーザーが存在しません。"))
+            elif tweet_id not in existing:
+                errors.append((line, "ツイートが存在しません。"))
+            else:
+                likes.append(Like(tweet_id=tweet_id, user_id=user_id))
+        # いいね数を集計し直すとサーバーのバッファ中の増減と二重に数えるので，既存のいいねを除いて挿入し，
+        # 実際に挿入した件数を差分で足す。
+        pairs = {(like.tweet_id, like.user_id) for like in likes}
+        while True:
+            existing = Like.objects.filter(
+                tweet_id__in={tweet_id for tweet_id, _ in pairs}, user_id__in={user_id for _, user_id in pairs}
+            )
+            existing = set(existing.values_list("tweet_id", "user_id"))
+            new = [Like(tweet_id=tweet_id, user_id=user_id) for tweet_id, user_id in pairs - existing]
+            try:
+                with transaction.atomic():
+                    Like.objects.bulk_create(new)
+                break
+            except IntegrityError:
+                # 取り込みの間に同じいいねが付いたので，読み直してやり直す。
+                continue
+        counters.apply_deltas(Tweet, Counter(like.tweet_id for like in new))
+        tweets = Tweet.objects.filter(pk__in={like.tweet_id for like in new})
+        User.objects.touch(tweets.values("user_id"))
+        User.objects.touch({like.user_id for like in new})
+        stats.repair(tweets.values_list("user_id", flat=True).distinct())
+        return len(likes), errors
+
+    def write_follows(self, chunk):
+        names = []
+        for _, row in chunk:
+            names += [row.get("follower"), row.get("following")]
+        user_ids = self.usernames.resolve(names)
+
+        friendships, errors = [], []
+        for line, row in chunk:
+            follower_id = user_ids.get(row.get("follower"))
+            following_id = user_ids.get(row.get("following"))
+            if follower_id is None or following_id is None:
+                errors.append((line, "ユーザーが存在しません。"))
+            elif follower_id == following_id:
+                errors.append((line, "自分自身はフォローできません。"))
+            else:
+                friendships.append(FriendShip(follower_id=follower_id, following_id=following_id))
+        FriendShip.objects.bulk_create(friendships, ignore_conflicts=True)
+        User.objects.touch({f.follower_id for f in friendships} | {f.following_id for f in friendships})
+        return len(friendships), errors
+
+    def parse_id(self, value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-19 05:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0005_alter_like_tweet_alter_like_user"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tweet",
+            name="is_deleted",
+            field=models.BooleanField(default=False),
+        ),
+    ]
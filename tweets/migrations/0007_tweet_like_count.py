@@ -0,0 +1,28 @@
+# Generated by Django 4.1.13 on 2026-10-19 05:33
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_like_count(apps, schema_editor):
+    Like = apps.get_model("tweets", "Like")
+    Tweet = apps.get_model("tweets", "Tweet")
+    likes = Like.objects.filter(tweet=OuterRef("pk")).order_by().values("tweet").annotate(count=Count("*"))
+    Tweet.objects.update(like_count=Coalesce(Subquery(likes.values("count")), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0006_tweet_is_deleted"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tweet",
+            name="like_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_like_count, migrations.RunPython.noop),
+    ]
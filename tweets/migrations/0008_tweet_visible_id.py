@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-19 05:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0007_tweet_like_count"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="tweet",
+            index=models.Index(condition=models.Q(("is_deleted", False)), fields=["-id"], name="tweet_visible_id"),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.1.13 on 2026-10-19 05:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("tweets", "0008_tweet_visible_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedTweet",
+            fields=[
+                ("id", models.IntegerField(primary_key=True, serialize=False)),
+                ("content", models.TextField(max_length=255)),
+                ("created_at", models.DateTimeField()),
+                ("like_count", models.PositiveIntegerField(default=0)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_tweets",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ArchivedLike",
+            fields=[
+                ("id", models.IntegerField(primary_key=True, serialize=False)),
+                (
+                    "tweet",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="likes", to="tweets.archivedtweet"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_likes",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="archivedlike",
+            constraint=models.UniqueConstraint(fields=("tweet", "user"), name="unique_archived_like"),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1.13 on 2026-10-19 05:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0009_archivedtweet_archivedlike"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="archivedlike",
+            index=models.Index(fields=["tweet", "id", "user"], name="archived_like_tweet_id_user"),
+        ),
+        migrations.AddIndex(
+            model_name="like",
+            index=models.Index(fields=["tweet", "id", "user"], name="like_tweet_id_user"),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.1.13 on 2026-10-19 06:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0010_like_tweet_id_user"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="archivedtweet",
+            name="path",
+            field=models.CharField(blank=True, max_length=500, null=True),
+        ),
+        migrations.AddField(
+            model_name="archivedtweet",
+            name="reply_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="tweet",
+            name="path",
+            field=models.CharField(blank=True, max_length=500, null=True),
+        ),
+        migrations.AddField(
+            model_name="tweet",
+            name="reply_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="archivedtweet",
+            index=models.Index(
+                condition=models.Q(("path__isnull", False)), fields=["path"], name="archived_tweet_reply_path"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tweet",
+            index=models.Index(condition=models.Q(("path__isnull", False)), fields=["path"], name="tweet_reply_path"),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.1.13 on 2026-10-19 06:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0011_tweet_path_reply_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="archivedtweet",
+            name="is_deleted",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name="archivedlike",
+            name="id",
+            field=models.BigIntegerField(primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name="archivedtweet",
+            name="id",
+            field=models.BigIntegerField(primary_key=True, serialize=False),
+        ),
+        migrations.AddIndex(
+            model_name="archivedtweet",
+            index=models.Index(fields=["user", "-id"], name="archived_tweet_user_id"),
+        ),
+    ]
@@ -1,11 +1,47 @@
 from django.conf import settings
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# スレッドのパスは祖先と自分自身の id を PATH_WIDTH 桁ずつ連結したもの。
+PATH_WIDTH = 10
+
+MAX_REPLY_DEPTH = 49
+
+
+class TweetQuerySet(models.QuerySet):
+    def visible(self):
+        return self.filter(is_deleted=False, user__is_active=True)
+
+    def refresh_like_counts(self):
+        # Like 行から数え直す。サーバーのバッファ (tweets.counters) にまだ反映していない増減があると二重に数えるので，
+        # サーバーが動いている間は使わず，counters.apply_deltas で差分を足す。
+        like_model = self.model._meta.get_field("likes").related_model
+        likes = like_model.objects.filter(tweet=OuterRef("pk")).order_by().values("tweet").annotate(count=Count("*"))
+        return self.update(like_count=Coalesce(Subquery(likes.values("count")), 0))
 
 
 class Tweet(models.Model):
     content = models.TextField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # 削除予約済みのツイート。実際の行は accounts.deletion がバッチで削除する。
+    is_deleted = models.BooleanField(default=False)
+    like_count = models.PositiveIntegerField(default=0)
+    # 返信でないツイートは NULL。返信の子孫はパスの範囲検索で，スレッドの表示順 (深さ優先) のまま読める。
+    path = models.CharField(max_length=(MAX_REPLY_DEPTH + 1) * PATH_WIDTH, null=True, blank=True)
+    # 直接の返信の数。
+    reply_count = models.PositiveIntegerField(default=0)
+
+    objects = TweetQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # 削除予約済みを除いた id 降順のキーセットページネーション (ホームのタイムライン) 用。
+            models.Index(fields=["-id"], condition=models.Q(is_deleted=False), name="tweet_visible_id"),
+            # 返信だけを載せる部分インデックス。path の範囲条件は IS NOT NULL を含意するので SQLite でも使われる。
+            models.Index(fields=["path"], condition=models.Q(path__isnull=False), name="tweet_reply_path"),
+        ]
 
     def __str__(self):
         return self.content
@@ -19,3 +55,46 @@ class Like(models.Model):
         constraints = [
             models.UniqueConstraint(fields=["tweet", "user"], name="unique_like"),
         ]
+        indexes = [
+            # 「いいねしたユーザー」一覧を id 順のキーセットで読むときに，インデックスだけで済ませる。
+            models.Index(fields=["tweet", "id", "user"], name="like_tweet_id_user"),
+        ]
+
+
+class ArchivedTweet(models.Model):
+    # tweets.archive が古いツイートを移した先。id は元のツイートのものを引き継ぎ，ホット側の id より常に小さい。
+    id = models.BigIntegerField(primary_key=True)
+    content = models.TextField(max_length=255)
+    created_at = models.DateTimeField()
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="archived_tweets")
+    # アーカイブ後に削除予約されたツイート。
+    is_deleted = models.BooleanField(default=False)
+    like_count = models.PositiveIntegerField(default=0)
+    path = models.CharField(max_length=(MAX_REPLY_DEPTH + 1) * PATH_WIDTH, null=True, blank=True)
+    reply_count = models.PositiveIntegerField(default=0)
+
+    objects = TweetQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["path"], condition=models.Q(path__isnull=False), name="archived_tweet_reply_path"),
+            # bigint の主キーは SQLite では rowid の別名にならないので，プロフィールの id 降順は複合インデックスで読む。
+            models.Index(fields=["user", "-id"], name="archived_tweet_user_id"),
+        ]
+
+    def __str__(self):
+        return self.content
+
+
+class ArchivedLike(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    tweet = models.ForeignKey(ArchivedTweet, on_delete=models.CASCADE, related_name="likes")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="archived_likes")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["tweet", "user"], name="unique_archived_like"),
+        ]
+        indexes = [
+            models.Index(fields=["tweet", "id", "user"], name="archived_like_tweet_id_user"),
+        ]
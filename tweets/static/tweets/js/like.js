@@ -0,0 +1,43 @@
+// いいねボタンのクリックは document に付けた 1 つのリスナーでまとめて受ける。
+(() => {
+    const getCookie = (name) => {
+        if (document.cookie && document.cookie !== '') {
+            for (const cookie of document.cookie.split(';')) {
+                const [key, value] = cookie.trim().split('=')
+                if (key === name) {
+                    return decodeURIComponent(value)
+                }
+            }
+        }
+    }
+
+    const changeStyle = (tweet_data, like_button) => {
+        if (tweet_data.is_liked) {
+            like_button.dataset.url = tweet_data.unlike_url
+            like_button.textContent = "いいね解除"
+        } else {
+            like_button.dataset.url = tweet_data.like_url
+            like_button.textContent = "いいね"
+        }
+        for (const like_count of document.querySelectorAll(".count_" + tweet_data.tweet_id)) {
+            like_count.textContent = tweet_data.like_count
+        }
+    }
+
+    document.addEventListener("click", async (event) => {
+        const like_button = event.target.closest(".like-button")
+        if (!like_button) {
+            return
+        }
+        const response = await fetch(like_button.dataset.url, {
+            method: "POST",
+            headers: {
+                "Content-Type": "application/json",
+                "X-CSRFToken": getCookie('csrftoken'),
+            }
+        })
+        if (response.ok) {
+            changeStyle(await response.json(), like_button)
+        }
+    })
+})()
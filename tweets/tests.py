@@ -1,9 +1,27 @@
-from django.test import TestCase
+import asyncio
+import io
+import os
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
-from accounts.models import User
+from accounts import exclusions
+from accounts.deletion import process_pending, schedule_user_deletion
+from accounts.models import FriendShip, User, UserStats
+from notifications.models import Notification
 
-from .models import Like, Tweet
+from . import thread, watermark
+from .archive import archive_tweets
+from .counters import LikeCounterBuffer, buffer
+from .models import ArchivedLike, ArchivedTweet, Like, Tweet
 
 
 class TestHomeView(TestCase):
@@ -18,7 +36,39 @@ class TestHomeView(TestCase):
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "tweets/home.html")
-        self.assertQuerysetEqual(response.context["tweet_list"], Tweet.objects.order_by("-created_at"), ordered=False)
+        self.assertQuerysetEqual(
+            response.context["tweet_list"],
+            Tweet.objects.order_by("-created_at").values_list("pk", flat=True),
+            transform=lambda tweet: tweet.id,
+            ordered=False,
+        )
+
+    def test_success_get_with_cursor(self):
+        with self.settings(TIMELINE_PAGE_SIZE=1):
+            response = self.client.get(self.url)
+            self.assertEqual([tweet.content for tweet in response.context["tweet_list"]], ["testpost2"])
+            response = self.client.get(self.url, {"before": response.context["next_cursor"]})
+        self.assertEqual([tweet.content for tweet in response.context["tweet_list"]], ["testpost1"])
+        self.assertIsNone(response.context["next_cursor"])
+
+    @override_settings(TIMELINE_STREAMING=True, TIMELINE_STREAM_CHUNK_SIZE=1)
+    def test_success_get_streaming(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        self.assertIn("<header>", chunks[0])
+        self.assertNotIn("testpost", chunks[0])
+        self.assertIn("testpost2", chunks[1])
+        self.assertIn("testpost1", chunks[2])
+        self.assertIn("</html>", chunks[-1])
+
+    @override_settings(TIMELINE_STREAMING=True)
+    async def test_success_get_streaming_asgi(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(self.url)
+        content = b"".join(response.streaming_content).decode()
+        self.assertIn("testpost1", content)
+        self.assertIn("testpost2", content)
 
 
 class TestTweetCreateView(TestCase):
@@ -83,6 +133,16 @@ class TestTweetDetailView(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.context["tweet"], self.tweet)
 
+    def test_success_get_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["tweet"].like_count, 1)
+
 
 class TestTweetDeleteView(TestCase):
     def setUp(self):
@@ -102,6 +162,34 @@ class TestTweetDeleteView(TestCase):
         self.assertRedirects(response, reverse("tweets:home"), status_code=302, target_status_code=200)
         self.assertEqual(Tweet.objects.filter(content="tweet").count(), 0)
 
+    def test_success_post_deletes_in_background(self):
+        Like.objects.create(tweet=self.tweet1, user=self.user2)
+        self.client.post(self.url1)
+        self.assertFalse(Tweet.objects.visible().filter(pk=self.tweet1.pk).exists())
+        self.assertEqual(self.client.get(reverse("tweets:detail", kwargs={"pk": self.tweet1.pk})).status_code, 404)
+
+        call_command("process_deletions", batch_size=1, stdout=io.StringIO())
+        self.assertFalse(Tweet.objects.filter(pk=self.tweet1.pk).exists())
+        self.assertFalse(Like.objects.exists())
+
+    def test_success_post_deletes_archived_tweet(self):
+        Like.objects.create(tweet=self.tweet1, user=self.user2)
+        Tweet.objects.filter(pk=self.tweet1.pk).update(created_at=timezone.now() - timedelta(days=400))
+        archive_tweets(timedelta(days=365))
+        response = self.client.post(self.url1)
+        self.assertRedirects(response, reverse("tweets:home"), status_code=302, target_status_code=200)
+        self.assertEqual(self.client.get(reverse("tweets:detail", kwargs={"pk": self.tweet1.pk})).status_code, 404)
+
+        call_command("process_deletions", batch_size=1, stdout=io.StringIO())
+        self.assertFalse(ArchivedTweet.objects.exists())
+        self.assertFalse(ArchivedLike.objects.exists())
+
+    def test_failure_post_with_archived_tweet_of_other_user(self):
+        Tweet.objects.update(created_at=timezone.now() - timedelta(days=400))
+        archive_tweets(timedelta(days=365))
+        self.assertEqual(self.client.post(self.url2).status_code, 403)
+        self.assertFalse(ArchivedTweet.objects.get(pk=self.tweet2.pk).is_deleted)
+
     def test_failure_post_with_not_exist_tweet(self):
         response = self.client.post(reverse("tweets:delete", kwargs={"pk": 99}))
         self.assertEqual(response.status_code, 404)
@@ -159,3 +247,491 @@ class TestUnLikeView(TestCase):
         Like.objects.filter(tweet=self.tweet, user=self.user).delete()
         response = self.client.post(reverse("tweets:unlike", kwargs={"pk": self.tweet.pk}))
         self.assertEqual(response.status_code, 200)
+
+
+class TestImportDataCommand(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="testuser1", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def test_success_import_tweets(self):
+        path = self.write(
+            "tweets.ndjson",
+            '{"username": "testuser1", "content": "tweet1", "created_at": "2020-06-01T12:00:00+09:00"}\n'
+            '{"username": "testuser2", "content": "tweet2"}\n',
+        )
+        call_command("import_data", path, kind="tweets", batch_size=1, stdout=io.StringIO())
+        self.assertEqual(Tweet.objects.count(), 2)
+        self.assertEqual(Tweet.objects.get(content="tweet1").created_at.year, 2020)
+        self.assertFalse(os.path.exists(path + ".checkpoint"))
+
+    def test_success_import_likes_and_follows_from_csv(self):
+        tweet = Tweet.objects.create(user=self.user1, content="tweet")
+        likes = self.write("likes.csv", f"username,tweet_id\ntestuser2,{tweet.pk}\ntestuser2,{tweet.pk}\n")
+        follows = self.write("follows.csv", "follower,following\ntestuser2,testuser1\n")
+        call_command("import_data", likes, kind="likes", stdout=io.StringIO())
+        call_command("import_data", follows, kind="follows", stdout=io.StringIO())
+        self.assertEqual(Like.objects.filter(tweet=tweet, user=self.user2).count(), 1)
+        self.assertTrue(FriendShip.objects.filter(follower=self.user2, following=self.user1).exists())
+
+    def test_failure_import_with_invalid_rows(self):
+        path = self.write(
+            "tweets.ndjson",
+            '{"username": "not_exist_user", "content": "tweet"}\n'
+            '{"username": "testuser1", "content": ""}\n'
+            '{"username": "testuser1", "content": "' + "a" * 256 + '"}\n'
+            "not json\n",
+        )
+        stderr = io.StringIO()
+        call_command("import_data", path, kind="tweets", stdout=io.StringIO(), stderr=stderr)
+        self.assertEqual(Tweet.objects.count(), 0)
+        self.assertEqual(stderr.getvalue().count("スキップしました"), 4)
+
+    def test_success_resume_from_checkpoint(self):
+        path = self.write(
+            "tweets.ndjson",
+            '{"username": "testuser1", "content": "tweet1"}\n{"username": "testuser1", "content": "tweet2"}\n',
+        )
+        with open(path + ".checkpoint", "w") as f:
+            f.write("1")
+        call_command("import_data", path, kind="tweets", stdout=io.StringIO())
+        self.assertQuerysetEqual(Tweet.objects.values_list("content", flat=True), ["tweet2"])
+
+
+class TestTimelineAPIView(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="testuser1", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        self.client.force_login(self.user1)
+        self.tweets = [Tweet.objects.create(user=self.user2, content=f"tweet{i}") for i in range(3)]
+        self.client.post(reverse("tweets:like", kwargs={"pk": self.tweets[2].pk}))
+
+    def test_success_get_with_cursor(self):
+        url = reverse("tweets:api_home")
+        data = self.client.get(url, {"limit": 2}).json()
+        self.assertEqual([tweet["content"] for tweet in data["tweets"]], ["tweet2", "tweet1"])
+        self.assertEqual(data["tweets"][0]["like_count"], 1)
+        self.assertTrue(data["tweets"][0]["liked"])
+        self.assertFalse(data["tweets"][1]["liked"])
+        self.assertEqual(data["tweets"][0]["username"], "testuser2")
+
+        data = self.client.get(url, {"limit": 2, "before": data["next"]}).json()
+        self.assertEqual([tweet["content"] for tweet in data["tweets"]], ["tweet0"])
+        self.assertIsNone(data["next"])
+
+    def test_success_get_user_timeline_and_detail(self):
+        Tweet.objects.create(user=self.user1, content="own tweet")
+        data = self.client.get(reverse("tweets:api_user_timeline", kwargs={"username": "testuser1"})).json()
+        self.assertEqual([tweet["content"] for tweet in data["tweets"]], ["own tweet"])
+
+        data = self.client.get(reverse("tweets:api_detail", kwargs={"pk": self.tweets[2].pk})).json()
+        self.assertEqual(data["id"], self.tweets[2].pk)
+        self.assertTrue(data["liked"])
+
+    def test_failure_get_with_invalid_cursor(self):
+        response = self.client.get(reverse("tweets:api_home"), {"before": "abc"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_failure_get_without_login(self):
+        self.client.logout()
+        response = self.client.get(reverse("tweets:api_home"))
+        self.assertEqual(response.status_code, 403)
+
+
+class TestLikedByView(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="testuser1", password="testpassword")
+        self.client.force_login(self.user1)
+        self.tweet = Tweet.objects.create(user=self.user1, content="tweet")
+        self.likers = [User.objects.create_user(username=f"liker{i}", password="testpassword") for i in range(3)]
+        for liker in self.likers:
+            Like.objects.create(tweet=self.tweet, user=liker)
+        FriendShip.objects.create(follower=self.user1, following=self.likers[2])
+        self.url = reverse("tweets:liked_by", kwargs={"pk": self.tweet.pk})
+
+    def test_success_get_with_cursor(self):
+        response = self.client.get(self.url, {"limit": 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "tweets/liked_by.html")
+        likers = response.context["likers"]
+        self.assertEqual([liker.username for liker in likers], ["liker2", "liker1"])
+        self.assertEqual([liker.is_following for liker in likers], [True, False])
+
+        response = self.client.get(self.url, {"limit": 2, "before": response.context["next_cursor"]})
+        self.assertEqual([liker.username for liker in response.context["likers"]], ["liker0"])
+        self.assertIsNone(response.context["next_cursor"])
+
+    def test_success_get_excludes_inactive_users(self):
+        User.objects.filter(pk=self.likers[2].pk).update(is_active=False)
+        response = self.client.get(self.url)
+        self.assertEqual([liker.username for liker in response.context["likers"]], ["liker1", "liker0"])
+
+    def test_failure_get_with_not_exist_tweet(self):
+        response = self.client.get(reverse("tweets:liked_by", kwargs={"pk": 100}))
+        self.assertEqual(response.status_code, 404)
+
+
+class TestArchiveTweets(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="testuser1", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        self.client.force_login(self.user1)
+        self.tweets = [Tweet.objects.create(user=self.user2, content=f"tweet{i}") for i in range(4)]
+        Tweet.objects.filter(pk__in=[tweet.pk for tweet in self.tweets[:2]]).update(
+            created_at=timezone.now() - timedelta(days=400)
+        )
+        self.client.post(reverse("tweets:like", kwargs={"pk": self.tweets[0].pk}))
+
+    def archive(self):
+        out = io.StringIO()
+        call_command("archive_tweets", days=365, batch_size=1, stdout=out)
+        return out.getvalue()
+
+    def test_success_archive_old_tweets(self):
+        self.assertIn("2 件", self.archive())
+        self.assertQuerysetEqual(Tweet.objects.values_list("content", flat=True).order_by("id"), ["tweet2", "tweet3"])
+        archived = ArchivedTweet.objects.get(pk=self.tweets[0].pk)
+        self.assertEqual((archived.content, archived.like_count), ("tweet0", 1))
+        self.assertTrue(ArchivedLike.objects.filter(tweet=archived, user=self.user1).exists())
+        self.assertFalse(Like.objects.exists())
+
+    def test_success_archive_stops_at_first_recent_tweet(self):
+        # 新しいツイートより id が大きい古いツイートは，ホット側とアーカイブ側の id が交ざらないよう移さない。
+        Tweet.objects.filter(pk=self.tweets[3].pk).update(created_at=timezone.now() - timedelta(days=400))
+        self.archive()
+        self.assertEqual(Tweet.objects.count(), 2)
+        self.assertFalse(ArchivedTweet.objects.filter(pk=self.tweets[3].pk).exists())
+
+    def test_success_read_through_detail_and_profile(self):
+        self.archive()
+        response = self.client.get(reverse("tweets:detail", kwargs={"pk": self.tweets[0].pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["archived"])
+        self.assertTrue(response.context["tweet"].liked)
+
+        url = reverse("accounts:user_profile", kwargs={"username": "testuser2"})
+        response = self.client.get(url, {"limit": 3})
+        self.assertEqual([tweet.content for tweet in response.context["tweet_list"]], ["tweet3", "tweet2", "tweet1"])
+        response = self.client.get(url, {"limit": 3, "before": response.context["next_cursor"]})
+        self.assertEqual([tweet.content for tweet in response.context["tweet_list"]], ["tweet0"])
+        self.assertTrue(response.context["tweet_list"][0].liked)
+        self.assertIsNone(response.context["next_cursor"])
+
+        data = self.client.get(reverse("tweets:api_user_timeline", kwargs={"username": "testuser2"})).json()
+        self.assertEqual(len(data["tweets"]), 4)
+
+    @override_settings(TIMELINE_STREAMING=True)
+    def test_success_read_through_profile_streaming(self):
+        self.archive()
+        url = reverse("accounts:user_profile", kwargs={"username": "testuser2"})
+        response = self.client.get(url, {"limit": 3})
+        self.assertEqual(response.context["next_cursor"], self.tweets[1].pk)
+        content = b"".join(response.streaming_content).decode()
+        self.assertIn("tweet1", content)
+        self.assertNotIn("tweet0", content)
+
+    def test_success_user_deletion_removes_archive(self):
+        self.archive()
+        with self.captureOnCommitCallbacks(execute=True):
+            schedule_user_deletion(self.user2)
+        process_pending()
+        self.assertFalse(ArchivedTweet.objects.exists())
+        self.assertFalse(ArchivedLike.objects.exists())
+
+
+class TestThread(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user1 = User.objects.create_user(username="testuser1", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        self.client.force_login(self.user1)
+        self.root = Tweet.objects.create(user=self.user2, content="root")
+
+    def reply(self, parent, content):
+        self.client.post(reverse("tweets:reply", kwargs={"pk": parent.pk}), {"content": content})
+        return Tweet.objects.get(content=content)
+
+    def test_success_reply(self):
+        response = self.client.post(reverse("tweets:reply", kwargs={"pk": self.root.pk}), {"content": "reply"})
+        self.assertRedirects(response, reverse("tweets:detail", kwargs={"pk": self.root.pk}))
+        reply = Tweet.objects.get(content="reply")
+        self.assertEqual(reply.path, thread.encode(self.root.pk) + thread.encode(reply.pk))
+        self.assertEqual(thread.parent_id(reply.path), self.root.pk)
+        self.root.refresh_from_db()
+        self.assertEqual(self.root.reply_count, 1)
+
+    def test_success_thread_in_depth_first_order(self):
+        a = self.reply(self.root, "a")
+        b = self.reply(self.root, "b")
+        a1 = self.reply(a, "a1")
+        a1x = self.reply(a1, "a1x")
+        self.reply(b, "b1")
+
+        response = self.client.get(reverse("tweets:detail", kwargs={"pk": self.root.pk}))
+        self.assertEqual([card.content for card in response.context["replies"]], ["a", "a1", "a1x", "b", "b1"])
+        self.assertEqual([card.depth for card in response.context["replies"]], [1, 2, 3, 1, 2])
+
+        response = self.client.get(reverse("tweets:detail", kwargs={"pk": a1x.pk}))
+        self.assertEqual([card.content for card in response.context["ancestors"]], ["root", "a", "a1"])
+        self.assertFalse(response.has_header("ETag"))
+
+        with self.settings(THREAD_MAX_DEPTH=2):
+            response = self.client.get(reverse("tweets:detail", kwargs={"pk": self.root.pk}), {"limit": 2})
+            self.assertEqual([card.content for card in response.context["replies"]], ["a", "a1"])
+            self.assertEqual(response.context["replies"][1].reply_count, 1)
+            cursor = response.context["replies_next_cursor"]
+            response = self.client.get(reverse("tweets:detail", kwargs={"pk": self.root.pk}), {"after": cursor})
+            self.assertEqual([card.content for card in response.context["replies"]], ["b", "b1"])
+            self.assertIsNone(response.context["replies_next_cursor"])
+
+    def test_success_thread_api_in_fixed_queries(self):
+        parent = self.root
+        for i in range(5):
+            parent = self.reply(parent, f"reply{i}")
+        url = reverse("tweets:api_thread", kwargs={"pk": Tweet.objects.get(content="reply1").pk})
+        # セッション・ユーザー・ツイート本体・祖先・返信・いいね状態。返信の深さや件数によらない。
+        with self.assertNumQueries(6):
+            data = self.client.get(url)
+        data = data.json()
+        self.assertEqual([tweet["content"] for tweet in data["ancestors"]], ["root", "reply0"])
+        self.assertEqual([tweet["depth"] for tweet in data["replies"]], [1, 2, 3])
+
+    def test_success_thread_read_through_archive(self):
+        reply = self.reply(self.root, "reply")
+        Tweet.objects.filter(pk=self.root.pk).update(created_at=timezone.now() - timedelta(days=400))
+        call_command("archive_tweets", days=365, stdout=io.StringIO())
+        self.assertEqual(ArchivedTweet.objects.get(pk=self.root.pk).reply_count, 1)
+        response = self.client.get(reverse("tweets:detail", kwargs={"pk": self.root.pk}))
+        self.assertTrue(response.context["archived"])
+        self.assertEqual([card.content for card in response.context["replies"]], ["reply"])
+
+        response = self.client.get(reverse("tweets:detail", kwargs={"pk": reply.pk}))
+        self.assertEqual([card.content for card in response.context["ancestors"]], ["root"])
+
+    def test_success_delete_reply_updates_reply_count(self):
+        reply = self.reply(self.root, "reply")
+        self.client.force_login(self.user1)
+        self.client.post(reverse("tweets:delete", kwargs={"pk": reply.pk}))
+        self.root.refresh_from_db()
+        self.assertEqual(self.root.reply_count, 0)
+
+        self.reply(self.root, "reply2")
+        with self.captureOnCommitCallbacks(execute=True):
+            schedule_user_deletion(self.user1)
+        process_pending()
+        self.root.refresh_from_db()
+        self.assertEqual(self.root.reply_count, 0)
+
+    def test_success_thread_hides_excluded_replies_with_their_subtree(self):
+        user3 = User.objects.create_user(username="testuser3", password="testpassword")
+        a = self.reply(self.root, "a")
+        self.client.force_login(user3)
+        x = self.reply(a, "x")
+        self.client.force_login(self.user1)
+        self.reply(x, "x1")
+        self.reply(self.root, "b")
+        exclusions.mute(self.user1, user3)
+
+        response = self.client.get(reverse("tweets:detail", kwargs={"pk": self.root.pk}), {"limit": 1})
+        self.assertEqual([card.content for card in response.context["replies"]], ["a"])
+        cursor = response.context["replies_next_cursor"]
+        response = self.client.get(reverse("tweets:detail", kwargs={"pk": self.root.pk}), {"after": cursor})
+        self.assertEqual([card.content for card in response.context["replies"]], ["b"])
+        data = self.client.get(reverse("tweets:api_thread", kwargs={"pk": self.root.pk})).json()
+        self.assertEqual([tweet["content"] for tweet in data["replies"]], ["a", "b"])
+
+    def test_failure_reply_across_block(self):
+        exclusions.block(self.user2, self.user1)
+        url = reverse("tweets:reply", kwargs={"pk": self.root.pk})
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.post(url, {"content": "reply"}).status_code, 403)
+        self.assertFalse(Tweet.objects.filter(content="reply").exists())
+
+    def test_failure_reply_with_invalid_cursor(self):
+        response = self.client.get(reverse("tweets:detail", kwargs={"pk": self.root.pk}), {"after": "x"})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestTweetUpdates(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.user)
+        self.url = reverse("tweets:api_home_updates")
+        self.tweet = Tweet.objects.create(user=self.user, content="tweet0")
+
+    def create(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("tweets:create"), {"content": content})
+        return Tweet.objects.get(content=content)
+
+    def test_success_no_updates_answered_from_watermark(self):
+        self.client.get(self.url, {"since": self.tweet.pk})
+        # セッションとユーザーの読み込みだけで，ツイートは読まない。
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {"since": self.tweet.pk})
+        self.assertEqual(response.status_code, 204)
+        etag = response["ETag"]
+        response = self.client.get(self.url, {"since": self.tweet.pk}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_success_updates_formats(self):
+        self.client.get(self.url, {"since": self.tweet.pk})
+        tweets = [self.create(f"new{i}") for i in range(3)]
+        response = self.client.get(self.url, {"since": self.tweet.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["ids"], [tweet.pk for tweet in reversed(tweets)])
+        self.assertEqual(response.json()["latest"], tweets[-1].pk)
+
+        data = self.client.get(self.url, {"since": tweets[0].pk, "format": "count"}).json()
+        self.assertEqual((data["count"], data["truncated"]), (2, False))
+        data = self.client.get(self.url, {"since": self.tweet.pk, "format": "cards", "limit": 2}).json()
+        self.assertIn("new2", data["html"])
+        self.assertNotIn("new0", data["html"])
+        self.assertTrue(data["truncated"])
+
+        etag = self.client.get(self.url, {"since": self.tweet.pk})["ETag"]
+        self.create("new3")
+        response = self.client.get(self.url, {"since": self.tweet.pk}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_failure_get_with_invalid_since(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"since": 1, "format": "xml"}).status_code, 400)
+
+    @override_settings(TWEET_POLL_INTERVAL=0.01)
+    async def test_success_long_poll_asgi(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        url = reverse("tweets:api_home_updates_wait")
+        started = time.monotonic()
+        response = await self.async_client.get(url, {"since": self.tweet.pk, "wait": 0.2})
+        self.assertEqual(response.status_code, 204)
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+        new = await sync_to_async(Tweet.objects.create)(user=self.user, content="new")
+        await sync_to_async(watermark.invalidate)()
+        response = await self.async_client.get(url, {"since": self.tweet.pk, "wait": 5})
+        self.assertEqual(response.json()["ids"], [new.pk])
+
+    async def test_success_waiters_share_one_watermark_refresh(self):
+        with mock.patch.object(watermark, "latest_id", wraps=watermark.latest_id) as latest_id:
+            results = await asyncio.gather(*(watermark.alatest_id() for _ in range(20)))
+        self.assertEqual(results, [self.tweet.pk] * 20)
+        self.assertEqual(latest_id.call_count, 1)
+
+    def test_success_long_poll_wsgi_does_not_wait(self):
+        started = time.monotonic()
+        response = self.client.get(reverse("tweets:api_home_updates_wait"), {"since": self.tweet.pk, "wait": 5})
+        self.assertEqual(response.status_code, 204)
+        self.assertLess(time.monotonic() - started, 1)
+        self.client.logout()
+        response = self.client.get(reverse("tweets:api_home_updates_wait"), {"since": self.tweet.pk})
+        self.assertEqual(response.status_code, 403)
+
+
+class TestLikeCounterBuffer(TransactionTestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="testuser1", password="testpassword")
+        self.client.force_login(self.user1)
+        self.tweet = Tweet.objects.create(user=self.user1, content="tweet")
+        patcher = mock.patch.multiple(buffer, enabled=True, ensure_thread=mock.DEFAULT)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(buffer.reset)
+
+    def post(self, name):
+        return self.client.post(reverse(name, kwargs={"pk": self.tweet.pk})).json()
+
+    def stored(self):
+        return Tweet.objects.values_list("like_count", flat=True).get(pk=self.tweet.pk)
+
+    def test_success_read_includes_pending_delta(self):
+        self.assertEqual(self.post("tweets:like")["like_count"], 1)
+        self.assertTrue(Like.objects.filter(tweet=self.tweet, user=self.user1).exists())
+        self.assertEqual(self.stored(), 0)
+
+        response = self.client.get(reverse("tweets:detail", kwargs={"pk": self.tweet.pk}))
+        self.assertEqual(response.context["tweet"].like_count, 1)
+        response = self.client.get(reverse("tweets:home"))
+        self.assertEqual(response.context["tweet_list"][0].like_count, 1)
+
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(self.stored(), 1)
+        self.assertEqual(buffer.current(self.tweet.pk, self.stored()), 1)
+
+    def test_success_flush_combines_deltas(self):
+        self.post("tweets:like")
+        self.assertEqual(self.post("tweets:unlike")["like_count"], 0)
+        self.post("tweets:like")
+        self.assertEqual(buffer.pending[self.tweet.pk], 1)
+        buffer.flush()
+        self.assertEqual(self.stored(), 1)
+
+    def test_success_author_rows_written_on_flush(self):
+        user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        activity_at = User.objects.get(pk=self.user1.pk).activity_at
+        self.client.force_login(user2)
+        self.post("tweets:like")
+        self.assertFalse(UserStats.objects.filter(user=self.user1).exists())
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(User.objects.get(pk=self.user1.pk).activity_at, activity_at)
+
+        buffer.flush()
+        self.assertEqual(UserStats.objects.get(user=self.user1).likes_received, 1)
+        self.assertEqual(Notification.objects.get().recent_actors, ["testuser2"])
+        self.assertGreater(User.objects.get(pk=self.user1.pk).activity_at, activity_at)
+
+    def test_success_deletion_and_import_do_not_double_count_pending(self):
+        user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        user3 = User.objects.create_user(username="testuser3", password="testpassword")
+        self.post("tweets:like")
+        Like.objects.create(tweet=self.tweet, user=user2)
+        Tweet.objects.filter(pk=self.tweet.pk).update(like_count=1)
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write(f"username,tweet_id\ntestuser3,{self.tweet.pk}\n")
+        self.addCleanup(os.remove, f.name)
+        call_command("import_data", f.name, kind="likes", stdout=io.StringIO())
+        self.assertEqual(self.stored(), 2)
+
+        schedule_user_deletion(user2)
+        process_pending()
+        self.assertEqual(self.stored(), 1)
+        buffer.flush()
+        self.assertEqual(self.stored(), 2)
+        self.assertEqual(Like.objects.filter(tweet=self.tweet).count(), 2)
+        self.assertTrue(Like.objects.filter(tweet=self.tweet, user=user3).exists())
+
+    def test_success_flush_to_archived_tweet(self):
+        self.post("tweets:like")
+        call_command("archive_tweets", days=0, stdout=io.StringIO())
+        buffer.flush()
+        self.assertEqual(ArchivedTweet.objects.get(pk=self.tweet.pk).like_count, 1)
+
+
+@override_settings(LIKE_COUNT_FLUSH_INTERVAL=0.01)
+class TestLikeCounterBufferThread(TransactionTestCase):
+    def test_success_flush_in_background_and_on_stop(self):
+        user = User.objects.create_user(username="testuser1", password="testpassword")
+        tweet = Tweet.objects.create(user=user, content="tweet")
+        counter = LikeCounterBuffer()
+        counter.add(tweet.pk, 2)
+        for _ in range(100):
+            if Tweet.objects.get(pk=tweet.pk).like_count == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(Tweet.objects.get(pk=tweet.pk).like_count, 2)
+
+        counter.stopping.set()
+        counter.pending[tweet.pk] += 1
+        counter.stop()
+        self.assertEqual(Tweet.objects.get(pk=tweet.pk).like_count, 3)
@@ -0,0 +1,169 @@
+import json
+import re
+
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.db.models import F
+from django.db.models.functions import Greatest, Length
+from django.shortcuts import get_object_or_404
+
+from accounts import exclusions
+
+from . import timeline
+from .models import PATH_WIDTH, ArchivedTweet, Tweet
+
+THREAD_COLUMNS = (*timeline.TIMELINE_COLUMNS, "path", "reply_count")
+
+_cursor = re.compile(rf"(?:\d{{{PATH_WIDTH}}})+")
+
+
+def encode(tweet_id):
+    return f"{tweet_id:0{PATH_WIDTH}d}"
+
+
+def thread_path(tweet):
+    # 返信でないツイートのパスは NULL なので，子孫を探すときは自分の id だけのパスとみなす。
+    return tweet.path or encode(tweet.pk)
+
+
+def depth(path):
+    return len(path) // PATH_WIDTH - 1 if path else 0
+
+
+def ancestor_ids(path):
+    return [int(path[i : i + PATH_WIDTH]) for i in range(0, len(path or "") - PATH_WIDTH, PATH_WIDTH)]
+
+
+def parent_id(path):
+    ids = ancestor_ids(path)
+    return ids[-1] if ids else None
+
+
+def attach_reply(parent, reply):
+    # パスには自分の id も含むので，採番後にもう一度 UPDATE する。
+    reply.path = thread_path(parent) + encode(reply.pk)
+    Tweet.objects.filter(pk=reply.pk).update(path=reply.path)
+    bump_reply_count(parent.pk, 1)
+
+
+def bump_reply_count(tweet_id, delta):
+    values = {"reply_count": Greatest(F("reply_count") + delta, 0)}
+    return Tweet.objects.filter(pk=tweet_id).update(**values) or ArchivedTweet.objects.filter(pk=tweet_id).update(
+        **values
+    )
+
+
+class ReplyCard(timeline.TimelineCard):
+    __slots__ = ("depth", "reply_count")
+
+    def __init__(self, row, liked, base_depth=0):
+        super().__init__(row[:5], liked)
+        path, self.reply_count = row[5:]
+        self.depth = depth(path) - base_depth
+
+
+def parse_thread_args(request):
+    after = request.GET.get("after")
+    if after is not None and not _cursor.fullmatch(after):
+        raise BadRequest("after が不正です。")
+    _, limit = timeline.parse_page_args(request)
+    return after, limit
+
+
+def fetch_ancestors(tweet, exclude=frozenset()):
+    ids = ancestor_ids(tweet.path)
+    if not ids:
+        return []
+    hot = Tweet.objects.visible().filter(pk__in=ids).values_list(*THREAD_COLUMNS, "user_id")
+    archived = ArchivedTweet.objects.visible().filter(pk__in=ids).values_list(*THREAD_COLUMNS, "user_id")
+    # 祖先は必ず子孫より先に投稿されているので，id 順がそのまま根からの順になる。
+    rows = sorted(hot.union(archived, all=True), key=lambda row: row[0])
+    return [row[:-1] for row in rows if row[-1] not in exclude]
+
+
+def fetch_replies(tweet, archived=False, after=None, limit=None, max_depth=None, exclude=frozenset()):
+    # 子孫をパス順 (深さ優先) に読み，パスをカーソルにしたキーセットでページを切る。深すぎる返信は読まない。
+    # exclude のユーザーの返信は，その下の返信ごと落とす。
+    limit = limit or settings.THREAD_PAGE_SIZE
+    max_depth = max_depth or settings.THREAD_MAX_DEPTH
+    prefix = thread_path(tweet)
+    if not tweet.reply_count and after is None:
+        return [], None
+
+    def select(model, after):
+        queryset = model.objects.visible().filter(path__gt=max(prefix, after or ""), path__lt=prefix + "~")
+        queryset = queryset.alias(path_length=Length("path"))
+        queryset = queryset.filter(path_length__lte=len(prefix) + max_depth * PATH_WIDTH)
+        return queryset.values_list(*THREAD_COLUMNS, "user_id")
+
+    rows, hidden = [], None
+    while len(rows) <= limit:
+        # 除外があるときは多めに読む。足りなければ最後に読んだパスから続きを読む。
+        batch = (limit + 1 - len(rows)) * (2 if exclude else 1)
+        page = select(Tweet, after)
+        if archived:
+            # アーカイブ済みのツイートの子孫はホット側とアーカイブの両方にあり得る。
+            page = page.union(select(ArchivedTweet, after), all=True)
+        page = list(page.order_by("path")[:batch])
+        for row in page:
+            after = row[5]
+            # パス順なので，除外した返信の子孫はその直後に続く。
+            if hidden is not None and after.startswith(hidden):
+                continue
+            if row[-1] in exclude:
+                hidden = after
+                continue
+            rows.append(row[:-1])
+            if len(rows) > limit:
+                break
+        if len(page) < batch:
+            break
+    next_cursor = rows[limit - 1][5] if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def find_tweet(tweet_id):
+    # ホット側になければアーカイブから探す。(ツイート, アーカイブ済みか) を返す。
+    tweet = Tweet.objects.visible().select_related("user").filter(pk=tweet_id).first()
+    if tweet is not None:
+        return tweet, False
+    return get_object_or_404(ArchivedTweet.objects.visible().select_related("user"), pk=tweet_id), True
+
+
+def thread_context(request, tweet, archived=False):
+    after, limit = parse_thread_args(request)
+    hidden = exclusions.get(request.user).hidden
+    ancestors = fetch_ancestors(tweet, hidden)
+    replies, next_cursor = fetch_replies(tweet, archived, after, limit, exclude=hidden)
+    liked = set()
+    if request.user.is_authenticated:
+        liked = timeline.liked_ids(request.user, [row[0] for row in ancestors + replies])
+    base_depth = depth(tweet.path)
+    return {
+        "ancestors": [ReplyCard(row, row[0] in liked) for row in ancestors],
+        "replies": [ReplyCard(row, row[0] in liked, base_depth) for row in replies],
+        "replies_next_cursor": next_cursor,
+        "max_depth": settings.THREAD_MAX_DEPTH,
+    }
+
+
+def shape(card):
+    return {
+        "id": card.id,
+        "content": card.content,
+        "created_at": card.created_at.isoformat(),
+        "username": card.username,
+        "like_count": card.like_count,
+        "liked": card.liked,
+        "reply_count": card.reply_count,
+        "depth": card.depth,
+    }
+
+
+def encode_thread(context):
+    data = {
+        "ancestors": [shape(card) for card in context["ancestors"]],
+        "replies": [shape(card) for card in context["replies"]],
+        "next": context["replies_next_cursor"],
+    }
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
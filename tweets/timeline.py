@@ -0,0 +1,223 @@
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.template import loader
+
+from accounts.models import FriendShip
+
+from . import counters
+from .models import ArchivedLike, ArchivedTweet, Like, Tweet
+
+MAX_PAGE_SIZE = 200
+
+STREAM_MARKER = "<!--timeline-stream-->"
+
+TIMELINE_COLUMNS = ("id", "content", "created_at", "user__username", "like_count")
+
+LIKER_COLUMNS = ("id", "user_id", "user__username")
+
+UPDATE_FORMATS = ("ids", "count", "cards")
+
+# 値は str / int / bool / None だけに整形してから渡すので，循環参照チェックや default() は不要。
+_encoder = json.JSONEncoder(ensure_ascii=False, check_circular=False, separators=(",", ":"))
+
+
+class Liker:
+    __slots__ = ("id", "user_id", "username", "is_following")
+
+    def __init__(self, row, is_following):
+        self.id, self.user_id, self.username = row
+        self.is_following = is_following
+
+
+class TimelineCard:
+    # テンプレートに渡すツイート 1 件分。モデルインスタンスや関連 User を組み立てずに，行タプルから直接作る。
+    __slots__ = ("id", "content", "created_at", "username", "like_count", "liked")
+
+    def __init__(self, row, liked):
+        self.id, self.content, self.created_at, self.username, like_count = row
+        self.like_count = counters.buffer.current(self.id, like_count)
+        self.liked = liked
+
+
+def home_queryset():
+    return Tweet.objects.visible()
+
+
+def user_queryset(user):
+    return Tweet.objects.visible().filter(user=user)
+
+
+def user_archive_queryset(user):
+    return ArchivedTweet.objects.visible().filter(user=user)
+
+
+def _page(queryset, before, count, columns):
+    if before is not None:
+        queryset = queryset.filter(id__lt=before)
+    return queryset.order_by("-id").values_list(*columns)[:count]
+
+
+def read_through(queryset, archive, before, count, columns, chunk_size=None, exclude=frozenset()):
+    # id の降順にホット側を読み，足りなければ続きをアーカイブから読む。アーカイブの id はホット側より常に小さい。
+    # exclude は行の user_id で除外するユーザー。
+    if len(exclude) > settings.EXCLUSION_SQL_LIMIT:
+        yield from _read_excluding(queryset, archive, before, count, columns, chunk_size, exclude)
+        return
+    if exclude:
+        queryset = queryset.exclude(user_id__in=sorted(exclude))
+        archive = archive.exclude(user_id__in=sorted(exclude)) if archive is not None else None
+    rows = _page(queryset, before, count, columns)
+    for row in (rows.iterator(chunk_size=chunk_size) if chunk_size else rows):
+        yield row
+        before, count = row[0], count - 1
+    if archive is not None and count > 0:
+        yield from _page(archive, before, count, columns)
+
+
+def _read_excluding(queryset, archive, before, count, columns, chunk_size, exclude):
+    # 除外するユーザーが多いときは SQL を伸ばさず，同じキーセットで多めに読んで Python で落とす。
+    columns = (*columns, "user_id")
+    while count > 0:
+        batch, seen = count * 2, 0
+        for row in read_through(queryset, archive, before, batch, columns, chunk_size):
+            seen, before = seen + 1, row[0]
+            if row[-1] in exclude:
+                continue
+            yield row[:-1]
+            count -= 1
+            if not count:
+                return
+        if seen < batch:
+            return
+
+
+def fetch_rows(queryset, before=None, limit=None, archive=None, exclude=frozenset()):
+    # id の降順によるキーセットページネーション。次ページの有無を知るために 1 件多く読む。
+    limit = limit or settings.TIMELINE_PAGE_SIZE
+    rows = list(read_through(queryset, archive, before, limit + 1, TIMELINE_COLUMNS, exclude=exclude))
+    next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def fetch_likers(viewer, likes, before=None, limit=None, exclude=frozenset()):
+    # いいねの id の降順によるキーセットページネーション。フォロー状態はページ単位で 1 クエリにまとめる。
+    limit = limit or settings.TIMELINE_PAGE_SIZE
+    likes = likes.filter(user__is_active=True)
+    rows = list(read_through(likes, None, before, limit + 1, LIKER_COLUMNS, exclude=exclude))
+    next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+    rows = rows[:limit]
+    following = FriendShip.objects.following_ids(viewer, [row[1] for row in rows])
+    return [Liker(row, row[1] in following) for row in rows], next_cursor
+
+
+def parse_page_args(request):
+    try:
+        before = int(request.GET["before"]) if "before" in request.GET else None
+        limit = min(int(request.GET["limit"]), MAX_PAGE_SIZE) if "limit" in request.GET else None
+    except ValueError:
+        raise BadRequest("before と limit は整数で指定してください。")
+    if limit is not None and limit < 1:
+        raise BadRequest("limit は 1 以上で指定してください。")
+    return before, limit
+
+
+def parse_since_args(request):
+    try:
+        since = int(request.GET["since"])
+    except (KeyError, ValueError):
+        raise BadRequest("since は整数で指定してください。")
+    fmt = request.GET.get("format", "ids")
+    if fmt not in UPDATE_FORMATS:
+        raise BadRequest(f"format は {', '.join(UPDATE_FORMATS)} のいずれかで指定してください。")
+    return since, fmt
+
+
+def liked_ids(user, tweet_ids):
+    likes = Like.objects.filter(user=user, tweet_id__in=tweet_ids).values_list("tweet_id", flat=True)
+    archived = ArchivedLike.objects.filter(user=user, tweet_id__in=tweet_ids).values_list("tweet_id", flat=True)
+    return set(likes.union(archived, all=True))
+
+
+def build_cards(rows, liked):
+    return [TimelineCard(row, row[0] in liked) for row in rows]
+
+
+def page_context(request, queryset, archive=None, exclude=frozenset()):
+    before, limit = parse_page_args(request)
+    rows, next_cursor = fetch_rows(queryset, before, limit, archive, exclude)
+    liked = liked_ids(request.user, [row[0] for row in rows])
+    return {"tweet_list": build_cards(rows, liked), "next_cursor": next_cursor}
+
+
+def peek_next_cursor(queryset, archive, before, limit, exclude=frozenset()):
+    ids = [row[0] for row in read_through(queryset, archive, before, limit + 1, ("id",), exclude=exclude)]
+    return ids[limit - 1] if len(ids) > limit else None
+
+
+def iter_card_chunks(request, queryset, archive, before, limit, exclude, chunk_size):
+    rows = read_through(queryset, archive, before, limit, TIMELINE_COLUMNS, chunk_size, exclude)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield build_cards(chunk, liked_ids(request.user, [row[0] for row in chunk]))
+
+
+class StreamingTimelineMixin:
+    # TIMELINE_STREAMING が有効なら，ヘッダー部分を先に送り，カードは list_template_name で少しずつ描画して流す。
+    list_template_name = None
+
+    def get_timeline_context(self, queryset, archive=None, exclude=frozenset()):
+        if not settings.TIMELINE_STREAMING:
+            return page_context(self.request, queryset, archive, exclude)
+        before, limit = parse_page_args(self.request)
+        limit = limit or settings.TIMELINE_PAGE_SIZE
+        self.stream_args = (queryset, archive, before, limit, exclude)
+        next_cursor = peek_next_cursor(queryset, archive, before, limit, exclude)
+        return {"tweet_list": [], "streaming": True, "next_cursor": next_cursor}
+
+    def render_to_response(self, context, **response_kwargs):
+        if not getattr(self, "stream_args", None):
+            return super().render_to_response(context, **response_kwargs)
+
+        page = loader.render_to_string(self.get_template_names(), context, self.request)
+        head, tail = page.split(STREAM_MARKER, 1)
+        chunks = iter_card_chunks(self.request, *self.stream_args, settings.TIMELINE_STREAM_CHUNK_SIZE)
+        if isinstance(self.request, ASGIRequest):
+            # ASGI ではストリームがイベントループ上で消費されるため，DB アクセスはビューの中で済ませておく。
+            chunks = list(chunks)
+        list_template = loader.get_template(self.list_template_name)
+
+        def stream():
+            yield head
+            for cards in chunks:
+                yield list_template.render({"tweet_list": cards}, self.request)
+            yield tail
+
+        response_kwargs.setdefault("content_type", "text/html; charset=utf-8")
+        return StreamingHttpResponse(stream(), **response_kwargs)
+
+
+def shape(row, liked):
+    tweet_id, content, created_at, username, like_count = row
+    return {
+        "id": tweet_id,
+        "content": content,
+        "created_at": created_at.isoformat(),
+        "username": username,
+        "like_count": counters.buffer.current(tweet_id, like_count),
+        "liked": tweet_id in liked,
+    }
+
+
+def encode_page(rows, liked, next_cursor):
+    return _encoder.encode({"tweets": [shape(row, liked) for row in rows], "next": next_cursor})
+
+
+def encode_tweet(row, liked):
+    return _encoder.encode(shape(row, liked))
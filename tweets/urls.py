@@ -7,8 +7,16 @@ app_name = "tweets"
 urlpatterns = [
     path("home/", views.HomeView.as_view(), name="home"),
     path("create/", views.TweetCreateView.as_view(), name="create"),
+    path("<int:pk>/reply/", views.ReplyCreateView.as_view(), name="reply"),
     path("<int:pk>/", views.TweetDetailView.as_view(), name="detail"),
+    path("<int:pk>/likes/", views.LikedByView.as_view(), name="liked_by"),
     path("<int:pk>/delete/", views.TweetDeleteView.as_view(), name="delete"),
     path("<int:pk>/like/", views.LikeView.as_view(), name="like"),
     path("<int:pk>/unlike/", views.UnlikeView.as_view(), name="unlike"),
+    path("api/home/", views.TimelineAPIView.as_view(), name="api_home"),
+    path("api/home/updates/", views.TweetUpdatesView.as_view(), name="api_home_updates"),
+    path("api/home/updates/wait/", views.TweetUpdatesWaitView.as_view(), name="api_home_updates_wait"),
+    path("api/users/<str:username>/", views.UserTimelineAPIView.as_view(), name="api_user_timeline"),
+    path("api/<int:pk>/", views.TweetDetailAPIView.as_view(), name="api_detail"),
+    path("api/<int:pk>/thread/", views.ThreadAPIView.as_view(), name="api_thread"),
 ]
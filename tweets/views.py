@@ -1,68 +1,200 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.http import JsonResponse
+from django.core.exceptions import BadRequest, PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404
+from django.template import loader
 from django.urls import reverse, reverse_lazy
-from django.views.generic import CreateView, DeleteView, DetailView, ListView, View
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.views.generic import CreateView, DeleteView, DetailView, TemplateView, View
 
+from accounts import exclusions, stats
+from accounts.deletion import schedule_tweet_deletion
+from accounts.models import User
+from core import public
+from core.mixins import ConditionalGetMixin, make_etag
+from core.public import PublicPageMixin
+from core.ratelimit import RateLimitMixin
+
+from . import counters, thread, timeline, watermark
 from .forms import TweetCreateForm
-from .models import Like, Tweet
+from .models import MAX_REPLY_DEPTH, ArchivedTweet, Like, Tweet
 
 
-class HomeView(LoginRequiredMixin, ListView):
+class HomeView(LoginRequiredMixin, timeline.StreamingTimelineMixin, TemplateView):
     template_name = "tweets/home.html"
-    model = Tweet
+    list_template_name = "tweets/tweet_list.html"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["tweet_list"] = Tweet.objects.select_related("user").prefetch_related("likes")
-        liked_list = (
-            Like.objects.filter(user=self.request.user).select_related("tweet").values_list("tweet_id", flat=True)
-        )
-        context["liked_list"] = liked_list
+        hidden = exclusions.get(self.request.user).hidden
+        context.update(self.get_timeline_context(timeline.home_queryset(), exclude=hidden))
         return context
 
 
-class TweetCreateView(LoginRequiredMixin, CreateView):
+class TweetCreateView(RateLimitMixin, LoginRequiredMixin, CreateView):
+    ratelimit_scope = "tweet_create"
     template_name = "tweets/create.html"
     form_class = TweetCreateForm
     success_url = reverse_lazy("tweets:home")
 
     def form_valid(self, form):
         form.instance.user = self.request.user
-        return super().form_valid(form)
+        with transaction.atomic():
+            response = super().form_valid(form)
+            stats.record_tweet(self.object.user_id, self.object.created_at)
+            User.objects.touch([self.request.user.pk])
+            transaction.on_commit(watermark.invalidate)
+            public.invalidate([reverse("accounts:user_profile", kwargs={"username": self.request.user.username})])
+        return response
+
+
+class ReplyCreateView(TweetCreateView):
+    def get_parent(self):
+        if not hasattr(self, "parent"):
+            self.parent = get_object_or_404(Tweet.objects.visible(), pk=self.kwargs["pk"])
+            if self.parent.user_id in exclusions.get(self.request.user).blocked:
+                raise PermissionDenied("ブロックしているか，ブロックされているユーザーのツイートには返信できません。")
+        return self.parent
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["parent"] = self.get_parent()
+        return context
+
+    def form_valid(self, form):
+        parent = self.get_parent()
+        if thread.depth(parent.path) >= MAX_REPLY_DEPTH:
+            form.add_error(None, "これ以上深い返信はできません。")
+            return self.form_invalid(form)
+        with transaction.atomic():
+            response = super().form_valid(form)
+            thread.attach_reply(parent, self.object)
+            # 返信は祖先の詳細ページのスレッドにも載る。
+            tweet_ids = thread.ancestor_ids(self.object.path)
+            public.invalidate([reverse("tweets:detail", kwargs={"pk": tweet_id}) for tweet_id in tweet_ids])
+        return response
 
+    def get_success_url(self):
+        return reverse("tweets:detail", kwargs={"pk": self.get_parent().pk})
 
-class TweetDetailView(LoginRequiredMixin, DetailView):
+
+class TweetDetailView(PublicPageMixin, LoginRequiredMixin, ConditionalGetMixin, DetailView):
     template_name = "tweets/detail.html"
+    public_template_name = "tweets/public_detail.html"
     model = Tweet
-    queryset = model.objects.select_related("user").prefetch_related("likes")
+    context_object_name = "tweet"
+    archived = False
+
+    def get_queryset(self, model=Tweet):
+        liked = model._meta.get_field("likes").related_model.objects.filter(
+            tweet=OuterRef("pk"), user=self.request.user
+        )
+        return model.objects.visible().select_related("user").annotate(liked=Exists(liked))
+
+    def get_object(self, queryset=None):
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            # ホット側にない古いツイートはアーカイブから読む。アーカイブ済みのツイートは閲覧のみ。
+            self.archived = True
+            return super().get_object(self.get_queryset(ArchivedTweet))
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        liked_list = (
-            Like.objects.select_related("tweet").filter(user=self.request.user).values_list("tweet_id", flat=True)
-        )
-        context["liked_list"] = liked_list
+        context["archived"] = self.archived
+        self.object.like_count = counters.buffer.current(self.object.pk, self.object.like_count)
+        context.update(thread.thread_context(self.request, self.object, self.archived))
+        return context
+
+    def get_public_context_data(self):
+        tweet, archived = thread.find_tweet(self.kwargs["pk"])
+        tweet.like_count = counters.buffer.current(tweet.pk, tweet.like_count)
+        return {"tweet": tweet, "archived": archived, **thread.thread_context(self.request, tweet, archived)}
+
+    def get_version(self):
+        # いいね状態は閲覧者の activity_at で，いいね数はこのプロセスでまだ反映していない増減を足した like_count で検知する。
+        # 他のプロセスのいいねは，バッファの反映時に like_count と投稿者の activity_at が変わる。
+        for model in (Tweet, ArchivedTweet):
+            stamp = model.objects.visible().filter(pk=self.kwargs["pk"])
+            stamp = stamp.values_list("like_count", "user__activity_at", "path", "reply_count").first()
+            if stamp is not None:
+                break
+        else:
+            return None
+        like_count, author_activity_at, path, reply_count = stamp
+        like_count = counters.buffer.current(self.kwargs["pk"], like_count)
+        if path or reply_count:
+            # スレッドは他の人の返信やいいねでも変わるので，条件付き GET は単独のツイートだけにする。
+            return None
+        viewer = self.request.user
+        etag = make_etag("tweet", self.kwargs["pk"], like_count, author_activity_at, viewer.pk, viewer.activity_at)
+        return etag, max(author_activity_at, viewer.activity_at)
+
+
+class LikedByView(LoginRequiredMixin, TemplateView):
+    template_name = "tweets/liked_by.html"
+
+    def get_tweet(self):
+        for model in (Tweet, ArchivedTweet):
+            tweet = model.objects.visible().filter(pk=self.kwargs["pk"]).first()
+            if tweet is not None:
+                return tweet
+        raise Http404
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        tweet = self.get_tweet()
+        before, limit = timeline.parse_page_args(self.request)
+        hidden = exclusions.get(self.request.user).hidden
+        likers, next_cursor = timeline.fetch_likers(self.request.user, tweet.likes.all(), before, limit, hidden)
+        context.update(tweet=tweet, likers=likers, next_cursor=next_cursor)
         return context
 
 
 class TweetDeleteView(UserPassesTestMixin, DeleteView):
     template_name = "tweets/delete.html"
     model = Tweet
+    queryset = model.objects.visible()
     success_url = reverse_lazy("tweets:home")
 
+    def get_object(self, queryset=None):
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            # アーカイブ済みのツイートも投稿者は削除できる。
+            return super().get_object(ArchivedTweet.objects.visible())
+
     def test_func(self):
         return self.request.user == self.get_object().user
 
+    def form_valid(self, form):
+        schedule_tweet_deletion(self.object)
+        return HttpResponseRedirect(self.get_success_url())
+
+
+class LikeView(RateLimitMixin, LoginRequiredMixin, View):
+    ratelimit_scope = "like"
 
-class LikeView(LoginRequiredMixin, View):
     def post(self, request, *args, **kwargs):
         tweet_id = self.kwargs["pk"]
-        tweet = get_object_or_404(Tweet, id=tweet_id)
-        Like.objects.get_or_create(tweet=tweet, user=self.request.user)
+        tweet = get_object_or_404(Tweet.objects.visible(), id=tweet_id)
+        if tweet.user_id in exclusions.get(request.user).blocked:
+            raise PermissionDenied("ブロックしているか，ブロックされているユーザーのツイートにはいいねできません。")
+        with transaction.atomic():
+            _, created = Like.objects.get_or_create(tweet=tweet, user=self.request.user)
+            if created:
+                # 投稿者側の行 (いいね数・集計・activity_at・通知) への書き込みはバッファに任せる。
+                counters.buffer.record(tweet, self.request.user, 1)
+                User.objects.touch([self.request.user.pk])
         unlike_url = reverse("tweets:unlike", kwargs={"pk": tweet_id})
-        tweet = Tweet.objects.prefetch_related("likes").get(id=tweet_id)
-        like_count = tweet.likes.count()
+        like_count = Tweet.objects.values_list("like_count", flat=True).get(pk=tweet_id)
+        like_count = counters.buffer.current(tweet_id, like_count)
         is_liked = True
         context = {
             "like_count": like_count,
@@ -73,16 +205,21 @@ class LikeView(LoginRequiredMixin, View):
         return JsonResponse(context)
 
 
-class UnlikeView(LoginRequiredMixin, View):
+class UnlikeView(RateLimitMixin, LoginRequiredMixin, View):
+    ratelimit_scope = "like"
+
     def post(self, request, *args, **kwargs):
         tweet_id = self.kwargs["pk"]
-        tweet = get_object_or_404(Tweet, pk=tweet_id)
-        like = Like.objects.filter(user=self.request.user, tweet=tweet)
-        like.delete()
+        tweet = get_object_or_404(Tweet.objects.visible(), pk=tweet_id)
+        with transaction.atomic():
+            deleted, _ = Like.objects.filter(user=self.request.user, tweet=tweet).delete()
+            if deleted:
+                counters.buffer.record(tweet, self.request.user, -deleted)
+                User.objects.touch([self.request.user.pk])
         is_liked = False
         like_url = reverse("tweets:like", kwargs={"pk": tweet_id})
-        tweet = Tweet.objects.prefetch_related("likes").get(id=tweet_id)
-        like_count = tweet.likes.count()
+        like_count = Tweet.objects.values_list("like_count", flat=True).get(pk=tweet_id)
+        like_count = counters.buffer.current(tweet_id, like_count)
         context = {
             "like_count": like_count,
             "tweet_id": tweet_id,
@@ -90,3 +227,118 @@ class UnlikeView(LoginRequiredMixin, View):
             "like_url": like_url,
         }
         return JsonResponse(context)
+
+
+class TimelineAPIView(LoginRequiredMixin, View):
+    raise_exception = True
+
+    def get_queryset(self):
+        return timeline.home_queryset()
+
+    def get_archive_queryset(self):
+        return None
+
+    def get_exclude(self):
+        return exclusions.get(self.request.user).hidden
+
+    def get(self, request, *args, **kwargs):
+        before, limit = timeline.parse_page_args(request)
+        archive = self.get_archive_queryset()
+        rows, next_cursor = timeline.fetch_rows(self.get_queryset(), before, limit, archive, self.get_exclude())
+        liked = timeline.liked_ids(request.user, [row[0] for row in rows])
+        return HttpResponse(timeline.encode_page(rows, liked, next_cursor), content_type="application/json")
+
+
+class UserTimelineAPIView(TimelineAPIView):
+    def get(self, request, *args, **kwargs):
+        self.user = get_object_or_404(User, username=self.kwargs["username"], is_active=True)
+        self.blocked = self.user.pk in exclusions.get(request.user).blocked
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = timeline.user_queryset(self.user)
+        return queryset.none() if self.blocked else queryset
+
+    def get_archive_queryset(self):
+        queryset = timeline.user_archive_queryset(self.user)
+        return queryset.none() if self.blocked else queryset
+
+    def get_exclude(self):
+        # 自分から開いたプロフィールではミュートした人のツイートも表示する。
+        return frozenset()
+
+
+class TweetUpdatesView(LoginRequiredMixin, View):
+    # ?since= より新しいホームのツイートを返す。新着がなければキャッシュした最新 id だけを見て 204 / 304 を返す。
+    raise_exception = True
+
+    def get(self, request, *args, **kwargs):
+        since, fmt = timeline.parse_since_args(request)
+        return self.respond(since, fmt, watermark.latest_id())
+
+    def respond(self, since, fmt, latest):
+        etag = quote_etag(f"tweets-{latest}")
+        response = get_conditional_response(self.request, etag=etag)
+        if response is None:
+            response = HttpResponse(status=204) if latest <= since else self.render_updates(since, fmt, latest)
+        response.headers.setdefault("ETag", etag)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def render_updates(self, since, fmt, latest):
+        _, limit = timeline.parse_page_args(self.request)
+        if fmt == "count":
+            limit = timeline.MAX_PAGE_SIZE
+        hidden = exclusions.get(self.request.user).hidden
+        queryset = timeline.home_queryset().filter(id__gt=since)
+        rows, next_cursor = timeline.fetch_rows(queryset, None, limit, None, hidden)
+        # truncated なら間にまだツイートがあるので，クライアントはタイムラインを読み直す。
+        data = {"latest": latest, "truncated": next_cursor is not None}
+        if fmt == "ids":
+            data["ids"] = [row[0] for row in rows]
+        elif fmt == "count":
+            data["count"] = len(rows)
+        else:
+            cards = timeline.build_cards(rows, timeline.liked_ids(self.request.user, [row[0] for row in rows]))
+            data["html"] = loader.render_to_string("tweets/tweet_list.html", {"tweet_list": cards}, self.request)
+        return JsonResponse(data)
+
+
+class TweetUpdatesWaitView(View):
+    # ASGI では新着が来るか ?wait= 秒 (上限 TWEET_LONG_POLL_MAX_WAIT) たつまで待ってから TweetUpdatesView と同じ応答を返す。
+    # WSGI ではワーカーを塞がないよう待たずに返す。
+    async def get(self, request, *args, **kwargs):
+        since, fmt = timeline.parse_since_args(request)
+        try:
+            wait = float(request.GET.get("wait", settings.TWEET_LONG_POLL_MAX_WAIT))
+        except ValueError:
+            raise BadRequest("wait は数値で指定してください。")
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            raise PermissionDenied
+        if not isinstance(request, ASGIRequest):
+            wait = 0
+        # max() を外側にして nan も 0 に丸める。
+        latest = await watermark.waiters.wait_for(since, max(0, min(wait, settings.TWEET_LONG_POLL_MAX_WAIT)))
+        view = TweetUpdatesView()
+        view.setup(request, *args, **kwargs)
+        return await sync_to_async(view.respond)(since, fmt, latest)
+
+
+class ThreadAPIView(LoginRequiredMixin, View):
+    raise_exception = True
+
+    def get(self, request, *args, **kwargs):
+        tweet, archived = thread.find_tweet(self.kwargs["pk"])
+        context = thread.thread_context(request, tweet, archived)
+        return HttpResponse(thread.encode_thread(context), content_type="application/json")
+
+
+class TweetDetailAPIView(LoginRequiredMixin, View):
+    raise_exception = True
+
+    def get(self, request, *args, **kwargs):
+        row = timeline.home_queryset().filter(pk=self.kwargs["pk"]).values_list(*timeline.TIMELINE_COLUMNS).first()
+        if row is None:
+            raise Http404
+        liked = timeline.liked_ids(request.user, [row[0]])
+        return HttpResponse(timeline.encode_tweet(row, liked), content_type="application/json")
@@ -0,0 +1,62 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Tweet
+
+LATEST_KEY = "tweets:latest_id"
+
+_refresh = None
+
+
+def latest_id():
+    # 最新のツイート id をキャッシュに置き，新着がないポーリングは tweets テーブルを読まずに返す。
+    latest = cache.get(LATEST_KEY)
+    if latest is None:
+        latest = Tweet.objects.filter(is_deleted=False).order_by("-id").values_list("id", flat=True).first() or 0
+        cache.set(LATEST_KEY, latest, settings.TWEET_WATERMARK_TIMEOUT)
+    return latest
+
+
+def invalidate():
+    # ツイートの作成後 (コミット後) に呼ぶ。プロセスごとのキャッシュでも TWEET_WATERMARK_TIMEOUT 秒で追いつく。
+    cache.delete(LATEST_KEY)
+
+
+async def alatest_id():
+    global _refresh
+    latest = await cache.aget(LATEST_KEY)
+    if latest is not None:
+        return latest
+    # キーが切れた瞬間に待機中のリクエストがそろって DB を読まないよう，プロセス内では読み込みを 1 本にして結果を分け合う。
+    # 待っていたリクエストが切断されても読み込みは止めない。
+    loop = asyncio.get_running_loop()
+    if _refresh is None or _refresh.done() or _refresh.get_loop() is not loop:
+        _refresh = loop.create_task(sync_to_async(latest_id)())
+    return await asyncio.shield(_refresh)
+
+
+class Waiters:
+    # ロングポーリングで待機中のリクエスト数。上限を超えた分は待たずにすぐ返す。
+    def __init__(self):
+        self.count = 0
+
+    async def wait_for(self, since, timeout):
+        if timeout <= 0 or self.count >= settings.TWEET_LONG_POLL_MAX_WAITERS:
+            return await alatest_id()
+        self.count += 1
+        try:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            while True:
+                latest = await alatest_id()
+                if latest > since or loop.time() >= deadline:
+                    return latest
+                await asyncio.sleep(min(settings.TWEET_POLL_INTERVAL, max(deadline - loop.time(), 0)))
+        finally:
+            self.count -= 1
+
+
+waiters = Waiters()
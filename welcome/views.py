@@ -1,5 +1,9 @@
 from django.views.generic import TemplateView
 
+from core.public import PublicPageMixin
 
-class WelcomeView(TemplateView):
+
+class WelcomeView(PublicPageMixin, TemplateView):
+    # ログインしていない訪問者には描画済みの HTML をキャッシュから返す。
     template_name = "welcome/welcome.html"
+    public_template_name = template_name